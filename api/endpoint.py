@@ -1,18 +1,35 @@
 # ./api/endpoint.py
 import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 import uvicorn
-from openai import OpenAI
-import threading
-from credentials import oai_api_key
-from slack.event_consumer import process_question, process_feedback
+from slack.consumer_pool import EventConsumerPool
 from pydantic import BaseModel
 from vector.chroma_threads import generate_embedding
 from database.nur_database import add_or_update_embed_vector
+from vector.create_vector_db import add_to_vector
+from slack.message_scheduler import get_message_scheduler
+from threads.task_scheduler import get_task_scheduler, PRIORITY_BULK
+from context.prompt_builder import get_prompt_cache_stats
+from telemetry.latency import configure_tracing, get_latency_summary, render_prometheus_metrics
+from telemetry.structured_logging import configure_logging
 
-processor = FastAPI()
+consumer_pool = None
 
-client = OpenAI(api_key=oai_api_key)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start the long-lived event consumers with the API and stop them cleanly on shutdown."""
+    global consumer_pool
+    configure_logging()
+    configure_tracing("nur-api")
+    consumer_pool = EventConsumerPool()
+    yield
+    consumer_pool.shutdown()
+
+
+processor = FastAPI(lifespan=lifespan)
 
 
 def vectorize_document_and_store_in_db(page_id):
@@ -25,6 +42,8 @@ def vectorize_document_and_store_in_db(page_id):
     if embedding:
         # Store the embedding in the database
         add_or_update_embed_vector(page_id, embedding)
+        # Index the page with its metadata right away so filtered searches find it
+        add_to_vector("TopAssist", [page_id])
         logging.info(f"Embedding for page ID {page_id} stored in the database.")
     else:
         logging.error(f"Embedding for page ID {page_id} could not be generated. {error_message}")
@@ -52,17 +71,13 @@ class EmbedRequest(BaseModel):
 
 @processor.post("/api/v1/questions")
 def create_question(question_event: QuestionEvent):
-    thread = threading.Thread(target=process_question, args=(question_event,))
-    thread.start()
+    consumer_pool.submit_question(question_event)
     return {"message": "Question received, processing in background", "data": question_event}
 
 
 @processor.post("/api/v1/feedback")
 def create_feedback(feedback_event: FeedbackEvent):  # Changed to handle feedback
-    # Assuming you have a separate or modified process for handling feedback
-    thread = threading.Thread(target=process_feedback,
-                              args=(feedback_event,))  # You may need a different function for processing feedback
-    thread.start()
+    consumer_pool.submit_feedback(feedback_event)
     return {"message": "Feedback received, processing in background", "data": feedback_event}
 
 
@@ -71,13 +86,52 @@ def create_embeds(EmbedRequest: EmbedRequest):
     """
     Endpoint to initiate the embedding generation and storage process in the background.
     """
-    # Using threading to process the embedding generation and storage without blocking the endpoint response
+    # Embeddings are bulk work, they run on the shared scheduler behind interactive questions
     page_id = EmbedRequest.page_id
-    thread = threading.Thread(target=vectorize_document_and_store_in_db, args=(page_id,))
-    thread.start()
+    get_task_scheduler().submit(vectorize_document_and_store_in_db, page_id, priority=PRIORITY_BULK, api="openai")
     return {"message": "Embedding generation initiated, processing in background", "page_id": page_id}
 
 
+@processor.get("/api/v1/metrics/slack")
+def get_slack_metrics():
+    """
+    Endpoint exposing the outbound slack message queue depth and delivery latency.
+    """
+    return get_message_scheduler().metrics()
+
+
+@processor.get("/api/v1/metrics/tasks")
+def get_task_metrics():
+    """
+    Endpoint exposing the pending tasks per priority and the running tasks per downstream API.
+    """
+    return get_task_scheduler().metrics()
+
+
+@processor.get("/api/v1/metrics/prompt_cache")
+def get_prompt_cache_metrics():
+    """
+    Endpoint exposing the prompt tokens sent to OpenAI and the share of them served from the prompt cache.
+    """
+    return get_prompt_cache_stats()
+
+
+@processor.get("/api/v1/metrics/latency")
+def get_latency_metrics():
+    """
+    Endpoint exposing the recent latency percentiles of every stage of the question path.
+    """
+    return get_latency_summary()
+
+
+@processor.get("/metrics", response_class=PlainTextResponse)
+def get_prometheus_metrics():
+    """
+    Endpoint exposing the stage latency histograms in the Prometheus text format.
+    """
+    return PlainTextResponse(render_prometheus_metrics(), media_type="text/plain; version=0.0.4")
+
+
 def main():
     """Entry point for starting the FastAPI application."""
     uvicorn.run("api.endpoint:processor", host="localhost", port=8000, reload=True)
@@ -0,0 +1,104 @@
+# ./benchmark/corpus.py
+import hashlib
+import random
+from datetime import datetime, timedelta
+
+# Deterministic synthetic Confluence-like corpora for the benchmarks.
+# Every page is derived from its index and the seed only, so the same size always produces the same corpus,
+# and fake embeddings are derived from the text they stand for, so no embedding API is needed.
+
+CORPUS_SIZES = {"1k": 1000, "10k": 10000, "100k": 100000}
+FIRST_PAGE_ID = 100000
+
+WORDS = ("deploy service cluster database index query cache latency token request response pipeline queue "
+         "worker schedule config secret rotate backup restore alert metric dashboard incident runbook owner "
+         "release branch review merge build artifact image container network gateway proxy certificate").split()
+LANGUAGES = ("python", "bash", "yaml", "sql")
+PANELS = ("info", "note", "warning", "tip")
+
+
+def sentence(generator, word_count):
+    words = [generator.choice(WORDS) for _ in range(word_count)]
+    return " ".join(words).capitalize() + "."
+
+
+def storage_format_body(generator):
+    """A page body in the Confluence storage format with the structures found in real spaces."""
+    parts = []
+    for section in range(generator.randint(2, 5)):
+        parts.append(f"<h2>{sentence(generator, 4)}</h2>")
+        parts.append(f"<p>{' '.join(sentence(generator, generator.randint(8, 20)) for _ in range(3))}</p>")
+        block = generator.random()
+        if block < 0.3:
+            items = "".join(f"<li>{sentence(generator, 6)}</li>" for _ in range(generator.randint(3, 6)))
+            parts.append(f"<ul>{items}</ul>")
+        elif block < 0.5:
+            rows = "".join(f"<tr><td>{generator.choice(WORDS)}</td><td>{sentence(generator, 5)}</td></tr>"
+                           for _ in range(generator.randint(2, 6)))
+            parts.append(f"<table><tbody><tr><th>Name</th><th>Description</th></tr>{rows}</tbody></table>")
+        elif block < 0.7:
+            code = "\n".join(f"{generator.choice(WORDS)} = {generator.randint(0, 999)}" for _ in range(5))
+            parts.append(f'<ac:structured-macro ac:name="code"><ac:parameter ac:name="language">'
+                         f'{generator.choice(LANGUAGES)}</ac:parameter>'
+                         f'<ac:plain-text-body><![CDATA[{code}]]></ac:plain-text-body></ac:structured-macro>')
+        elif block < 0.85:
+            parts.append(f'<ac:structured-macro ac:name="{generator.choice(PANELS)}"><ac:rich-text-body>'
+                         f'<p>{sentence(generator, 12)}</p></ac:rich-text-body></ac:structured-macro>')
+    return "".join(parts)
+
+
+def generate_raw_pages(size, seed=0, space_key="BENCH"):
+    """
+    Generate pages in the form returned by fetch_raw_page.
+
+    Args:
+    size (int): The number of pages.
+    seed (int): The seed of the corpus.
+    space_key (str): The key of the space the pages belong to.
+
+    Yields:
+    dict: The raw pages, in page ID order.
+    """
+    for index in range(size):
+        yield generate_raw_page(index, seed, space_key)
+
+
+def generate_raw_page(index, seed=0, space_key="BENCH"):
+    """Generate the page of a corpus at an index, its page ID is FIRST_PAGE_ID + index."""
+    base_date = datetime(2023, 1, 1)
+    generator = random.Random(f"{seed}:{index}")
+    created_date = base_date + timedelta(minutes=generator.randint(0, 500000))
+    return {
+        'page_id': str(FIRST_PAGE_ID + index),
+        'space_key': space_key,
+        'title': sentence(generator, 5).rstrip("."),
+        'author': f"Author {generator.randint(1, 50)}",
+        'created_date': created_date.isoformat() + "Z",
+        'last_updated': (created_date + timedelta(days=generator.randint(0, 300))).isoformat() + "Z",
+        'body': storage_format_body(generator),
+        'comment_bodies': [f"<p>{sentence(generator, 10)}</p>" for _ in range(generator.randint(0, 3))],
+        'pulled_at': base_date
+    }
+
+
+def fake_embedding(text, dimension):
+    """
+    A deterministic unit vector standing for the embedding of a text.
+
+    Args:
+    text (str): The embedded text.
+    dimension (int): The dimension of the embedding.
+
+    Returns:
+    list of float: The embedding.
+    """
+    generator = random.Random(hashlib.sha256(text.encode()).digest())
+    vector = [generator.gauss(0.0, 1.0) for _ in range(dimension)]
+    norm = sum(value * value for value in vector) ** 0.5
+    return [value / norm for value in vector]
+
+
+def generate_questions(count, seed=0):
+    """Generate deterministic question texts."""
+    generator = random.Random(f"questions:{seed}")
+    return [f"How do I {sentence(generator, generator.randint(4, 9)).rstrip('.').lower()}?" for _ in range(count)]
@@ -0,0 +1,104 @@
+# ./benchmark/startup.py
+import argparse
+import importlib
+import json
+import socket
+import subprocess
+import sys
+import time
+from configuration import project_path, startup_import_budget_seconds
+
+# Startup benchmark of the entry points.
+# Every module is imported in a fresh interpreter with outgoing connections and name resolution blocked and
+# recorded, so the benchmark measures a cold import and fails on any network call made at import time.
+
+ENTRY_POINT_MODULES = ["main", "api.endpoint", "slack.channel_interaction", "vector.create_vector_db",
+                       "qa_syncup.sync_up_qa_articles_to_confluence"]
+
+
+def block_network(network_calls):
+    """Replace the socket functions that reach the network with ones recording the call and failing."""
+
+    def blocked(name, original):
+        def record_and_fail(*args, **kwargs):
+            network_calls.append(f"{name}{args[1:] if name == 'connect' else args}")
+            raise ConnectionRefusedError("Network access is blocked while importing")
+        return record_and_fail
+
+    socket.socket.connect = blocked("connect", socket.socket.connect)
+    socket.socket.connect_ex = blocked("connect", socket.socket.connect_ex)
+    socket.create_connection = blocked("create_connection", socket.create_connection)
+    socket.getaddrinfo = blocked("getaddrinfo", socket.getaddrinfo)
+
+
+def probe(module_name):
+    """Import a module with the network blocked, print the import time and the network calls as JSON."""
+    network_calls = []
+    block_network(network_calls)
+    started_at = time.perf_counter()
+    error = None
+    try:
+        importlib.import_module(module_name)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    print(json.dumps({"module": module_name, "import_seconds": time.perf_counter() - started_at,
+                      "network_calls": network_calls, "error": error}))
+
+
+def measure(module_name):
+    """
+    Import a module in a fresh interpreter.
+
+    Args:
+    module_name (str): The module to import.
+
+    Returns:
+    dict: The import time in seconds, the network calls attempted and the import error, if any.
+    """
+    completed = subprocess.run([sys.executable, "-m", "benchmark.startup", "--probe", module_name],
+                               cwd=project_path, capture_output=True, text=True)
+    for line in reversed(completed.stdout.splitlines()):
+        if line.startswith("{"):
+            return json.loads(line)
+    return {"module": module_name, "import_seconds": None, "network_calls": [],
+            "error": completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "No result"}
+
+
+def run_startup_benchmark(modules=None, budget_seconds=startup_import_budget_seconds):
+    """
+    Measure the import of the entry points and check it against the budget.
+
+    Args:
+    modules (list): The modules to import, the entry points by default.
+    budget_seconds (float): The maximum import time of a module.
+
+    Returns:
+    bool: True if every module imported within the budget without any network call.
+    """
+    passed = True
+    for module_name in modules or ENTRY_POINT_MODULES:
+        result = measure(module_name)
+        failures = []
+        if result["error"]:
+            failures.append(f"import failed: {result['error']}")
+        elif result["import_seconds"] > budget_seconds:
+            failures.append(f"over the {budget_seconds:.1f}s budget")
+        if result["network_calls"]:
+            failures.append(f"{len(result['network_calls'])} network calls: {result['network_calls'][:3]}")
+        seconds = f"{result['import_seconds']:.2f}s" if result["import_seconds"] is not None else "-"
+        print(f"{'FAIL' if failures else 'ok  '} {module_name:<45} {seconds:>8}  {'; '.join(failures)}")
+        passed = passed and not failures
+    return passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the import time of the entry points.")
+    parser.add_argument("--probe", help=argparse.SUPPRESS)
+    parser.add_argument("--budget", type=float, default=startup_import_budget_seconds,
+                        help="Maximum import time of a module in seconds.")
+    parser.add_argument("modules", nargs="*", help="Modules to import, the entry points by default.")
+    arguments = parser.parse_args()
+    if arguments.probe:
+        probe(arguments.probe)
+    else:
+        sys.exit(0 if run_startup_benchmark(arguments.modules, arguments.budget) else 1)
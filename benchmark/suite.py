@@ -0,0 +1,316 @@
+# ./benchmark/suite.py
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from sqlalchemy import create_engine, bindparam
+from configuration import benchmark_baseline_path, benchmark_regression_threshold, benchmark_embedding_dimension
+from configuration import benchmark_query_count, benchmark_repeat_count, ingest_write_batch_size, page_storage
+from benchmark.corpus import CORPUS_SIZES, generate_raw_pages, generate_questions, fake_embedding
+from confluence_integration.page_formatter import build_page_record
+from context.prepare_context import format_pages_as_context
+from context.prompt_builder import format_pages_for_prompt
+import database.nur_database as nur_database
+from database.nur_database import PageData, store_pages_data, get_all_page_data_from_db
+import file_system.page_store as page_store_module
+from file_system.page_store import PageStore
+from network.service_registry import service_registry
+from vector.chroma_threads import retrieve_relevant_documents
+
+# Benchmarks of retrieval, context building and ingest on synthetic corpora, without any network access.
+# The database, page store and vector store are redirected to a scratch directory, the embeddings are fake.
+# Baselines are machine specific: record them with --record on the machine the suite is compared on.
+
+PAGES_PER_QUERY = 10
+
+
+class BenchmarkEnvironment:
+    """
+    A synthetic corpus and the scratch storage the benchmarks run against, built lazily.
+    """
+
+    def __init__(self, size_name, directory, seed=0, dimension=benchmark_embedding_dimension,
+                 query_count=benchmark_query_count):
+        self.size_name = size_name
+        self.size = CORPUS_SIZES[size_name]
+        self.directory = directory
+        self.seed = seed
+        self.dimension = dimension
+        self.query_count = query_count
+        self.database_count = 0
+        self._raw_pages = None
+        self._records = None
+        self.stored = set()  # Names of the storages already holding the corpus
+
+    @property
+    def raw_pages(self):
+        if self._raw_pages is None:
+            self._raw_pages = list(generate_raw_pages(self.size, self.seed))
+        return self._raw_pages
+
+    @property
+    def records(self):
+        if self._records is None:
+            self._records = [build_page_record(raw_page) for raw_page in self.raw_pages]
+        return self._records
+
+    @property
+    def page_ids(self):
+        return [page_data['pageId'] for page_data, _ in self.records]
+
+    def redirect_storage(self):
+        """Point the page store and the vector store of this process to the scratch directory."""
+        page_store_module.page_store = PageStore(os.path.join(self.directory, "page_store"))
+        vector_path = os.path.join(self.directory, "vector")
+        import chromadb
+        service_registry.register("chroma", lambda: chromadb.PersistentClient(path=vector_path))
+        self.new_database()
+
+    def new_database(self):
+        """Point the database sessions to a new empty scratch database."""
+        self.database_count += 1
+        engine = create_engine('sqlite:///' + os.path.join(self.directory, f"benchmark_{self.database_count}.db"))
+        nur_database.Base.metadata.create_all(engine)
+        nur_database.Session.configure(bind=engine)
+        nur_database.session = nur_database.Session()
+        self.stored.discard("database")
+
+    def pages_data(self):
+        return {page_data['pageId']: page_data for page_data, _ in self.records}
+
+    def ensure_database(self, with_embeddings=False):
+        if "database" not in self.stored:
+            store_pages_data("BENCH", self.pages_data())
+            self.stored.add("database")
+        if with_embeddings and "embeddings" not in self.stored:
+            table = PageData.__table__
+            session = nur_database.Session()
+            session.execute(table.update().where(table.c.page_id == bindparam("embedded_page_id"))
+                            .values(embed=bindparam("embedding")),
+                            [{"embedded_page_id": page_data['pageId'],
+                              "embedding": json.dumps(fake_embedding(formatted, self.dimension))}
+                             for page_data, formatted in self.records])
+            session.commit()
+            session.close()
+            self.stored.add("embeddings")
+
+    def ensure_page_store(self):
+        if "page_store" not in self.stored:
+            store = page_store_module.page_store
+            for start in range(0, len(self.records), 1000):
+                store.write_batch({f"{page_data['pageId']}.txt": formatted
+                                   for page_data, formatted in self.records[start:start + 1000]})
+            self.stored.add("page_store")
+
+    def ensure_vector_store(self):
+        if "vector" not in self.stored:
+            collection = service_registry.get("chroma").get_or_create_collection(
+                "TopAssist", metadata={"hnsw:space": "cosine"})
+            for start in range(0, len(self.records), 5000):
+                batch = self.records[start:start + 5000]
+                collection.add(ids=[page_data['pageId'] for page_data, _ in batch],
+                               embeddings=[fake_embedding(formatted, self.dimension) for _, formatted in batch])
+            self.stored.add("vector")
+
+    def query_page_ids(self):
+        """The page IDs retrieved by every benchmark query, most relevant first."""
+        generator = random.Random(f"retrieved:{self.seed}")
+        return [generator.sample(self.page_ids, min(PAGES_PER_QUERY, self.size)) for _ in range(self.query_count)]
+
+
+def benchmark_ingest_parse(environment):
+    raw_pages = environment.raw_pages
+
+    def run():
+        for raw_page in raw_pages:
+            build_page_record(raw_page)
+    return run, len(raw_pages)
+
+
+def benchmark_ingest_write(environment):
+    records = environment.records
+    runs = iter(range(1000))
+
+    def run():
+        store = PageStore(os.path.join(environment.directory, f"ingest_write_{next(runs)}"))
+        for start in range(0, len(records), ingest_write_batch_size):
+            store.write_batch({f"{page_data['pageId']}.txt": formatted
+                               for page_data, formatted in records[start:start + ingest_write_batch_size]})
+    return run, len(records)
+
+
+def benchmark_store_pages_data(environment):
+    pages_data = environment.pages_data()
+
+    def run():
+        environment.new_database()
+        store_pages_data("BENCH", pages_data)
+        environment.stored.add("database")
+    return run, len(pages_data)
+
+
+def benchmark_embedding_deserialization(environment):
+    environment.ensure_database(with_embeddings=True)
+
+    def run():
+        _, _, embeddings = get_all_page_data_from_db()
+        for embed in embeddings:
+            json.loads(embed)
+    return run, environment.size
+
+
+def benchmark_context_build(environment):
+    environment.ensure_page_store()
+    queries = environment.query_page_ids()
+
+    def run():
+        for page_ids in queries:
+            format_pages_as_context(page_ids)
+    return run, len(queries)
+
+
+def benchmark_prompt_context_build(environment):
+    environment.ensure_page_store()
+    queries = environment.query_page_ids()
+
+    def run():
+        for page_ids in queries:
+            format_pages_for_prompt(page_ids)
+    return run, len(queries)
+
+
+def benchmark_vector_query(environment):
+    environment.ensure_vector_store()
+    questions = generate_questions(environment.query_count, environment.seed)
+    embeddings = [fake_embedding(question, environment.dimension) for question in questions]
+
+    def run():
+        for question, embedding in zip(questions, embeddings):
+            retrieve_relevant_documents(question, query_embedding=embedding)
+    return run, len(questions)
+
+
+BENCHMARKS = {
+    "ingest_parse": benchmark_ingest_parse,
+    "ingest_write": benchmark_ingest_write,
+    "store_pages_data": benchmark_store_pages_data,
+    "embedding_deserialization": benchmark_embedding_deserialization,
+    "context_build": benchmark_context_build,
+    "prompt_context_build": benchmark_prompt_context_build,
+    "vector_query": benchmark_vector_query,
+}
+
+
+def run_benchmark(name, environment, repeat=benchmark_repeat_count):
+    """
+    Run a benchmark several times.
+
+    Returns:
+    dict: The median and minimum time of a run in seconds, the items handled per run and the median throughput.
+    """
+    run, item_count = BENCHMARKS[name](environment)
+    durations = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        run()
+        durations.append(time.perf_counter() - started_at)
+    median_seconds = statistics.median(durations)
+    return {"median_seconds": median_seconds, "min_seconds": min(durations), "items": item_count,
+            "items_per_second": item_count / median_seconds if median_seconds else None}
+
+
+def baseline_file(size_name):
+    return os.path.join(benchmark_baseline_path, f"{size_name}.json")
+
+
+def load_baseline(size_name):
+    try:
+        with open(baseline_file(size_name)) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def record_baseline(size_name, results):
+    """Merge results into the baseline of a corpus size."""
+    baseline = load_baseline(size_name)
+    baseline.update(results)
+    os.makedirs(benchmark_baseline_path, exist_ok=True)
+    with open(baseline_file(size_name), 'w') as file:
+        json.dump(baseline, file, indent=2, sort_keys=True)
+
+
+def find_regressions(results, baseline, threshold=benchmark_regression_threshold):
+    """
+    Compare results to a baseline.
+
+    Returns:
+    dict: The ratio of the median time to the baseline median of every benchmark slower than the threshold allows.
+    """
+    regressions = {}
+    for name, result in results.items():
+        if name in baseline and baseline[name]["median_seconds"]:
+            ratio = result["median_seconds"] / baseline[name]["median_seconds"]
+            if ratio > 1 + threshold:
+                regressions[name] = ratio
+    return regressions
+
+
+def run_suite(size_name="1k", names=None, repeat=benchmark_repeat_count, record=False,
+              threshold=benchmark_regression_threshold):
+    """
+    Run the benchmarks on a corpus and compare them to its baseline, or record them as the baseline.
+
+    Args:
+    size_name (str): The corpus size, one of CORPUS_SIZES.
+    names (list): The benchmarks to run, all of them by default.
+    repeat (int): The number of runs of every benchmark.
+    record (bool): Record the results as the baseline instead of comparing them.
+    threshold (float): The share by which a median time may exceed its baseline.
+
+    Returns:
+    bool: True if no benchmark regressed.
+    """
+    if page_storage != "packed":
+        logging.warning("The context benchmarks read pages from the packed page store")
+    baseline = load_baseline(size_name)
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="nur-benchmark-") as directory:
+        environment = BenchmarkEnvironment(size_name, directory)
+        environment.redirect_storage()
+        for name in names or BENCHMARKS:
+            results[name] = run_benchmark(name, environment, repeat)
+            previous = baseline.get(name)
+            change = f"{results[name]['median_seconds'] / previous['median_seconds'] - 1:+.0%}" \
+                if previous and previous["median_seconds"] else "no baseline"
+            print(f"{name:<28} {results[name]['median_seconds']:>9.4f}s  "
+                  f"{results[name]['items_per_second'] or 0:>12.1f} items/s  {change}")
+    if record:
+        record_baseline(size_name, results)
+        print(f"Baseline recorded in {baseline_file(size_name)}")
+        return True
+    regressions = find_regressions(results, baseline, threshold)
+    for name, ratio in regressions.items():
+        print(f"REGRESSION {name}: {ratio:.2f}x the baseline, over the {threshold:.0%} threshold")
+    return not regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the benchmarks on a synthetic corpus.")
+    parser.add_argument("--size", choices=CORPUS_SIZES, default="1k", help="The corpus size.")
+    parser.add_argument("--repeat", type=int, default=benchmark_repeat_count, help="Runs of every benchmark.")
+    parser.add_argument("--record", action="store_true", help="Record the results as the baseline.")
+    parser.add_argument("--threshold", type=float, default=benchmark_regression_threshold,
+                        help="Share by which a median time may exceed its baseline.")
+    parser.add_argument("benchmarks", nargs="*", help=f"Benchmarks to run, all by default: {', '.join(BENCHMARKS)}.")
+    arguments = parser.parse_args()
+    unknown_benchmarks = [name for name in arguments.benchmarks if name not in BENCHMARKS]
+    if unknown_benchmarks:
+        parser.error(f"unknown benchmarks {', '.join(unknown_benchmarks)}, choose from {', '.join(BENCHMARKS)}")
+    sys.exit(0 if run_suite(arguments.size, arguments.benchmarks, arguments.repeat, arguments.record,
+                            arguments.threshold) else 1)
@@ -20,26 +20,28 @@ logging.basicConfig(level=logging.INFO)
 project_path = get_project_root()
 logging.log(logging.DEBUG, f"Project path: {project_path}")
 
-# build file_system_path and database_path from project_path
-file_system_path = project_path + "/content/file_system"
-database_path = project_path + "/content/database"
+# all the data lives under content_path, NUR_CONTENT_PATH points a process to another data directory
+content_path = os.environ.get("NUR_CONTENT_PATH", project_path + "/content")
+# build file_system_path and database_path from content_path
+file_system_path = content_path + "/file_system"
+database_path = content_path + "/database"
 vector_folder_path = database_path + "/confluence_page_vectors"
 vector_chunk_folder_path = database_path + "/confluence_page_vectors"
 sql_file_path = database_path + "/confluence_pages_sql.db"
 
 # paths for queues
 # queue for extracting ans storing page content from Confluence
-persist_page_processing_queue_path = os.path.join(project_path, "content", "transactional", "confluence_page_processing_queue")
+persist_page_processing_queue_path = os.path.join(content_path, "transactional", "confluence_page_processing_queue")
 # queue for creating page vectors and storing them in chroma db
-persist_page_vector_queue_path = os.path.join(project_path, "content", "transactional", "confluence_page_vector_queue")
+persist_page_vector_queue_path = os.path.join(content_path, "transactional", "confluence_page_vector_queue")
 # queue for slack messages
-persist_message_queue_path = os.path.join(project_path, "content", "transactional", "slack_message_queue")
+persist_message_queue_path = os.path.join(content_path, "transactional", "slack_message_queue")
 # queue for slack questions
-persist_question_queue_path = os.path.join(project_path, "content", "transactional", "slack_question_queue")
+persist_question_queue_path = os.path.join(content_path, "transactional", "slack_question_queue")
 # queue for slack reactions
-persist_feedback_queue_path = os.path.join(project_path, "content", "transactional", "slack_feedback_queue")
+persist_feedback_queue_path = os.path.join(content_path, "transactional", "slack_feedback_queue")
 # queue for qna documents
-persist_qna_document_queue_path = os.path.join(project_path, "content", "transactional", "qna_document_queue")
+persist_qna_document_queue_path = os.path.join(content_path, "transactional", "qna_document_queue")
 
 
 
@@ -59,4 +61,180 @@ embedding_model_id_ada = "text-embedding-ada-002"
 embedding_model_id = embedding_model_id_latest_small
 
 # document count is recommended from 3 to 15 where 3 is minimum cost and 15 is maximum comprehensive answer
+# it is the most documents a question gets, fewer are used when the scores of the retrieved documents allow it
 document_count = 10
+# Adaptive document count: at least document_count_min documents are kept, the next ones only while their cosine
+# similarity to the question is at least document_similarity_cutoff and not more than document_score_gap below
+# the previous document, and while the pages fit in document_token_budget tokens
+document_count_min = 2
+document_similarity_cutoff = 0.25
+document_score_gap = 0.08
+document_token_budget = 7500
+
+# Metadata filters of retrieval: Slack channel ID -> keys of the Confluence spaces its questions are answered from,
+# channels that are not listed search every space
+slack_channel_space_keys = {}
+# added to the similarity of a page, halved every retrieval_recency_half_life_days since the page was last updated
+retrieval_recency_boost = 0.02
+retrieval_recency_half_life_days = 180
+
+# Rerank: rerank_candidate_count candidates are retrieved from the vector store and reordered by how well the pages
+# match the question, then the best are selected as above. Set rerank_enabled to False to bypass the stage
+rerank_enabled = True
+rerank_candidate_count = 50
+# weight of the rerank score in the final score of a document, the rest is its vector similarity
+rerank_weight = 0.3
+# selection thresholds replacing document_similarity_cutoff and document_score_gap on the blended scores of
+# reranked documents: a page at the similarity cutoff that does not match the question at all scores
+# (1 - rerank_weight) * document_similarity_cutoff, and rerank scores spread the blended scores out
+rerank_score_cutoff = 0.175
+rerank_score_gap = 0.1
+# time the rerank may take per question, candidates not reached by then are scored as if they matched nothing
+rerank_latency_budget_seconds = 0.15
+# local cross-encoder used instead of the lexical features when sentence-transformers is installed,
+# e.g. "cross-encoder/ms-marco-MiniLM-L-6-v2", None for the lexical features
+rerank_cross_encoder_model = None
+# number of pages whose term counts are kept in memory
+rerank_feature_cache_size = 5000
+# characters of a page scored by the cross-encoder
+rerank_max_chars = 2000
+
+# Answer cache: near-duplicate questions are answered from a previous answer when its source pages are unchanged
+answer_cache_enabled = True
+answer_cache_collection_name = "QAAnswerCache"
+# cosine similarity (0 to 1) a past question must reach to be considered the same question
+answer_cache_similarity_threshold = 0.95
+# maximum age of a cached answer in days, updates to the source pages invalidate it earlier
+answer_cache_ttl_days = 30
+
+# Related questions: previously answered questions similar to a new one are blended into its context
+qa_interaction_collection_name = "QAInteractions"
+related_interaction_count = 3
+# cosine similarity (0 to 1) a past interaction must reach to be included in the context
+related_interaction_min_similarity = 0.8
+
+# Slack message store: recent messages are kept in memory, all of them in the database until they expire
+slack_message_cache_size = 10000
+slack_message_ttl_days = 90
+
+# Slack bot: number of worker processes handling events, 0 handles them on the socket mode listener threads
+slack_event_worker_count = 4
+# maximum number of pending events per worker process
+slack_event_queue_size = 1000
+slack_metrics_log_interval_seconds = 60
+
+# Slack output: messages to one channel are sent at most once per interval, rate limited sends are retried
+slack_channel_min_interval_seconds = 1.0
+slack_sender_thread_count = 4
+slack_send_max_attempts = 5
+
+# Slack event transport from the bot to the event consumers
+# "http" posts events to the API at slack_event_api_url, "in_process" consumes them in the bot process.
+# "in_process" requires slack_event_worker_count = 0: every worker process would run its own consumers, API
+# concurrency limits and Slack channel pacing, multiplying the load on OpenAI and Slack by the worker count
+slack_event_transport = "http"
+slack_event_api_url = "http://localhost:8000/api/v1"
+# long-lived consumer threads answering events, in the API or in the bot process with the "in_process" transport,
+# and the maximum number of pending events per consumer
+event_consumer_count = 4
+event_consumer_queue_size = 100
+
+# Task scheduler shared by interactive questions and bulk jobs
+task_scheduler_worker_count = 16
+# maximum number of threads running bulk tasks (embedding, sync) so interactive questions always find a free one
+task_scheduler_bulk_worker_limit = 8
+# maximum number of concurrent tasks calling each downstream API
+api_concurrency_limits = {"openai": 8, "confluence": 4}
+# seconds an interactive question may wait for and run on the scheduler before it is given up
+interactive_task_timeout_seconds = 300
+
+# Answer engine: "chat" answers with one chat completion call and keeps the conversation in our database,
+# "assistant" uses the OpenAI Assistants threads and runs
+answer_engine = "chat"
+# maximum number of previous turns of a Slack thread replayed with a follow-up question
+conversation_max_turns = 10
+chat_max_tokens = 4095
+
+# Assistant tool calls: calls of one run step are executed concurrently and submitted together
+tool_call_worker_count = 8
+tool_call_timeout_seconds = 60
+# recent tool outputs are reused for calls with the same function and arguments
+tool_result_cache_size = 256
+tool_result_cache_ttl_seconds = 600
+
+# Page contents: "packed" keeps them in one memory-mapped page store file, "files" in one text file per page
+page_storage = "packed"
+page_store_path = content_path + "/page_store"
+
+# Compression of stored page text, zstd when installed with the dictionaries trained on our pages, zlib otherwise
+compression_dictionary_path = content_path + "/compression"
+compression_level = 3
+# a zstd dictionary is trained when the page store is compacted with at least this many pages and none exists yet,
+# on a sample of at most compression_dictionary_sample_count pages
+compression_dictionary_min_pages = 1000
+compression_dictionary_sample_count = 2000
+# texts shorter than this many bytes are stored uncompressed
+compression_min_size = 256
+page_store_compression = True
+# number of recently read pages kept decompressed in memory for context building
+page_store_decompressed_cache_size = 256
+
+# Page ingest pipeline: fetch threads, a pool of parsing processes and a batched writer connected by bounded queues
+ingest_fetch_thread_count = 8
+ingest_parse_worker_count = os.cpu_count() or 1
+# maximum number of pages waiting between two stages, a full queue blocks the stage feeding it
+ingest_queue_size = 64
+ingest_write_batch_size = 50
+ingest_stats_log_interval_seconds = 30
+
+# Startup benchmark: the entry points must import within this time without contacting any service
+startup_import_budget_seconds = 5.0
+
+# Q&A sync to Confluence: uploads run on the task scheduler under the "confluence" API limit
+qa_sync_space_name = "Nur documentation QnA"
+# minimum time between two Confluence requests of the sync, across all upload threads
+qa_sync_min_interval_seconds = 0.2
+qa_sync_max_in_flight = 16
+qa_sync_state_batch_size = 50
+
+# Cached directory of the Confluence spaces, reloaded when older than the TTL
+space_directory_ttl_seconds = 600
+space_directory_page_size = 250
+
+# Latency telemetry of the question path, exported on the API /metrics endpoint
+# upper bounds in seconds of the latency histogram buckets
+telemetry_latency_buckets = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+# number of recent observations per stage the percentiles are computed from
+telemetry_percentile_window = 1000
+# OpenTelemetry spans are written there as JSON when the opentelemetry sdk is installed, None to disable
+telemetry_trace_export_path = os.path.join(content_path, "telemetry", "traces.jsonl")
+
+# Benchmark suite: one JSON baseline per corpus size, a benchmark fails when its median time exceeds
+# its baseline by more than the threshold share
+benchmark_baseline_path = os.path.join(project_path, "benchmark", "baselines")
+benchmark_regression_threshold = 0.25
+benchmark_embedding_dimension = 256
+benchmark_query_count = 200
+benchmark_repeat_count = 3
+
+# Base URLs of the external services, None for the real ones. The load test points them at its fake servers
+openai_base_url = os.environ.get("NUR_OPENAI_BASE_URL")
+confluence_base_url = os.environ.get("NUR_CONFLUENCE_BASE_URL")
+slack_api_base_url = os.environ.get("NUR_SLACK_API_BASE_URL")
+
+# Load test: behaviour of the fake services, latencies in seconds
+loadtest_openai_latency_seconds = {"embeddings": 0.05, "chat": 1.5, "run": 3.0, "default": 0.05}
+loadtest_confluence_latency_seconds = 0.1
+loadtest_slack_latency_seconds = 0.05
+# share of requests answered with a server error, and with a rate limit response
+loadtest_error_rate = 0.01
+loadtest_rate_limit_rate = 0.02
+loadtest_retry_after_seconds = 1
+
+# Logging: records are written by a background thread from a queue of at most log_queue_size records,
+# every logged field is capped at log_field_max_chars characters
+log_level = os.environ.get("NUR_LOG_LEVEL", "INFO")
+log_queue_size = 10000
+log_field_max_chars = 500
+# share of the events whose payloads (questions, answers, contexts) are logged at debug level
+log_payload_sample_rate = 0.01
@@ -1,5 +1,5 @@
-from atlassian import Confluence
-from credentials import confluence_credentials
+from network.service_registry import get_confluence
+from confluence_integration.space_directory import get_space_directory
 import logging
 import time
 from bs4 import BeautifulSoup
@@ -31,11 +31,7 @@ class ConfluenceClient:
         """
         Initialize the Confluence client.
         """
-        self.confluence = Confluence(
-            url=confluence_credentials['base_url'],
-            username=confluence_credentials['username'],
-            password=confluence_credentials['api_token']
-        )
+        self.confluence = get_confluence()
 
     def page_exists(self, space_key, title):
         """Check if a page with the given title exists in the given space."""
@@ -46,7 +42,7 @@ class ConfluenceClient:
         try:
             return self.confluence.get_page_id(space_key, title)
         except Exception as e:
-            print(f"Error retrieving page ID for {title}: {e}")
+            logging.error(f"Error retrieving page ID for {title}: {e}")
             return None
 
     def validate_and_coerce_xhtml(self, content):
@@ -88,9 +84,9 @@ class ConfluenceClient:
             # Handle the error as per your policy, e.g., re-raise, return None, or provide default content
             raise
 
-    def update_page(self, page_id, title, content):
-        """Update an existing page with new content."""
-        clean_content = self.validate_and_coerce_xhtml(content)  # Validate and clean the content
+    def update_page(self, page_id, title, content, validated=False):
+        """Update an existing page with new content, validated tells the content was already cleaned."""
+        clean_content = content if validated else self.validate_and_coerce_xhtml(content)
         return self.confluence.update_page(page_id=page_id, title=title, body=clean_content)
 
     def retrieve_confluence_pages(self, space_key, limit=50):
@@ -122,30 +118,15 @@ class ConfluenceClient:
 
     def retrieve_space_list(self):
         """
-        Retrieve a complete list of available spaces in Confluence using pagination.
+        Retrieve a complete list of available spaces in Confluence from the shared space directory.
 
         Returns:
-        list: A comprehensive list of space data objects.
+        list: A comprehensive list of spaces, each with its key and name.
         """
-        all_spaces = []
-        start = 0
-        limit = 50  # Set a reasonable default limit for each API request
-
-        while True:
-            response = self.confluence.get_all_spaces(start=start, limit=limit,
-                                                      expand='description.plain,body.view,value')
-            spaces = response.get('results', [])
-            if not spaces:
-                break  # Exit loop if no more spaces are returned
-
-            all_spaces.extend(spaces)
-            start += len(spaces)  # Increment start for the next page
-
-        return all_spaces
+        return get_space_directory().list_spaces()
 
     def space_exists_by_name(self, space_name):
-        all_spaces = self.retrieve_space_list()
-        return any(space['name'] == space_name for space in all_spaces)
+        return get_space_directory().get_key(space_name) is not None
 
     def create_space_if_not_found(self, space_name, space_key=None):
         """
@@ -157,23 +138,22 @@ class ConfluenceClient:
             str: The key of the existing or newly created space.
         """
         try:
-            # Check if the space exists by name
-            if self.space_exists_by_name(space_name):
-                # If the space exists, return its key
-                for space in self.retrieve_space_list():
-                    if space['name'] == space_name:
-                        return space['key']
-            else:
-                # If the space doesn't exist, create a new one
-                if space_key is None:
-                    space_key = self.generate_space_key(space_name)
-                print(f"Creating space with key: {space_key}, abd name: {space_name}")
-                self.confluence.create_space(space_key=space_key, space_name=space_name)
-                return space_key
+            # Check if the space exists by name, reloading the directory before concluding it does not
+            space_directory = get_space_directory()
+            existing_key = space_directory.get_key(space_name, refresh_on_miss=True)
+            if existing_key:
+                return existing_key
+            # If the space doesn't exist, create a new one
+            if space_key is None:
+                space_key = self.generate_space_key(space_name)
+            logging.info(f"Creating space with key: {space_key}, and name: {space_name}")
+            self.confluence.create_space(space_key=space_key, space_name=space_name)
+            space_directory.add(space_key, space_name)
+            return space_key
         except Exception as e:
             logging.error("Error creating space: %s", e, exc_info=True)
 
-    def create_page(self, space_key, title, content, parent_id=None):
+    def create_page(self, space_key, title, content, parent_id=None, validated=False):
         """
         Create a new page in the specified Confluence space.
 
@@ -182,12 +162,16 @@ class ConfluenceClient:
             title (str): The title of the new page.
             content (str): The content of the new page.
             parent_id (int): The ID of the parent page under which the new page will be created (optional).
+            validated (bool): The title and content were already cleaned with validate_and_coerce_xhtml.
 
         Returns:
             dict: Response from the Confluence API.
         """
-        clean_content = self.validate_and_coerce_xhtml(content)  # Validate and clean the content
-        clean_title = self.validate_and_coerce_xhtml(title)
+        if validated:
+            clean_content, clean_title = content, title
+        else:
+            clean_content = self.validate_and_coerce_xhtml(content)  # Validate and clean the content
+            clean_title = self.validate_and_coerce_xhtml(title)
         return self.confluence.create_page(
             space=space_key,
             title=clean_title,
@@ -229,6 +213,3 @@ class ConfluenceClient:
         """
         # Implementation goes here
 
-
-conf_client = ConfluenceClient()
-conf_client.create_space_if_not_found(space_name="Nur documentation QnA")
\ No newline at end of file
@@ -1,11 +1,7 @@
 # ./confluence_integration/extract_page_content_and_store_processor.py
 import os
 import requests
-from persistqueue import Queue
-from file_system.file_manager import FileManager
-from database.nur_database import store_pages_data, is_page_processed, get_last_updated_timestamp
-from confluence_integration.retrieve_space import process_page
-from configuration import persist_page_processing_queue_path, persist_page_vector_queue_path
+from persistqueue import Queue, Empty
 from database.nur_database import get_page_ids_missing_embeds
 import time
 import logging
@@ -38,12 +34,13 @@ class QueueManager:
 
     def dequeue_page(self):
         """
-        Dequeues a page for processing.
-        :return:
+        Dequeues a page for processing, safe to call from several threads.
+        :return: The page ID, or None when the queue is empty.
         """
-        if not self.page_queue.empty():
-            return self.page_queue.get()
-        return None
+        try:
+            return self.page_queue.get(block=False)
+        except Empty:
+            return None
 
     def task_done(self):
         """
@@ -60,34 +57,6 @@ class QueueManager:
         return self.page_queue.qsize()
 
 
-class PageProcessor:
-    """
-    Processes the pages.
-    """
-
-    def __init__(self, file_manager, space_key):
-        """
-        Initializes the page processor.
-        :param file_manager:
-        :param space_key:
-        """
-        self.file_manager = file_manager
-        self.space_key = space_key
-
-    def process_page(self, page_id, page_content_map):
-        """
-        Processes the page.
-        :param page_id:
-        :param page_content_map:
-        :return:
-        """
-        last_updated_in_db = get_last_updated_timestamp(page_id)
-        if last_updated_in_db and not is_page_processed(page_id, last_updated_in_db):
-            process_page(page_id, self.space_key, self.file_manager, page_content_map)
-        elif not last_updated_in_db:
-            process_page(page_id, self.space_key, self.file_manager, page_content_map)
-
-
 def sumit_embedding_creation_request(page_id):
     endpoint_url = "http://localhost:8000/api/v1/embeds"
     headers = {"Content-Type": "application/json"}
@@ -105,25 +74,13 @@ def sumit_embedding_creation_request(page_id):
 
 def get_page_content_using_queue(space_key):
     logging.info(f"Starting to process pages for space key: {space_key}")
-    process_page_queue = QueueManager(persist_page_processing_queue_path, space_key)
-    vectorization_queue = QueueManager(persist_page_vector_queue_path, space_key)
-    file_manager = FileManager()
-    page_content_map = {}
-    page_processor = PageProcessor(file_manager, space_key)
-
-    while (page_id := process_page_queue.dequeue_page()) is not None:
-        logging.info(f"Processing page with ID {page_id}...")
-        page_processor.process_page(page_id, page_content_map)
-        vectorization_queue.enqueue_page(page_id)
-
-        process_page_queue.task_done()
-        logging.info(f"Page with ID {page_id} processing complete, added for vectorization.")
-    # iterate through the page_content_map and call the embed api the IDs list
-    page_ids = [page_id for page_id in page_content_map.keys()]
+    # Imported here since the pipeline uses the QueueManager of this module
+    from confluence_integration.ingest_pipeline import PageIngestPipeline
+    page_ids = PageIngestPipeline(space_key).run()
+    # The pages are stored by the pipeline, so the embeds can be created from them
     for page_id in page_ids:
         sumit_embedding_creation_request(page_id)
     logging.info(f"Page content for space key {space_key} processing complete.")
-    store_pages_data(space_key, page_content_map)
 
 
 def embed_pages_missing_embeds(retry_limit: int = 3, wait_time: int = 30) -> None:
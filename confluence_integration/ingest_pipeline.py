@@ -0,0 +1,247 @@
+# ./confluence_integration/ingest_pipeline.py
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from configuration import persist_page_processing_queue_path, persist_page_vector_queue_path
+from configuration import ingest_fetch_thread_count, ingest_parse_worker_count, ingest_queue_size
+from configuration import ingest_write_batch_size, ingest_stats_log_interval_seconds
+from confluence_integration.page_formatter import timed_build_page_record
+from confluence_integration.retrieve_space import fetch_raw_page, is_transient_error
+from database.nur_database import store_pages_data, mark_pages_as_processed
+from database.nur_database import get_last_updated_timestamp, is_page_processed
+from file_system.file_manager import FileManager
+
+
+class StageStats:
+    """Counts the items handled by a pipeline stage and the time spent handling them"""
+
+    def __init__(self, name, worker_count):
+        self.name = name
+        self.worker_count = worker_count
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.started_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def record(self, seconds, items=1):
+        with self.lock:
+            self.items += items
+            self.busy_seconds += seconds
+
+    def summary(self):
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        with self.lock:
+            return (f"{self.name}: {self.items} pages, {self.items / elapsed:.2f} pages/s, "
+                    f"utilization {self.busy_seconds / (elapsed * self.worker_count):.0%}")
+
+
+class PageIngestPipeline:
+    """
+    Imports the pages queued for a space in three stages connected by bounded queues.
+
+    Fetch threads retrieve pages and their comments from Confluence, a process pool extracts and formats
+    their text, and a writer stores them in batches in the page files and the database. A full queue blocks
+    the stage feeding it, so a slow stage throttles the others instead of letting pages pile up in memory.
+    Pages that failed for a reason that may go away, a network or server error when fetching them, a parse
+    worker dying or an error writing them, are queued again once for the next import. Pages that were not
+    found or could not be parsed are dropped with an error, queueing them again would fail the same way forever.
+    """
+
+    def __init__(self, space_key, fetch_thread_count=ingest_fetch_thread_count,
+                 parse_worker_count=ingest_parse_worker_count, queue_size=ingest_queue_size,
+                 write_batch_size=ingest_write_batch_size):
+        """
+        Initializes the pipeline, the stages are started by run().
+
+        Args:
+        space_key (str): The key of the space whose queued pages are imported.
+        fetch_thread_count (int): The number of threads fetching pages.
+        parse_worker_count (int): The number of processes extracting page text.
+        queue_size (int): The maximum number of pages waiting between two stages.
+        write_batch_size (int): The maximum number of pages written per batch.
+        """
+        # Imported here to avoid a circular import, the processor module runs this pipeline
+        from confluence_integration.extract_page_content_and_store_processor import QueueManager
+        self.space_key = space_key
+        self.fetch_thread_count = fetch_thread_count
+        self.parse_worker_count = parse_worker_count
+        self.write_batch_size = write_batch_size
+        self.process_page_queue = QueueManager(persist_page_processing_queue_path, space_key)
+        self.vectorization_queue = QueueManager(persist_page_vector_queue_path, space_key)
+        self.file_manager = FileManager()
+        self.raw_pages = queue.Queue(queue_size)
+        self.records = queue.Queue(queue_size)
+        self.stats = {"fetch": StageStats("fetch", fetch_thread_count),
+                      "parse": StageStats("parse", parse_worker_count),
+                      "write": StageStats("write", 1)}
+        self.written_page_ids = []
+        self.failed_page_ids = []  # Queued again for the next import
+        self.dropped_page_ids = []
+
+    @staticmethod
+    def needs_processing(page_id):
+        last_updated_in_db = get_last_updated_timestamp(page_id)
+        return not last_updated_in_db or not is_page_processed(page_id, last_updated_in_db)
+
+    def run_fetcher(self):
+        while (page_id := self.process_page_queue.dequeue_page()) is not None:
+            try:
+                if not self.needs_processing(page_id):
+                    self.vectorization_queue.enqueue_page(page_id)
+                    continue
+                started_at = time.monotonic()
+                raw_page = fetch_raw_page(page_id, self.space_key)
+                self.stats["fetch"].record(time.monotonic() - started_at)
+            except Exception as e:
+                logging.error(f"Error fetching page with ID {page_id}: {e}")
+                if is_transient_error(e):
+                    self.failed_page_ids.append(page_id)
+                else:
+                    self.dropped_page_ids.append(page_id)
+                continue
+            if raw_page:
+                self.raw_pages.put(raw_page)
+            else:
+                self.dropped_page_ids.append(page_id)
+
+    def run_parser(self):
+        in_flight = {}  # Future -> page ID
+        unparsed_page_ids = set()  # Pages taken from the fetch queue and not yet handed to the writer
+        end_of_input = False
+        try:
+            # Spawn so workers never inherit the fetch threads or their connections
+            with ProcessPoolExecutor(max_workers=self.parse_worker_count,
+                                     mp_context=multiprocessing.get_context("spawn")) as pool:
+                while not end_of_input or in_flight:
+                    # Keep every worker busy with one page queued behind it, and no more
+                    while not end_of_input and len(in_flight) < self.parse_worker_count * 2:
+                        raw_page = self.raw_pages.get()
+                        if raw_page is None:
+                            end_of_input = True
+                        else:
+                            unparsed_page_ids.add(raw_page['page_id'])
+                            in_flight[pool.submit(timed_build_page_record, raw_page)] = raw_page['page_id']
+                    if not in_flight:
+                        continue
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        page_id = in_flight.pop(future)
+                        unparsed_page_ids.discard(page_id)
+                        try:
+                            record, seconds = future.result()
+                        except BrokenProcessPool as e:
+                            logging.error(f"Error parsing page with ID {page_id}: {e}")
+                            self.failed_page_ids.append(page_id)
+                            continue
+                        except Exception as e:
+                            logging.error(f"Error parsing page with ID {page_id}: {e}")
+                            self.dropped_page_ids.append(page_id)
+                            continue
+                        self.stats["parse"].record(seconds)
+                        self.records.put(record)
+        except Exception as e:
+            logging.error(f"Page parsing stopped, the pages not parsed yet are queued again: {e}")
+            self.failed_page_ids.extend(unparsed_page_ids)
+            # Keep taking the fetched pages so the fetchers are not blocked on a full queue
+            while not end_of_input:
+                raw_page = self.raw_pages.get()
+                if raw_page is None:
+                    end_of_input = True
+                else:
+                    self.failed_page_ids.append(raw_page['page_id'])
+        finally:
+            self.records.put(None)
+
+    def run_writer(self):
+        batch = []
+        end_of_input = False
+        while not end_of_input:
+            try:
+                record = self.records.get(timeout=1)
+            except queue.Empty:
+                record = False  # Nothing arrived in time, write what is pending rather than wait for a full batch
+            if record is None:
+                end_of_input = True
+            elif record:
+                batch.append(record)
+            if batch and (len(batch) >= self.write_batch_size or not record):
+                self.write_batch(batch)
+                batch = []
+
+    def write_batch(self, batch):
+        started_at = time.monotonic()
+        page_ids = [page_data['pageId'] for page_data, _ in batch]
+        try:
+            self.file_manager.create_batch({f"{page_data['pageId']}.txt": formatted_content
+                                            for page_data, formatted_content in batch})
+            store_pages_data(self.space_key, {page_data['pageId']: page_data for page_data, _ in batch})
+            mark_pages_as_processed(page_ids)
+            for page_id in page_ids:
+                self.vectorization_queue.enqueue_page(page_id)
+        except Exception as e:
+            logging.error(f"Error writing pages {page_ids}: {e}")
+            self.failed_page_ids.extend(page_ids)
+            return
+        self.written_page_ids.extend(page_ids)
+        self.stats["write"].record(time.monotonic() - started_at, len(batch))
+
+    def log_stats(self):
+        logging.info("Ingest of space %s: %s", self.space_key,
+                     "; ".join(stats.summary() for stats in self.stats.values()))
+
+    def wait_for(self, threads, consumer=None):
+        """
+        Wait for threads to finish, logging the stage statistics every ingest_stats_log_interval_seconds.
+
+        Args:
+        threads (list of threading.Thread): The threads of a stage.
+        consumer (threading.Thread): The thread of the next stage, which must outlive them.
+
+        Raises:
+        RuntimeError: If the consumer stopped first, the threads would then block on its full queue forever.
+        """
+        next_log_at = time.monotonic() + ingest_stats_log_interval_seconds
+        for thread in threads:
+            while thread.is_alive():
+                if consumer is not None and not consumer.is_alive():
+                    raise RuntimeError(f"{consumer.name} stopped before {thread.name}")
+                thread.join(min(max(next_log_at - time.monotonic(), 0), 1))
+                if time.monotonic() >= next_log_at:
+                    self.log_stats()
+                    next_log_at += ingest_stats_log_interval_seconds
+
+    def run(self):
+        """
+        Import the queued pages and wait for the import to finish.
+
+        Returns:
+        list: The IDs of the pages written.
+
+        Raises:
+        RuntimeError: If a stage stopped unexpectedly, the dequeued pages are then not acknowledged.
+        """
+        fetchers = [threading.Thread(target=self.run_fetcher, name=f"ingest-fetch-{index}", daemon=True)
+                    for index in range(self.fetch_thread_count)]
+        parser = threading.Thread(target=self.run_parser, name="ingest-parse", daemon=True)
+        writer = threading.Thread(target=self.run_writer, name="ingest-write", daemon=True)
+        for thread in fetchers + [parser, writer]:
+            thread.start()
+        self.wait_for(fetchers, consumer=parser)
+        self.raw_pages.put(None)
+        self.wait_for([parser, writer])
+        # Acknowledge the dequeued pages only once they are written, queueing the failed ones again once each
+        failed_page_ids = list(dict.fromkeys(self.failed_page_ids))
+        for page_id in failed_page_ids:
+            self.process_page_queue.enqueue_page(page_id)
+        self.process_page_queue.task_done()
+        if failed_page_ids:
+            logging.warning(f"{len(failed_page_ids)} pages of space {self.space_key} failed and are queued again")
+        if self.dropped_page_ids:
+            logging.error(f"{len(self.dropped_page_ids)} pages of space {self.space_key} were not found or could not "
+                          f"be parsed and are dropped: {self.dropped_page_ids}")
+        self.log_stats()
+        return self.written_page_ids
@@ -0,0 +1,58 @@
+# ./confluence_integration/page_formatter.py
+import time
+from confluence_integration.storage_format_extractor import extract_text
+
+# CPU bound steps of the page ingest, kept free of network clients so they can run in worker processes.
+
+
+def format_page_content_for_llm(page_data):
+    """
+        Format page data into a string of key-value pairs suitable for LLM (Language Learning Models) context.
+
+        This function converts page data into a text format that can be easily consumed by language models,
+        with each key-value pair on a separate line.
+
+        Args:
+        page_data (dict): A dictionary containing page data with keys like title, author, createdDate, etc.
+
+        Returns:
+        str: A string representation of the page data in key-value format.
+        """
+    return "".join(f"{key}: {value}\n" for key, value in page_data.items())
+
+
+def build_page_record(raw_page):
+    """
+    Turn a fetched page into the data stored for it.
+
+    Args:
+    raw_page (dict): The page as returned by fetch_raw_page, with its storage format body and comment bodies.
+
+    Returns:
+    tuple: The page data dictionary and the content formatted for the LLM.
+    """
+    page_data = {
+        'spaceKey': raw_page['space_key'],
+        'pageId': raw_page['page_id'],
+        'title': extract_text(raw_page['title']),
+        'author': raw_page['author'],
+        'createdDate': raw_page['created_date'],
+        'lastUpdated': raw_page['last_updated'],
+        'content': extract_text(raw_page['body']),
+        'comments': "".join(extract_text(comment_body) for comment_body in raw_page['comment_bodies']),
+        'datePulledFromConfluence': raw_page['pulled_at']
+    }
+    formatted_content = format_page_content_for_llm(page_data)
+    return page_data, formatted_content
+
+
+def timed_build_page_record(raw_page):
+    """
+    Run build_page_record and measure it, used by the worker processes of the ingest pipeline.
+
+    Returns:
+    tuple: The result of build_page_record and the seconds it took.
+    """
+    started_at = time.perf_counter()
+    record = build_page_record(raw_page)
+    return record, time.perf_counter() - started_at
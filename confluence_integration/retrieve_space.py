@@ -1,23 +1,15 @@
 # ./confluence_integration/retrieve_space.py
 import os
 from datetime import datetime
-from bs4 import BeautifulSoup
-from atlassian import Confluence
-from credentials import confluence_credentials
-from database.nur_database import mark_page_as_processed
 from persistqueue import Queue
 from configuration import persist_page_processing_queue_path
 from confluence_integration.confluence_client import ConfluenceClient
+from network.service_registry import get_confluence
 import requests
 import logging
+from telemetry.structured_logging import log_event, log_payload
 
 
-# Initialize Confluence API
-confluence = Confluence(
-    url=confluence_credentials['base_url'],
-    username=confluence_credentials['username'],
-    password=confluence_credentials['api_token']
-)
 
 
 # Get top level pages from a space
@@ -31,7 +23,7 @@ def get_top_level_ids(space_key):
     Returns:
     list: A list of page IDs for the top-level pages in the space.
     """
-    top_level_pages = confluence.get_all_pages_from_space(space_key)
+    top_level_pages = get_confluence().get_all_pages_from_space(space_key)
     return [page['id'] for page in top_level_pages]
 
 
@@ -48,7 +40,7 @@ def get_child_ids(item_id, content_type):
     list: A list of IDs for child items.
     """
     try:
-        child_items = confluence.get_page_child_by_type(item_id, type=content_type)
+        child_items = get_confluence().get_page_child_by_type(item_id, type=content_type)
         return [child['id'] for child in child_items]
     except requests.exceptions.HTTPError as e:
         logging.error(f"Error retrieving child items for item ID {item_id}: {e}")
@@ -133,20 +125,6 @@ def choose_space():
     return spaces[choice]['key'], spaces[choice]['name']
 
 
-def strip_html_tags(content):
-    """
-    Remove HTML tags from a string.
-
-    Args:
-    content (str): The string with HTML content.
-
-    Returns:
-    str: The string with HTML tags removed.
-    """
-    soup = BeautifulSoup(content, 'html.parser')
-    return soup.get_text()
-
-
 def check_date_filter(update_date, all_page_ids):
     """
     Filter pages based on their last updated date.
@@ -161,7 +139,7 @@ def check_date_filter(update_date, all_page_ids):
     updated_pages = []
     for page_id in all_page_ids:
         try:
-            page_history = confluence.history(page_id)  # directly use page_id
+            page_history = get_confluence().history(page_id)  # directly use page_id
         except Exception as e:
             logging.error(f"Error retrieving history for page ID {page_id}: {e}")
             continue
@@ -171,101 +149,71 @@ def check_date_filter(update_date, all_page_ids):
     return updated_pages
 
 
-def format_page_content_for_llm(page_data):
+def get_comment_storage(comment_id):
     """
-        Format page data into a string of key-value pairs suitable for LLM (Language Learning Models) context.
-
-        This function converts page data into a text format that can be easily consumed by language models,
-        with each key-value pair on a separate line.
-
-        Args:
-        page_data (dict): A dictionary containing page data with keys like title, author, createdDate, etc.
-
-        Returns:
-        str: A string representation of the page data in key-value format.
-        """
-    content = ""
-    for key, value in page_data.items():
-        content += f"{key}: {value}\n"
-    return content
-
-
-def get_comment_content(comment_id):
-    """
-    Retrieve the content of a comment.
+    Retrieve the storage format body of a comment.
 
     Args:
     comment_id (str): The ID of the comment.
 
     Returns:
-    str: The content of the comment.
+    str: The storage format body of the comment.
     """
     try:
-        comment = confluence.get_page_by_id(comment_id, expand='body.storage')
-        comment_content = comment.get('body', {}).get('storage', {}).get('value', '')
-        comment_text = strip_html_tags(comment_content)
-        return comment_text
+        comment = get_confluence().get_page_by_id(comment_id, expand='body.storage')
+        return comment.get('body', {}).get('storage', {}).get('value', '')
     except Exception as e:
         logging.error(f"Error retrieving content for comment ID {comment_id}: {e}")
         return ""  # Return empty string if an error occurs
 
 
+def is_transient_error(error):
+    """
+    Check whether a failed Confluence request may succeed when made again.
+
+    Args:
+    error (Exception): The error raised by the request.
+
+    Returns:
+    bool: True for network errors, rate limiting and server errors.
+    """
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    status_code = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status_code is not None and (status_code == 429 or status_code >= 500)
+
 
-def process_page(page_id, space_key, file_manager, page_content_map):
+def fetch_raw_page(page_id, space_key):
     """
-    Process a page and store its data in files and a database.
+    Fetch a page and the storage format bodies of its comments, the network bound part of processing a page.
     :param page_id:
     :param space_key:
-    :param file_manager:
-    :param page_content_map:
-    :return: page_data
+    :return: A dictionary with the page fields and its comment bodies, or None if the page could not be retrieved.
+    :raises Exception: The error of a transient failure, see is_transient_error, the page can be fetched again later.
     """
     current_time = datetime.now()
     try:
-        page = confluence.get_page_by_id(page_id, expand='body.storage,history,version')
+        page = get_confluence().get_page_by_id(page_id, expand='body.storage,history,version')
     except Exception as e:
+        if is_transient_error(e):
+            raise
         logging.error(f"Error retrieving page with ID {page_id}: {e}")
         return None
-    if page:
-        print(f"Processing page with ID {page_id}...")
-        page_title = strip_html_tags(page['title'])
-        page_author = page['history']['createdBy']['displayName']
-        created_date = page['history']['createdDate']
-        last_updated = page['version']['when']
-        page_content = strip_html_tags(page.get('body', {}).get('storage', {}).get('value', ''))
-        page_comments_content = ""
-        page_comment_ids = get_all_comment_ids_recursive(page_id)
-
-        for comment_id in page_comment_ids:
-            page_comments_content += get_comment_content(comment_id)
-
-        page_data = {
-            'spaceKey': space_key,
-            'pageId': page_id,
-            'title': page_title,
-            'author': page_author,
-            'createdDate': created_date,
-            'lastUpdated': last_updated,
-            'content': page_content,
-            'comments': page_comments_content,
-            'datePulledFromConfluence': current_time
-        }
-
-        # Store data for files
-        formatted_content = format_page_content_for_llm(page_data)
-        file_manager.create(f"{page_id}.txt", formatted_content)  # Create a file for each page
-        print(f"Page with ID {page_id} processed and written to file.")
-
-        # Store data for database
-        page_content_map[page_id] = page_data
-        print(f"Page with ID {page_id} processed and written database.")
-
-        # Mark the page as processed
-        mark_page_as_processed(page_id)
-        return page_data
-    else:
+    if not page:
         logging.error(f"Error processing page with ID {page_id}: Page not found.")
         return None
+    page_comment_ids = get_all_comment_ids_recursive(page_id)
+    return {
+        'page_id': page_id,
+        'space_key': space_key,
+        'title': page['title'],
+        'author': page['history']['createdBy']['displayName'],
+        'created_date': page['history']['createdDate'],
+        'last_updated': page['version']['when'],
+        'body': page.get('body', {}).get('storage', {}).get('value', ''),
+        'comment_bodies': [get_comment_storage(comment_id) for comment_id in page_comment_ids],
+        'pulled_at': current_time
+    }
 
 
 def get_space_content(space_key, update_date=None):
@@ -295,8 +243,8 @@ def get_space_content(space_key, update_date=None):
     for page_id in all_page_ids:
         page_queue.put(page_id)
 
-    print(f"Enqueued {len(all_page_ids)} pages for processing.")
-    print(f"Pages queued {all_page_ids}")
+    log_event(logging.INFO, "Enqueued pages for processing", space_key=space_key, count=len(all_page_ids))
+    log_payload("Pages queued", page_ids=all_page_ids)
     return space_key
 
 
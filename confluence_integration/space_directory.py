@@ -0,0 +1,122 @@
+# ./confluence_integration/space_directory.py
+import logging
+import threading
+import time
+from configuration import space_directory_ttl_seconds, space_directory_page_size
+from network.service_registry import get_confluence
+
+
+class SpaceDirectory:
+    """
+    Cached directory of the Confluence spaces with a name to key index.
+
+    The directory is loaded once and refreshed when older than its TTL. Spaces are listed without expansions,
+    only their key and name are kept, and every listing page is requested with the ETag of its previous
+    version so unchanged pages are not downloaded again.
+    """
+
+    def __init__(self, confluence=None, ttl_seconds=space_directory_ttl_seconds, page_size=space_directory_page_size):
+        """
+        Initializes the directory, the spaces are loaded on first use.
+
+        Args:
+        confluence (Confluence): The Confluence API client, the shared one is used when None.
+        ttl_seconds (float): The age after which the directory is loaded again.
+        page_size (int): The number of spaces requested per listing page.
+        """
+        self.confluence = confluence
+        self.ttl_seconds = ttl_seconds
+        self.page_size = page_size
+        self.lock = threading.RLock()
+        self.spaces = []  # [{"key": ..., "name": ...}] in listing order
+        self.keys_by_name = {}
+        self.pages = {}  # listing page start -> (ETag, spaces of the page)
+        self.loaded_at = None
+
+    def fetch_page(self, start):
+        cached = self.pages.get(start)
+        headers = {"Accept": "application/json"}
+        if cached and cached[0]:
+            headers["If-None-Match"] = cached[0]
+        confluence = self.confluence or get_confluence()
+        response = confluence.get("rest/api/space", params={"start": start, "limit": self.page_size},
+                                  headers=headers, advanced_mode=True)
+        if response.status_code == 304 and cached:
+            return cached[1]
+        response.raise_for_status()
+        spaces = [{"key": space["key"], "name": space["name"]} for space in response.json().get("results", [])]
+        self.pages[start] = (response.headers.get("ETag"), spaces)
+        return spaces
+
+    def refresh(self, force=False):
+        """
+        Load the spaces if the directory is older than its TTL, or unconditionally when force is set.
+        """
+        with self.lock:
+            if not force and self.loaded_at is not None and time.monotonic() - self.loaded_at < self.ttl_seconds:
+                return
+            spaces = []
+            start = 0
+            while True:
+                page = self.fetch_page(start)
+                spaces.extend(page)
+                if len(page) < self.page_size:
+                    break
+                start += len(page)
+            # Pages past the end of the listing are stale
+            self.pages = {page_start: page for page_start, page in self.pages.items() if page_start <= start}
+            self.spaces = spaces
+            self.keys_by_name = {space["name"]: space["key"] for space in spaces}
+            self.loaded_at = time.monotonic()
+            logging.info(f"Loaded {len(spaces)} Confluence spaces")
+
+    def list_spaces(self):
+        """
+        Get the spaces.
+
+        Returns:
+        list: The spaces as dictionaries with their key and name.
+        """
+        self.refresh()
+        return list(self.spaces)
+
+    def get_key(self, space_name, refresh_on_miss=False):
+        """
+        Get the key of a space by name.
+
+        Args:
+        space_name (str): The name of the space.
+        refresh_on_miss (bool): Reload the directory before reporting a space as missing.
+
+        Returns:
+        str: The key of the space, or None if there is no space with that name.
+        """
+        self.refresh()
+        key = self.keys_by_name.get(space_name)
+        if key is None and refresh_on_miss:
+            self.refresh(force=True)
+            key = self.keys_by_name.get(space_name)
+        return key
+
+    def add(self, space_key, space_name):
+        """Record a space created by this process without reloading the directory."""
+        with self.lock:
+            self.spaces.append({"key": space_key, "name": space_name})
+            self.keys_by_name[space_name] = space_key
+
+    def invalidate(self):
+        with self.lock:
+            self.loaded_at = None
+
+
+space_directory = None
+space_directory_lock = threading.Lock()
+
+
+def get_space_directory():
+    """Get the space directory shared by this process."""
+    global space_directory
+    with space_directory_lock:
+        if space_directory is None:
+            space_directory = SpaceDirectory()
+        return space_directory
@@ -0,0 +1,277 @@
+# ./confluence_integration/storage_format_extractor.py
+import html
+import logging
+import re
+from html.entities import name2codepoint
+from html.parser import HTMLParser
+
+# Streaming text extraction from the Confluence storage format (XHTML with ac: and ri: elements).
+# The content is parsed once without building a tree, with lxml when it is installed and the standard library
+# HTMLParser otherwise, and the structure that matters for chunking is kept as plain text markers:
+# markdown-style headings, list items, table rows, fenced code blocks and labelled panels.
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+NAMESPACES = {
+    "http://atlassian.com/content": "ac",
+    "http://atlassian.com/resource/identifier": "ri",
+    "http://atlassian.com/template": "at",
+}
+ROOT_START = ('<nur-root xmlns:ac="http://atlassian.com/content" '
+              'xmlns:ri="http://atlassian.com/resource/identifier" xmlns:at="http://atlassian.com/template">')
+ROOT_END = '</nur-root>'
+XML_ENTITIES = {"amp", "lt", "gt", "quot", "apos"}
+ENTITY_PATTERN = re.compile(r"&([A-Za-z][A-Za-z0-9]*);")
+
+HEADINGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+BLOCKS = {"p", "div", "blockquote", "section", "ac:layout-section", "ac:layout-cell"}
+CODE_MACROS = {"code", "noformat"}
+PANEL_MACROS = {"info", "note", "warning", "tip", "panel", "expand"}
+SKIPPED = {"style", "script", "ac:placeholder", "ac:emoticon", "ac:task-id"}
+
+
+class StorageFormatTextBuilder:
+    """
+    Builds the text of a page from parser events.
+
+    Both parser adapters call start, end and data with element names using the ac: and ri: prefixes.
+    """
+
+    def __init__(self):
+        self.parts = []
+        self.skip_depth = 0
+        self.code_depth = 0
+        self.macros = []  # Stack of [macro name, parameters] of the enclosing ac:structured-macro elements
+        self.parameter = None  # Name of the macro parameter being read
+        self.lists = []  # Stack of [list tag, item count]
+        self.row_cells = []  # Tags of the cells of the current table row
+        self.link = None  # [parts length at the link start, linked page title]
+        self.task_status = None
+
+    def emit(self, text):
+        self.parts.append(text)
+
+    def newline(self, count=1):
+        self.parts.append("\n" * count)
+
+    def start(self, tag, attributes):
+        if self.skip_depth or tag in SKIPPED:
+            self.skip_depth += 1
+            return
+        if tag == "ac:structured-macro":
+            self.macros.append([attributes.get("ac:name", ""), {}])
+        elif tag == "ac:parameter":
+            self.parameter = attributes.get("ac:name", "")
+            if self.macros:
+                self.macros[-1][1][self.parameter] = ""
+        elif tag == "ac:plain-text-body" and self.macros and self.macros[-1][0] in CODE_MACROS:
+            self.newline()
+            self.emit(f"```{self.macros[-1][1].get('language', '')}\n")
+            self.code_depth += 1
+        elif tag == "pre":
+            self.newline()
+            self.emit("```\n")
+            self.code_depth += 1
+        elif tag == "ac:rich-text-body" and self.macros and self.macros[-1][0] in PANEL_MACROS:
+            name, parameters = self.macros[-1]
+            title = parameters.get("title", "").strip()
+            self.newline()
+            self.emit(f"[{name.capitalize()}{': ' + title if title else ''}]\n")
+        elif tag in HEADINGS:
+            self.newline(2)
+            self.emit("#" * HEADINGS[tag] + " ")
+        elif tag in BLOCKS:
+            self.newline()
+        elif tag == "br":
+            self.newline()
+        elif tag in ("ul", "ol", "ac:task-list"):
+            self.lists.append([tag, 0])
+        elif tag in ("li", "ac:task"):
+            indent = "  " * max(len(self.lists) - 1, 0)
+            if self.lists:
+                self.lists[-1][1] += 1
+            marker = f"{self.lists[-1][1]}." if self.lists and self.lists[-1][0] == "ol" else "-"
+            self.newline()
+            self.emit(f"{indent}{marker} ")
+        elif tag == "ac:task-status":
+            self.task_status = ""
+        elif tag == "tr":
+            self.row_cells = []
+            self.newline()
+            self.emit("|")
+        elif tag in ("td", "th"):
+            self.row_cells.append(tag)
+            self.emit(" ")
+        elif tag == "ac:link":
+            self.link = [len(self.parts), ""]
+        elif tag == "ri:page" and self.link:
+            self.link[1] = attributes.get("ri:content-title", "")
+        elif tag == "ri:attachment" and self.parameter is None:
+            if self.link:
+                self.link[1] = attributes.get("ri:filename", "")
+            else:
+                self.emit(f"[attachment: {attributes.get('ri:filename', '')}]")
+
+    def end(self, tag):
+        if self.skip_depth:
+            self.skip_depth -= 1
+            return
+        if tag == "ac:structured-macro":
+            if self.macros:
+                self.macros.pop()
+        elif tag == "ac:parameter":
+            self.parameter = None
+        elif (tag == "ac:plain-text-body" and self.code_depth) or (tag == "pre" and self.code_depth):
+            self.code_depth -= 1
+            self.newline()
+            self.emit("```\n")
+        elif tag in HEADINGS or tag in BLOCKS:
+            self.newline()
+        elif tag in ("ul", "ol", "ac:task-list"):
+            if self.lists:
+                self.lists.pop()
+            self.newline()
+        elif tag == "ac:task-status":
+            self.emit("[x] " if self.task_status.strip() == "complete" else "[ ] ")
+            self.task_status = None
+        elif tag in ("td", "th"):
+            self.emit(" |")
+        elif tag == "tr":
+            if self.row_cells and all(cell == "th" for cell in self.row_cells):
+                self.newline()
+                self.emit("|" + " --- |" * len(self.row_cells))
+        elif tag == "table":
+            self.newline()
+        elif tag == "ac:link" and self.link:
+            if not "".join(self.parts[self.link[0]:]).strip() and self.link[1]:
+                self.emit(self.link[1])
+            self.link = None
+
+    def data(self, text):
+        if self.skip_depth:
+            return
+        if self.parameter is not None:
+            if self.macros:
+                self.macros[-1][1][self.parameter] += text
+            return
+        if self.task_status is not None:
+            self.task_status += text
+            return
+        if self.code_depth:
+            self.emit(text)
+            return
+        text = re.sub(r"\s+", " ", text)
+        if not self.parts or self.parts[-1].endswith("\n"):
+            text = text.lstrip()
+        if text:
+            self.emit(text)
+
+    def result(self):
+        text = "".join(self.parts)
+        text = re.sub(r"[ \t]+\n", "\n", text)
+        return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+class LxmlTarget:
+    """lxml parser target forwarding the parser events to a StorageFormatTextBuilder"""
+
+    def __init__(self):
+        self.builder = StorageFormatTextBuilder()
+
+    @staticmethod
+    def name(qualified_name):
+        if qualified_name.startswith("{"):
+            namespace, local_name = qualified_name[1:].split("}", 1)
+            prefix = NAMESPACES.get(namespace)
+            return f"{prefix}:{local_name}" if prefix else local_name
+        return qualified_name.lower()
+
+    def start(self, tag, attributes):
+        self.builder.start(self.name(tag), {self.name(key): value for key, value in attributes.items()})
+
+    def end(self, tag):
+        self.builder.end(self.name(tag))
+
+    def data(self, text):
+        self.builder.data(text)
+
+    def close(self):
+        return self.builder.result()
+
+
+class FallbackParser(HTMLParser):
+    """Standard library parser forwarding the parser events to a StorageFormatTextBuilder"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.builder = StorageFormatTextBuilder()
+
+    def handle_starttag(self, tag, attrs):
+        self.builder.start(tag, dict(attrs))
+
+    def handle_startendtag(self, tag, attrs):
+        self.builder.start(tag, dict(attrs))
+        self.builder.end(tag)
+
+    def handle_endtag(self, tag):
+        self.builder.end(tag)
+
+    def handle_data(self, data):
+        self.builder.data(data)
+
+    def unknown_decl(self, data):
+        # Code macro bodies are CDATA sections
+        if data.startswith("CDATA["):
+            self.builder.data(data[len("CDATA["):])
+
+
+def replace_html_entities(match):
+    name = match.group(1)
+    if name in XML_ENTITIES:
+        return match.group(0)
+    if name in name2codepoint:
+        return f"&#{name2codepoint[name]};"
+    return f"&amp;{name};"
+
+
+def extract_with_lxml(content):
+    parser = etree.XMLParser(target=LxmlTarget(), recover=True, resolve_entities=False, huge_tree=True)
+    parser.feed(ROOT_START)
+    # The storage format uses HTML entities, which are not defined in XML
+    parser.feed(ENTITY_PATTERN.sub(replace_html_entities, content))
+    parser.feed(ROOT_END)
+    return parser.close()
+
+
+def extract_with_html_parser(content):
+    parser = FallbackParser()
+    parser.feed(content)
+    parser.close()
+    return parser.builder.result()
+
+
+def extract_text(content):
+    """
+    Extract the text of Confluence storage format content, keeping its structure as plain text markers.
+
+    Args:
+    content (str): The storage format content, or plain text such as a page title.
+
+    Returns:
+    str: The extracted text.
+    """
+    if not content:
+        return ""
+    if "<" not in content:
+        # Plain text, only entities need to be decoded
+        return html.unescape(content) if "&" in content else content
+    if etree is not None:
+        try:
+            return extract_with_lxml(content)
+        except Exception as e:
+            logging.warning(f"lxml could not parse the content, falling back to HTMLParser: {e}")
+    return extract_with_html_parser(content)
+
@@ -1,6 +1,8 @@
 import json
-from configuration import file_system_path
-from vector.chroma_threads import retrieve_relevant_documents
+from configuration import embedding_model_id
+from file_system.file_manager import FileManager
+from vector.chroma_threads import retrieve_relevant_documents, embed_text
+from vector.qa_interaction_index import QAInteractionIndex
 
 
 def format_pages_as_context(file_ids, max_length=30000):
@@ -15,28 +17,27 @@ def format_pages_as_context(file_ids, max_length=30000):
     Returns:
         list of dicts: Each dict contains the document title, space key, and content, truncated if necessary.
     """
+    file_manager = FileManager()
     documents = []
     total_length = 0
     for file_id in file_ids:
         if total_length >= max_length:
             break
-        chosen_file_path = file_system_path + f"/{file_id}.txt"
-        with open(chosen_file_path, 'r') as file:
-            file_content = file.read()
-            title = file_content.split('title: ')[1].split('\n')[0].strip()
-            space_key = file_content.split('spaceKey: ')[1].split('\n')[0].strip()
-            document = {
-                "id": file_id,
-                "title": title,
-                "spaceKey": space_key,
-                "content": file_content
-            }
-            document_length = len(json.dumps(document))
-            if total_length + document_length <= max_length:
-                documents.append(document)
-                total_length += document_length
-            else:
-                break  # Stop adding more content to ensure we respect the maximum length
+        file_content = file_manager.read(f"{file_id}.txt")
+        title = file_content.split('title: ')[1].split('\n')[0].strip()
+        space_key = file_content.split('spaceKey: ')[1].split('\n')[0].strip()
+        document = {
+            "id": file_id,
+            "title": title,
+            "spaceKey": space_key,
+            "content": file_content
+        }
+        document_length = len(json.dumps(document))
+        if total_length + document_length <= max_length:
+            documents.append(document)
+            total_length += document_length
+        else:
+            break  # Stop adding more content to ensure we respect the maximum length
 
     # Truncate the last document's content if total_length exceeds max_length
     if total_length > max_length:
@@ -47,6 +48,25 @@ def format_pages_as_context(file_ids, max_length=30000):
     return documents
 
 
+def format_related_interactions_as_context(related_interactions):
+    """
+    Formats previously answered questions as a context string, most similar first.
+
+    Args:
+        related_interactions (list of dicts): Related interactions as returned by QAInteractionIndex.find_related.
+
+    Returns:
+        str: The formatted questions and answers, or an empty string if there are none.
+    """
+    if not related_interactions:
+        return ""
+    formatted_interactions = [
+        f"Previously answered question: {interaction['question']}\nPrevious answer: {interaction['answer']}\n"
+        for interaction in related_interactions
+    ]
+    return "\n".join(formatted_interactions)
+
+
 def get_context(context_query, max_length=30000):
     """
     Retrieves relevant documents based on a context query and formats them for use as context,
@@ -57,12 +77,19 @@ def get_context(context_query, max_length=30000):
         max_length (int): The maximum length allowed for the combined context.
 
     Returns:
-        dict: A dictionary with 'document_ids' and 'documents', where 'documents' is a list of dicts
-              containing the document title, space key, and content.
+        dict: A dictionary with 'document_ids', 'documents' and 'related_answers', where 'documents' is a list
+              of dicts containing the document title, space key, and content, and 'related_answers' lists
+              previously answered questions similar to the query.
     """
-    context_document_ids = retrieve_relevant_documents(context_query)
+    query_embedding = embed_text(context_query, embedding_model_id)
+    context_document_ids = retrieve_relevant_documents(context_query, query_embedding=query_embedding)
     documents = format_pages_as_context(context_document_ids, max_length)
+    related_answers = [
+        {"question": interaction["question"], "answer": interaction["answer"]}
+        for interaction in QAInteractionIndex().find_related(query_embedding)
+    ]
     return {
         "document_ids": context_document_ids,
-        "documents": documents
+        "documents": documents,
+        "related_answers": related_answers
     }
@@ -0,0 +1,141 @@
+# ./context/prompt_builder.py
+import logging
+import threading
+from file_system.file_manager import FileManager
+from telemetry.latency import timed
+
+# Instructions shared by every question, sent first so they are part of the cached prompt prefix
+ANSWER_INSTRUCTIONS = ("You are the Q&A based on knowledge base assistant.\n"
+                       "You will always review and refer to the pages included as context. \n"
+                       "You will always answer from the pages.\n"
+                       "You will never improvise or create content from outside the files.\n"
+                       "If you do not have the answer based on the files you will clearly state that and abstain from answering.\n"
+                       "If you use your knowledge to explain some information from outside the file, you will clearly state that.\n"
+                       "You will answer the question with a summary, then provide a comprehensive answer, "
+                       "then provide the references aliasing them as Technical trace.\n")
+
+TRUNCATION_NOTICE = " [Content truncated due to size limit.]"
+
+
+def read_page(page_id):
+    """
+    Read a page file and format it as a context document.
+
+    Args:
+    page_id (str): The ID of the page.
+
+    Returns:
+    str: The document title, space key and content of the page.
+    """
+    file_content = FileManager().read(f"{page_id}.txt")
+    title = file_content.split('title: ')[1].split('\n')[0].strip()
+    space_key = file_content.split('spaceKey: ')[1].split('\n')[0].strip()
+    return f"\nDocument Title: {title}\nSpace Key: {space_key}\n\n{file_content}"
+
+
+def page_sort_key(page_id):
+    page_id = str(page_id)
+    return (0, int(page_id), page_id) if page_id.isdigit() else (1, 0, page_id)
+
+
+@timed("context_build")
+def format_pages_for_prompt(page_ids, max_length=30000):
+    """
+    Format pages as a context string laid out for provider-side prompt caching.
+
+    Pages are selected in the order they were retrieved, most relevant first, until max_length is reached,
+    then the selected pages are sorted by page ID. Questions retrieving the same pages in a different order
+    therefore produce the same context, and so the same prompt prefix.
+
+    Args:
+    page_ids (list): The IDs of the retrieved pages, most relevant first.
+    max_length (int): The maximum length of the context, None for no limit.
+
+    Returns:
+    str: The formatted context, empty if no page could be read.
+    """
+    selected = {}
+    total_length = 0
+    for page_id in dict.fromkeys(str(page_id) for page_id in page_ids):
+        if max_length is not None and total_length >= max_length:
+            break
+        try:
+            document = read_page(page_id)
+        except Exception as e:
+            logging.error(f"Error reading page {page_id} for the prompt: {e}")
+            continue
+        if max_length is not None and total_length + len(document) > max_length:
+            # Only the least relevant selected page is truncated
+            document = document[:max(max_length - total_length - len(TRUNCATION_NOTICE), 0)] + TRUNCATION_NOTICE
+        selected[page_id] = document
+        total_length += len(document)
+    return "".join(selected[page_id] for page_id in sorted(selected, key=page_sort_key))
+
+
+def build_user_message(question, context, related_context=""):
+    """
+    Lay out a user message with the stable content first and the per-question content last.
+
+    Args:
+    question (str): The question.
+    context (str): The formatted pages.
+    related_context (str): Previously answered questions related to this one.
+
+    Returns:
+    str: The pages, then the related questions, then the question.
+    """
+    parts = [f"Context:\n{context}"] if context else []
+    if related_context:
+        parts.append(related_context)
+    parts.append(f"Question: {question}")
+    return "\n\n".join(parts)
+
+
+def build_chat_messages(question, context, related_context=""):
+    """
+    Build the chat completion messages for a question, instructions first.
+
+    Returns:
+    list: The system and user messages.
+    """
+    return [
+        {"role": "system", "content": ANSWER_INSTRUCTIONS},
+        {"role": "user", "content": build_user_message(question, context, related_context)}
+    ]
+
+
+prompt_cache_stats = {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0}
+prompt_cache_stats_lock = threading.Lock()
+
+
+def record_prompt_usage(usage, source):
+    """
+    Record the prompt tokens of a response and how many of them were read from the provider's prompt cache.
+
+    Args:
+    usage: The usage of a chat completion or assistant run, may be None.
+    source (str): The name of the caller, used in the log.
+    """
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = (getattr(details, "cached_tokens", 0) or 0) if details else 0
+    with prompt_cache_stats_lock:
+        prompt_cache_stats["requests"] += 1
+        prompt_cache_stats["prompt_tokens"] += prompt_tokens
+        prompt_cache_stats["cached_tokens"] += cached_tokens
+    logging.info(f"{source} prompt tokens: {prompt_tokens}, cached: {cached_tokens}")
+
+
+def get_prompt_cache_stats():
+    """
+    Get the prompt token totals since the process started.
+
+    Returns:
+    dict: The number of requests, prompt tokens, cached tokens and the share of prompt tokens that were cached.
+    """
+    with prompt_cache_stats_lock:
+        stats = dict(prompt_cache_stats)
+    stats["cached_ratio"] = stats["cached_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0.0
+    return stats
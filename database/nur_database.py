@@ -1,8 +1,12 @@
 # ./database/nur_database.py
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, Boolean
-from sqlalchemy.orm import sessionmaker, declarative_base  # Updated import
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, Boolean, LargeBinary
+from sqlalchemy.types import TypeDecorator
+from sqlalchemy.orm import sessionmaker, declarative_base, scoped_session  # Updated import
+import logging
 import sqlite3
 from configuration import sql_file_path
+from file_system.compression import compress_text, decompress_text
+from telemetry.structured_logging import log_payload
 from datetime import datetime
 import json
 
@@ -10,6 +14,25 @@ import json
 Base = declarative_base()
 
 
+class CompressedText(TypeDecorator):
+    """
+    Text column stored compressed with compress_text.
+    Rows written before the column was compressed hold plain text and are read back unchanged.
+    """
+    impl = LargeBinary
+    cache_ok = True
+
+    def __init__(self, cold=False, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cold = cold  # Rarely read values favour the compression ratio over speed
+
+    def process_bind_param(self, value, dialect):
+        return compress_text(value, cold=self.cold) if value is not None else None
+
+    def process_result_value(self, value, dialect):
+        return decompress_text(value)
+
+
 # Define the PageData model
 class PageData(Base):
     """
@@ -24,8 +47,8 @@ class PageData(Base):
     author = Column(String)
     createdDate = Column(DateTime)
     lastUpdated = Column(DateTime)
-    content = Column(Text)
-    comments = Column(Text)
+    content = Column(CompressedText())
+    comments = Column(CompressedText(cold=True))
     last_embedded = Column(DateTime)
     date_pulled_from_confluence = Column(DateTime)
     embed = Column(Text)
@@ -59,18 +82,66 @@ class QAInteractions(Base):
     comments = Column(Text, default=json.dumps([]))  # Set default to an empty JSON array
 
 
-class SlackMessageDeduplication(Base):
+class SlackMessageRecord(Base):
     """
-    SQLAlchemy model for storing deduplication data for Slack messages to prevent reprocessing.
+    SQLAlchemy model for storing the Slack messages the bot acted on, to prevent reprocessing
+    and to find the question a thread was started with.
     """
-    __tablename__ = 'slack_message_deduplication'
+    __tablename__ = 'slack_message_records'
 
     id = Column(Integer, primary_key=True)
     channel_id = Column(String, nullable=False)  # Identifier for the Slack channel.
-    message_ts = Column(String, nullable=False, unique=True)  # Timestamp of the message, unique within a channel.
+    message_ts = Column(String, nullable=False, unique=True, index=True)  # Timestamp of the message, unique within a channel.
+    thread_ts = Column(String)  # Timestamp of the parent message for replies in a thread.
+    question_text = Column(Text)  # Set when the message is a question starting a thread.
+    received_at = Column(DateTime, nullable=False, index=True)  # Used to expire old records.
+    answered_at = Column(DateTime)
 
     def __repr__(self):
-        return f"<SlackMessageDeduplication(channel_id='{self.channel_id}', message_ts='{self.message_ts}')>"
+        return f"<SlackMessageRecord(channel_id='{self.channel_id}', message_ts='{self.message_ts}')>"
+
+
+class AnswerCacheEntry(Base):
+    """
+    SQLAlchemy model for storing answers that can be reused for near-duplicate questions.
+    The question embedding lives in the vector store under the same thread_id.
+    """
+    __tablename__ = 'answer_cache'
+
+    id = Column(Integer, primary_key=True)
+    thread_id = Column(String, nullable=False, unique=True, index=True)  # Slack ts of the original question
+    channel_id = Column(String)
+    question_text = Column(Text)
+    answer_text = Column(Text)
+    page_versions = Column(Text)  # JSON map of source page_id to its lastUpdated when the answer was produced
+    created_at = Column(DateTime)
+
+
+class ConversationTurn(Base):
+    """
+    SQLAlchemy model for storing the turns of a conversation answered with chat completions,
+    replayed on every follow-up in place of an Assistants thread.
+    """
+    __tablename__ = 'conversation_turns'
+
+    id = Column(Integer, primary_key=True)
+    conversation_id = Column(String, nullable=False, index=True)  # Slack ts of the message that started the thread
+    role = Column(String, nullable=False)  # "user" or "assistant"
+    content = Column(Text)
+    created_at = Column(DateTime)
+
+
+class QASyncState(Base):
+    """
+    SQLAlchemy model for storing what was last pushed to Confluence for a Q&A interaction,
+    so the sync only uploads new or changed interactions.
+    """
+    __tablename__ = 'qa_sync_state'
+
+    interaction_id = Column(Integer, primary_key=True)
+    content_hash = Column(String, nullable=False)  # SHA-256 of the page title and content that were pushed
+    confluence_page_id = Column(String)
+    synced_at = Column(DateTime)
 
 
 class QAInteractionManager:
@@ -83,11 +154,9 @@ class QAInteractionManager:
     def add_question_and_answer(self, question, answer, thread_id, assistant_thread_id, channel_id, question_ts, answer_ts):
         serialized_answer = json.dumps(answer.__dict__) if not isinstance(answer, str) else answer
 
-        # Log the types and values of the parameters
-        print(
-            f"Inserting into database: question={question}, answer={answer}, thread_id={thread_id}, assistant_thread_id={assistant_thread_id}, channel_id={channel_id}, question_ts={question_ts}, answer_ts={answer_ts}")
-        print(
-            f"Data types: question={type(question)}, answer={type(answer)}, thread_id={type(thread_id)}, assistant_thread_id={type(assistant_thread_id)}, channel_id={type(channel_id)}, question_ts={type(question_ts)}, answer_ts={type(answer_ts)}")
+        log_payload("Inserting interaction into database", sample_key=thread_id, question=question,
+                    answer=serialized_answer, thread_id=thread_id, assistant_thread_id=assistant_thread_id,
+                    channel_id=channel_id)
 
         interaction = QAInteractions(
             question_text=question,
@@ -101,6 +170,7 @@ class QAInteractionManager:
         )
         self.session.add(interaction)
         self.session.commit()
+        return interaction
 
     def add_comment_to_interaction(self, thread_id, comment):
         """
@@ -121,6 +191,60 @@ class QAInteractionManager:
     def get_interaction_by_thread_id(self, thread_id):
         return self.session.query(QAInteractions).filter_by(thread_id=thread_id).first()
 
+    def get_interactions_by_ids(self, interaction_ids):
+        """
+        Retrieve Q&A interactions by their IDs.
+
+        Returns:
+            dict: A dictionary of interaction ID to QAInteractions object.
+        """
+        if not interaction_ids:
+            return {}
+        interactions = self.session.query(QAInteractions).filter(
+            QAInteractions.interaction_id.in_(interaction_ids)).all()
+        return {interaction.interaction_id: interaction for interaction in interactions}
+
+    def get_interactions_page(self, after_id=0, limit=100, newest_first=False):
+        """
+        Retrieve one page of Q&A interactions using keyset pagination on the interaction ID.
+
+        Args:
+            after_id (int): Only interactions past this ID are returned, use the last ID of the previous page.
+                When newest_first is set, interactions before this ID are returned and 0 means start from the newest.
+            limit (int): The maximum number of interactions in the page.
+            newest_first (bool): Page from the most recent interaction backwards.
+
+        Returns:
+            list: A list of QAInteractions objects.
+        """
+        query = self.session.query(QAInteractions)
+        if newest_first:
+            if after_id:
+                query = query.filter(QAInteractions.interaction_id < after_id)
+            query = query.order_by(QAInteractions.interaction_id.desc())
+        else:
+            query = query.filter(QAInteractions.interaction_id > after_id).order_by(QAInteractions.interaction_id)
+        return query.limit(limit).all()
+
+    def iter_interactions(self, batch_size=500, after_id=0, newest_first=False):
+        """
+        Stream Q&A interactions page by page so only one page is held in memory at a time.
+
+        Args:
+            batch_size (int): The number of interactions fetched per query.
+            after_id (int): Resume streaming after this interaction ID.
+            newest_first (bool): Stream from the most recent interaction backwards.
+
+        Yields:
+            QAInteractions: The interactions in interaction ID order.
+        """
+        while True:
+            page = self.get_interactions_page(after_id, batch_size, newest_first)
+            if not page:
+                return
+            yield from page
+            after_id = page[-1].interaction_id
+
     def get_qa_interactions(self):
         """
         Retrieve all Q&A interactions.
@@ -134,6 +258,40 @@ class QAInteractionManager:
         return self.session.query(QAInteractions).all()
 
 
+class ConversationManager:
+    """
+    Manages the storage and retrieval of chat conversation turns.
+    """
+    def __init__(self, session):
+        self.session = session
+
+    def get_turns(self, conversation_id, max_turns):
+        """
+        Retrieve the latest turns of a conversation.
+
+        Args:
+            conversation_id (str): The Slack thread ts of the conversation.
+            max_turns (int): The maximum number of turns to return.
+
+        Returns:
+            list: The turns as chat messages with a role and a content, oldest first.
+        """
+        turns = self.session.query(ConversationTurn).filter_by(conversation_id=conversation_id).order_by(
+            ConversationTurn.id.desc()).limit(max_turns).all()
+        return [{"role": turn.role, "content": turn.content} for turn in reversed(turns)]
+
+    def add_exchange(self, conversation_id, question, answer):
+        """
+        Store a question and its answer as the next two turns of a conversation.
+        """
+        now = datetime.now()
+        self.session.add_all([
+            ConversationTurn(conversation_id=conversation_id, role="user", content=question, created_at=now),
+            ConversationTurn(conversation_id=conversation_id, role="assistant", content=answer, created_at=now)
+        ])
+        self.session.commit()
+
+
 def parse_datetime(date_string):
     """
     Convert an ISO format datetime string to a datetime object.
@@ -171,9 +329,9 @@ def store_pages_data(space_key, pages_data):
                             date_pulled_from_confluence=date_pulled_from_confluence
                             )
         session.add(new_page)
-        print(f"Page with ID {page_id} written to database")
     session.commit()
     session.close()
+    logging.info(f"{len(pages_data)} pages of space {space_key} written to database")
 
 
 def get_page_ids_missing_embeds():
@@ -212,6 +370,29 @@ def get_all_page_data_from_db():
     return page_ids, all_documents, embeddings
 
 
+def iter_page_embeddings(page_ids=None, batch_size=500):
+    """
+    Iterate over the embedded pages with the metadata indexed along their embeddings, without loading their content.
+    :param page_ids: Only these pages, every embedded page when None.
+    :param batch_size: The number of pages per batch.
+    :return: Yields lists of (page_id, space_key, title, author, lastUpdated, embed) tuples.
+    """
+    last_id = 0
+    while True:
+        session = Session()
+        query = session.query(PageData.id, PageData.page_id, PageData.space_key, PageData.title, PageData.author,
+                              PageData.lastUpdated, PageData.embed).filter(PageData.embed.isnot(None),
+                                                                           PageData.id > last_id)
+        if page_ids is not None:
+            query = query.filter(PageData.page_id.in_(page_ids))
+        records = query.order_by(PageData.id).limit(batch_size).all()
+        session.close()
+        if not records:
+            return
+        last_id = records[-1][0]
+        yield [tuple(record[1:]) for record in records]
+
+
 def get_page_data_from_db():
     """
     Retrieve all page data and embeddings from the database.
@@ -263,10 +444,10 @@ def add_or_update_embed_vector(page_id, embed_vector):
         page.embed = embed_vector_json
         page.last_embedded = datetime.now()  # Update the last_embedded to the current datetime
         session.commit()
-        print(f"Embed vector and last_embedded timestamp for page ID {page_id} have been updated.")
+        logging.debug(f"Embed vector and last_embedded timestamp for page ID {page_id} have been updated.")
     else:
         # Page not found, handle the case where the page does not exist
-        print(f"No page found with ID {page_id}")
+        logging.warning(f"No page found with ID {page_id}")
 
     # Close the session
     session.close()
@@ -300,7 +481,7 @@ def get_page_data_by_ids(page_ids):
         document = (
             f"Page id: {record[1]}, space key: {record[2]}, title: {record[3]}, "
             f"author: {record[4]}, created date: {record[5]}, last updated: {record[6]}, "
-            f"content: {record[7]}, comments: {record[8]}"
+            f"content: {decompress_text(record[7])}, comments: {decompress_text(record[8])}"
         )
         all_documents.append(document)
         retrieved_page_ids.append(record[1])
@@ -346,6 +527,28 @@ def mark_page_as_processed(page_id):
     return True
 
 
+def mark_pages_as_processed(page_ids):
+    """
+    Mark several pages as processed in the database in one transaction.
+    :param page_ids:
+    :return:
+    """
+    session = Session()
+    current_time = datetime.now()
+    records = {record.page_id: record for record in
+               session.query(PageProgress).filter(PageProgress.page_id.in_(page_ids)).all()}
+    for page_id in page_ids:
+        record = records.get(page_id)
+        if not record:
+            session.add(PageProgress(page_id=page_id, processed=True, processed_time=current_time))
+        else:
+            record.processed = True
+            record.processed_time = current_time
+    session.commit()
+    session.close()
+    return True
+
+
 def is_page_processed(page_id, last_updated):
     """
     Check if a page has already been processed.
@@ -389,6 +592,52 @@ def get_last_updated_timestamp(page_id):
         return None
 
 
+def get_last_updated_timestamps(page_ids):
+    """
+    Get the last updated timestamps for several pages in a single query.
+    :param page_ids:
+    :return: A dictionary of page ID to last updated timestamp, None for pages that are not in the database.
+    """
+    timestamps = {page_id: None for page_id in page_ids}
+    if not page_ids:
+        return timestamps
+    session = Session()
+    records = session.query(PageData.page_id, PageData.lastUpdated).filter(PageData.page_id.in_(page_ids)).all()
+    session.close()
+    for page_id, last_updated in records:
+        timestamps[page_id] = last_updated
+    return timestamps
+
+
+def get_qa_sync_states():
+    """
+    Get the sync state of every Q&A interaction pushed to Confluence.
+    :return: A dictionary of interaction ID to a tuple of the content hash and the Confluence page ID.
+    """
+    session = Session()
+    records = session.query(QASyncState.interaction_id, QASyncState.content_hash,
+                            QASyncState.confluence_page_id).all()
+    session.close()
+    return {interaction_id: (content_hash, page_id) for interaction_id, content_hash, page_id in records}
+
+
+def store_qa_sync_states(states):
+    """
+    Record the interactions pushed to Confluence in one transaction.
+    :param states: A list of tuples of the interaction ID, the content hash and the Confluence page ID.
+    :return:
+    """
+    if not states:
+        return
+    session = Session()
+    current_time = datetime.now()
+    for interaction_id, content_hash, page_id in states:
+        session.merge(QASyncState(interaction_id=interaction_id, content_hash=content_hash,
+                                  confluence_page_id=page_id, synced_at=current_time))
+    session.commit()
+    session.close()
+
+
 # Setup the database engine and create tables if they don't exist
 engine = create_engine('sqlite:///' + sql_file_path)
 Base.metadata.bind = engine
@@ -397,3 +646,5 @@ Base.metadata.create_all(engine)
 # Create a sessionmaker object to manage database sessions
 Session = sessionmaker(bind=engine)
 session = Session()
+# Thread-local sessions for long-lived workers, call ScopedSession.remove() when a unit of work is done
+ScopedSession = scoped_session(Session)
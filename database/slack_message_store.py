@@ -0,0 +1,165 @@
+# ./database/slack_message_store.py
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from configuration import slack_message_cache_size, slack_message_ttl_days
+from database.nur_database import Session, SlackMessageRecord, QAInteractions
+
+
+class SlackMessageStore:
+    """
+    Deduplication and thread lookup for Slack messages, shared by the slack bot and the event consumers.
+
+    Records live in an indexed database table so every process sees the same state, and a message can
+    only be claimed once across processes thanks to the unique message_ts. A bounded LRU cache in front
+    of the table answers repeated lookups without a query, and records older than the TTL are pruned,
+    so both memory and the table stay bounded regardless of uptime.
+    """
+
+    def __init__(self, cache_size=slack_message_cache_size, ttl_days=slack_message_ttl_days,
+                 prune_interval_seconds=3600):
+        """
+        Initializes the store.
+        :param cache_size: The maximum number of messages kept in memory.
+        :param ttl_days: The number of days a record is kept in the database.
+        :param prune_interval_seconds: The minimum time between two prunes of expired records.
+        """
+        self.cache_size = cache_size
+        self.ttl = timedelta(days=ttl_days)
+        self.prune_interval_seconds = prune_interval_seconds
+        self.last_prune_time = 0
+        # message_ts -> question text, or None for messages that did not start a thread
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def remember(self, message_ts, question_text=None):
+        with self.lock:
+            self.cache[message_ts] = question_text
+            self.cache.move_to_end(message_ts)
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def recall(self, message_ts):
+        """Return (found, question_text) from the in-memory cache."""
+        with self.lock:
+            if message_ts not in self.cache:
+                return False, None
+            self.cache.move_to_end(message_ts)
+            return True, self.cache[message_ts]
+
+    def is_processed(self, message_ts):
+        """
+        Check if a message was already claimed by any process.
+        :param message_ts:
+        :return: True if the message was processed.
+        """
+        found, _ = self.recall(message_ts)
+        if found:
+            return True
+        session = Session()
+        record = session.query(SlackMessageRecord).filter_by(message_ts=message_ts).first()
+        session.close()
+        if record:
+            self.remember(message_ts, record.question_text)
+            return True
+        return False
+
+    def claim(self, channel_id, message_ts, thread_ts=None, question_text=None):
+        """
+        Record a message as processed, unless another process already did.
+        :param channel_id:
+        :param message_ts:
+        :param thread_ts: The parent message timestamp for replies in a thread.
+        :param question_text: The question text for messages starting a thread.
+        :return: True if this call claimed the message, False if it was already claimed.
+        """
+        found, _ = self.recall(message_ts)
+        if found:
+            return False
+        session = Session()
+        try:
+            session.add(SlackMessageRecord(channel_id=channel_id, message_ts=message_ts, thread_ts=thread_ts,
+                                           question_text=question_text, received_at=datetime.now()))
+            session.commit()
+            claimed = True
+        except IntegrityError:
+            session.rollback()
+            claimed = False
+        finally:
+            session.close()
+        self.remember(message_ts, question_text)
+        self.prune_if_due()
+        return claimed
+
+    def mark_answered(self, channel_id, message_ts):
+        """
+        Record that a response was posted for a message, claiming it if it was not claimed yet.
+        :param channel_id:
+        :param message_ts:
+        :return: None
+        """
+        session = Session()
+        record = session.query(SlackMessageRecord).filter_by(message_ts=message_ts).first()
+        if record is None:
+            record = SlackMessageRecord(channel_id=channel_id, message_ts=message_ts, received_at=datetime.now())
+            session.add(record)
+        record.answered_at = datetime.now()
+        session.commit()
+        session.close()
+
+    def is_answered(self, message_ts):
+        """
+        Check if a response was posted for a message.
+        :param message_ts:
+        :return: True if the message was answered.
+        """
+        session = Session()
+        record = session.query(SlackMessageRecord).filter_by(message_ts=message_ts).first()
+        session.close()
+        return record is not None and record.answered_at is not None
+
+    def get_question(self, thread_ts):
+        """
+        Get the question a thread was started with.
+        Threads older than the store are looked up in the Q&A interactions.
+        :param thread_ts: The timestamp of the message that started the thread.
+        :return: The question text, or None if the thread was not started by a question.
+        """
+        if not thread_ts:
+            return None
+        found, question_text = self.recall(thread_ts)
+        if found:
+            return question_text
+        session = Session()
+        record = session.query(SlackMessageRecord).filter_by(message_ts=thread_ts).first()
+        if record:
+            found, question_text = True, record.question_text
+        else:
+            interaction = session.query(QAInteractions).filter_by(thread_id=thread_ts).first()
+            found, question_text = interaction is not None, interaction.question_text if interaction else None
+        session.close()
+        if found:
+            self.remember(thread_ts, question_text)
+        return question_text
+
+    def prune_if_due(self):
+        if time.monotonic() - self.last_prune_time >= self.prune_interval_seconds:
+            self.last_prune_time = time.monotonic()
+            self.prune_expired()
+
+    def prune_expired(self):
+        """
+        Delete records older than the TTL.
+        :return: The number of deleted records.
+        """
+        session = Session()
+        deleted_count = session.query(SlackMessageRecord).filter(
+            SlackMessageRecord.received_at < datetime.now() - self.ttl).delete()
+        session.commit()
+        session.close()
+        if deleted_count:
+            logging.info(f"Pruned {deleted_count} expired Slack message records")
+        return deleted_count
@@ -0,0 +1,190 @@
+# ./file_system/compression.py
+import logging
+import os
+import threading
+import zlib
+from configuration import compression_dictionary_path, compression_min_size, compression_level
+
+# Transparent compression of stored page text.
+# Every compressed value starts with a one byte tag naming its codec, so values written with any codec,
+# or before compression was enabled, can always be read back.
+# zstd with a dictionary trained on our pages is used when zstandard is installed (the zstd extra), bzip3 for
+# cold data when bzip3 is installed, and zlib from the standard library otherwise. The dictionary is trained
+# when the page store is compacted, see PageStore.compact.
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import bzip3
+except ImportError:
+    bzip3 = None
+
+TAG_RAW = b"\x00"
+TAG_ZLIB = b"l"
+TAG_ZSTD = b"z"
+TAG_BZIP3 = b"b"
+
+# Decompressors are not thread safe, every thread keeps its own
+thread_state = threading.local()
+dictionaries = {}  # dictionary ID -> zstandard.ZstdCompressionDict
+dictionaries_lock = threading.Lock()
+active_dictionary_id = None
+
+
+def load_dictionaries():
+    """Load the trained dictionaries, the most recent one is used to compress."""
+    global active_dictionary_id
+    if zstandard is None or not os.path.isdir(compression_dictionary_path):
+        return
+    with dictionaries_lock:
+        dictionary_files = sorted((entry for entry in os.scandir(compression_dictionary_path)
+                                   if entry.name.endswith(".dict")), key=lambda entry: entry.stat().st_mtime)
+        for entry in dictionary_files:
+            with open(entry.path, 'rb') as file:
+                dictionary = zstandard.ZstdCompressionDict(file.read())
+            dictionaries[dictionary.dict_id()] = dictionary
+            active_dictionary_id = dictionary.dict_id()
+
+
+def needs_dictionary():
+    """Tell whether a dictionary can be trained and none was trained yet."""
+    return zstandard is not None and active_dictionary_id is None
+
+
+def train_dictionary(samples, dictionary_size=112640):
+    """
+    Train a zstd dictionary on sample pages and make it the one used to compress.
+    Dictionaries are kept forever since pages compressed with them reference them by ID.
+
+    Args:
+    samples (list of str): Page texts representative of the corpus.
+    dictionary_size (int): The size of the dictionary in bytes.
+
+    Returns:
+    int: The ID of the new dictionary, or None when zstandard is not installed or the training failed.
+    """
+    global active_dictionary_id
+    if zstandard is None:
+        logging.warning("zstandard is not installed, no compression dictionary trained")
+        return None
+    try:
+        dictionary = zstandard.train_dictionary(dictionary_size, [sample.encode() for sample in samples])
+    except zstandard.ZstdError as e:
+        logging.warning(f"Could not train a compression dictionary on {len(samples)} pages: {e}")
+        return None
+    os.makedirs(compression_dictionary_path, exist_ok=True)
+    with open(os.path.join(compression_dictionary_path, f"{dictionary.dict_id()}.dict"), 'wb') as file:
+        file.write(dictionary.as_bytes())
+    with dictionaries_lock:
+        dictionaries[dictionary.dict_id()] = dictionary
+        active_dictionary_id = dictionary.dict_id()
+    logging.info(f"Trained compression dictionary {dictionary.dict_id()} on {len(samples)} pages")
+    return dictionary.dict_id()
+
+
+def get_zstd_compressor():
+    compressor = getattr(thread_state, "compressor", None)
+    if compressor is None or thread_state.compressor_dictionary_id != active_dictionary_id:
+        dictionary = dictionaries.get(active_dictionary_id)
+        compressor = zstandard.ZstdCompressor(level=compression_level, dict_data=dictionary) if dictionary \
+            else zstandard.ZstdCompressor(level=compression_level)
+        thread_state.compressor = compressor
+        thread_state.compressor_dictionary_id = active_dictionary_id
+    return compressor
+
+
+def get_zstd_decompressor(dictionary_id):
+    decompressors = thread_state.__dict__.setdefault("decompressors", {})
+    decompressor = decompressors.get(dictionary_id)
+    if decompressor is None:
+        if dictionary_id and dictionary_id not in dictionaries:
+            load_dictionaries()
+        dictionary = dictionaries.get(dictionary_id)
+        decompressor = zstandard.ZstdDecompressor(dict_data=dictionary) if dictionary else zstandard.ZstdDecompressor()
+        decompressors[dictionary_id] = decompressor
+    return decompressor
+
+
+def compress_text(text, cold=False):
+    """
+    Compress a text for storage.
+
+    Args:
+    text (str): The text.
+    cold (bool): Favour the compression ratio over speed, for data that is rarely read.
+
+    Returns:
+    bytes: The tagged compressed value, texts shorter than compression_min_size are stored raw.
+    """
+    return compress_bytes(text.encode(), cold)
+
+
+def compress_bytes(data, cold=False):
+    """
+    Compress the UTF-8 bytes of a text for storage, the same as compress_text for callers that encoded it already.
+
+    Args:
+    data (bytes): The UTF-8 bytes of the text.
+    cold (bool): Favour the compression ratio over speed, for data that is rarely read.
+
+    Returns:
+    bytes: The tagged compressed value, values shorter than compression_min_size are stored raw.
+    """
+    if len(data) < compression_min_size:
+        return TAG_RAW + data
+    if cold and bzip3 is not None:
+        return TAG_BZIP3 + bzip3.compress(data)
+    if zstandard is not None:
+        return TAG_ZSTD + get_zstd_compressor().compress(data)
+    return TAG_ZLIB + zlib.compress(data, 9 if cold else compression_level)
+
+
+def decompress_bytes(value):
+    """
+    Decompress a value written by compress_text to its UTF-8 bytes.
+    Values that were stored before compression was enabled are returned unchanged.
+
+    Raises:
+    RuntimeError: If the value was compressed with a codec that is not installed here.
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return value.encode()
+    value = bytes(value)
+    tag, data = value[:1], value[1:]
+    if tag == TAG_RAW:
+        return data
+    if tag == TAG_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("The value was compressed with zstd, install zstandard (the zstd extra) to read it")
+        dictionary_id = zstandard.get_frame_parameters(data).dict_id
+        return get_zstd_decompressor(dictionary_id).decompress(data)
+    if tag == TAG_ZLIB:
+        return zlib.decompress(data)
+    if tag == TAG_BZIP3:
+        if bzip3 is None:
+            raise RuntimeError("The value was compressed with bzip3, install bzip3 to read it")
+        return bzip3.decompress(data)
+    raise ValueError(f"Unknown compression tag {tag!r}")
+
+
+def decompress_text(value):
+    """
+    Decompress a value written by compress_text.
+
+    Args:
+    value (bytes or str): The stored value, str values were stored before compression was enabled.
+
+    Returns:
+    str: The text, or None for a None value.
+    """
+    if value is None or isinstance(value, str):
+        return value
+    return decompress_bytes(value).decode()
+
+
+load_dictionaries()
@@ -1,10 +1,12 @@
 # ./file_system/file_manager.py
 import os
-from configuration import file_system_path
+from configuration import file_system_path, page_storage
+from file_system.page_store import get_page_store
 
 # A module to manage file system operations.
 # Includes functionalities for creating, deleting, adding to, and listing files in the file_system_path directory.
 # The file_system_path directory is specified in the configuration.py file.
+# With page_storage = "packed" the files are kept in the page store, files still in the directory remain readable.
 
 
 class FileManager:
@@ -13,12 +15,14 @@ class FileManager:
 
     Attributes:
     file_system_path (str): The path to the directory where file operations are performed.
+    page_store (PageStore): The packed store holding the files, None when files are stored individually.
     """
     def __init__(self):
         """
         Initializes the FileManager with a specific directory path.
         """
         self.file_system_path = file_system_path
+        self.page_store = get_page_store() if page_storage == "packed" else None
 
     def create(self, file_name, file_content):
         """
@@ -31,10 +35,31 @@ class FileManager:
         Returns:
         str: Confirmation message that the file has been created.
         """
+        if self.page_store:
+            self.page_store.put(os.path.basename(file_name), file_content)
+            return f"File {file_name} has been created."
         with open(os.path.join(self.file_system_path, file_name), 'w') as file_object:
             file_object.write(file_content)
             return f"File {file_name} has been created."
 
+    def create_batch(self, files):
+        """
+        Create several files at once, atomically when they are kept in the page store.
+
+        Args:
+        files (dict): The content of each file, by file name.
+
+        Returns:
+        str: Confirmation message that the files have been created.
+        """
+        if self.page_store:
+            self.page_store.write_batch({os.path.basename(file_name): file_content
+                                         for file_name, file_content in files.items()})
+        else:
+            for file_name, file_content in files.items():
+                self.create(file_name, file_content)
+        return f"{len(files)} files have been created."
+
     def delete(self, file_name):
         """
         Delete a file from the file system path.
@@ -45,6 +70,9 @@ class FileManager:
         Returns:
         str: Confirmation message that the file has been deleted.
         """
+        if self.page_store and os.path.basename(file_name) in self.page_store:
+            self.page_store.delete(os.path.basename(file_name))
+            return f"File {file_name} has been deleted."
         os.remove(os.path.join(self.file_system_path, file_name))
         return f"File {file_name} has been deleted."
 
@@ -55,7 +83,10 @@ class FileManager:
         Returns:
         list: A list of file names in the directory.
         """
-        return os.listdir(self.file_system_path)
+        file_names = os.listdir(self.file_system_path)
+        if self.page_store:
+            file_names = list(dict.fromkeys(self.page_store.names() + file_names))
+        return file_names
 
     def add_content(self, file_name, file_content):
         """
@@ -68,10 +99,58 @@ class FileManager:
         Returns:
         str: Confirmation message that the file has been updated.
         """
+        if self.page_store:
+            existing_content = self.read(file_name) if self.exists(file_name) else ""
+            self.page_store.put(os.path.basename(file_name), existing_content + file_content)
+            return f"File {file_name} has been added."
         with open(os.path.join(self.file_system_path, file_name), 'a') as file_object:
             file_object.write(file_content)
             return f"File {file_name} has been added."
 
+    def exists(self, file_name):
+        if self.page_store and os.path.basename(file_name) in self.page_store:
+            return True
+        return os.path.exists(os.path.join(self.file_system_path, file_name))
+
+    def size(self, file_name):
+        """
+        Get the size of a file without reading it.
+
+        Args:
+        file_name (str): The name of the file.
+
+        Returns:
+        int: The size of the content in bytes, or None if the file does not exist.
+        """
+        if self.page_store:
+            size = self.page_store.content_size(os.path.basename(file_name))
+            if size is not None:
+                return size
+        try:
+            return os.path.getsize(os.path.join(self.file_system_path, file_name))
+        except OSError:
+            return None
+
+    def version(self, file_name):
+        """
+        Get a token that changes whenever a file is written, without reading it.
+
+        Args:
+        file_name (str): The name of the file.
+
+        Returns:
+        tuple: The version of the file, or None if the file does not exist.
+        """
+        if self.page_store:
+            version = self.page_store.content_version(os.path.basename(file_name))
+            if version is not None:
+                return version
+        try:
+            stat = os.stat(os.path.join(self.file_system_path, file_name))
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
     def read(self, file_name):
         """
         Read and return the content of a file in the file system path.
@@ -82,6 +161,9 @@ class FileManager:
         Returns:
         str: The content of the file.
         """
+        if self.page_store:
+            file_content = self.page_store.read(os.path.basename(file_name))
+            if file_content is not None:
+                return file_content
         with open(os.path.join(self.file_system_path, file_name), 'r') as file_object:
             return file_object.read()
-
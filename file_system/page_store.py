@@ -0,0 +1,351 @@
+# ./file_system/page_store.py
+import logging
+import mmap
+import os
+import struct
+import threading
+from collections import OrderedDict
+from filelock import FileLock
+from configuration import page_store_path, file_system_path
+from configuration import page_store_compression, page_store_decompressed_cache_size
+from configuration import compression_dictionary_min_pages, compression_dictionary_sample_count
+from file_system.compression import compress_bytes, decompress_bytes, needs_dictionary, train_dictionary
+
+# A packed, append-only store for page contents.
+# All pages live in a single data file of records, an in-memory index maps every page to the offset and length
+# of its latest version, and reads are served from a memory map of the file.
+
+RECORD_HEADER = struct.Struct("<4sBII")  # magic, record type, name length, content length
+RECORD_MAGIC = b"PGS1"
+RECORD_PAGE = 0
+RECORD_DELETE = 1
+RECORD_COMMIT = 2  # Ends a batch, records after the last commit are discarded when the store is opened
+RECORD_BEGIN = 3  # Starts a batch, discarding the records of a batch torn by a crash before it
+RECORD_COMPRESSED_PAGE = 4  # A page whose content is its UTF-8 size followed by the output of compress_bytes
+COMPRESSED_SIZE = struct.Struct("<I")  # UTF-8 size of a compressed page, read without decompressing it
+
+
+class PageStore:
+    """
+    Page contents packed in one append-only data file with an offset index and memory-mapped reads.
+
+    Writes are batched: a batch is appended with a single write followed by a commit record and an fsync,
+    so after a crash either the whole batch or none of it is visible. Rewritten and deleted pages leave
+    garbage in the file until compact() rewrites it with the live pages only. Appends and compactions hold
+    a file lock shared by every process, so a batch torn by a crash is cut off before the next append and
+    no batch is appended to a file being compacted. Other processes appending to or compacting the file are
+    picked up on the next read. Pages are compressed when page_store_compression is set, the most recently
+    read ones are kept decompressed in memory.
+    """
+
+    def __init__(self, directory=page_store_path):
+        """
+        Initializes the store, creating the data file if needed and loading its index.
+
+        Args:
+        directory (str): The directory holding the data file.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.data_path = os.path.join(directory, "pages.dat")
+        self.lock = threading.RLock()
+        self.file_lock = FileLock(self.data_path + ".lock")  # Held by the writers of every process
+        self.index = {}  # name -> (content offset, content length, record type, UTF-8 size of the page)
+        self.decompressed = OrderedDict()  # name -> decompressed content of recently read compressed pages
+        self.mmap = None
+        self.mapped_size = 0
+        self.scanned_size = 0  # End of the last committed batch loaded in the index
+        self.seen_stat = None  # Size and modification time of the file at the last refresh
+        self.file_id = None
+        self.garbage_bytes = 0
+        self.open()
+
+    def open(self):
+        with self.lock, self.file_lock:
+            if not os.path.exists(self.data_path):
+                open(self.data_path, 'ab').close()
+            self.index = {}
+            self.decompressed.clear()
+            self.scanned_size = 0
+            self.seen_stat = None
+            self.garbage_bytes = 0
+            self.mmap = None
+            self.mapped_size = 0
+            self.file_id = os.stat(self.data_path).st_ino
+            self.refresh()
+            self.truncate_torn_batch()
+
+    def truncate_torn_batch(self):
+        """
+        Cut off the records after the last committed batch, left by a writer that crashed.
+        Must be called holding the file lock, when no other process can be appending a batch.
+        """
+        if self.seen_stat[0] == self.scanned_size:
+            return
+        logging.warning(f"Discarding {self.seen_stat[0] - self.scanned_size} bytes of a torn batch in {self.data_path}")
+        os.truncate(self.data_path, self.scanned_size)
+        self.refresh()
+
+    def remap(self, size):
+        if size == self.mapped_size:
+            return
+        with open(self.data_path, 'rb') as file:
+            # Views handed out on the previous map stay valid, the old map is released with its last view
+            self.mmap = mmap.mmap(file.fileno(), size, access=mmap.ACCESS_READ) if size else None
+        self.mapped_size = size
+
+    def refresh(self):
+        """Load the records appended since the last scan, reopening the store if the file was compacted."""
+        with self.lock:
+            stat = os.stat(self.data_path)
+            if stat.st_ino != self.file_id:
+                self.open()
+                return
+            # The modification time tells a torn batch cut off and replaced by one of the same size
+            if (stat.st_size, stat.st_mtime_ns) == self.seen_stat:
+                return
+            self.seen_stat = (stat.st_size, stat.st_mtime_ns)
+            self.remap(stat.st_size)
+            pending = []
+            offset = committed_offset = self.scanned_size
+            while offset + RECORD_HEADER.size <= stat.st_size:
+                magic, record_type, name_length, content_length = RECORD_HEADER.unpack_from(self.mmap, offset)
+                end = offset + RECORD_HEADER.size + name_length + content_length
+                if magic != RECORD_MAGIC or end > stat.st_size:
+                    break  # A batch torn by a crash or still being written by another process
+                name_start = offset + RECORD_HEADER.size
+                if record_type == RECORD_BEGIN:
+                    pending = []
+                elif record_type == RECORD_COMMIT:
+                    for pending_type, name, content_offset, length in pending:
+                        self.apply(pending_type, name, content_offset, length)
+                    pending = []
+                    committed_offset = end
+                else:
+                    name = bytes(self.mmap[name_start:name_start + name_length]).decode()
+                    pending.append((record_type, name, name_start + name_length, content_length))
+                offset = end
+            self.scanned_size = committed_offset
+
+    def apply(self, record_type, name, content_offset, content_length):
+        previous = self.index.pop(name, None)
+        self.decompressed.pop(name, None)
+        if previous:
+            self.garbage_bytes += previous[1]
+        if record_type == RECORD_PAGE:
+            self.index[name] = (content_offset, content_length, record_type, content_length)
+        elif record_type == RECORD_COMPRESSED_PAGE:
+            size = COMPRESSED_SIZE.unpack_from(self.mmap, content_offset)[0]
+            self.index[name] = (content_offset, content_length, record_type, size)
+
+    @staticmethod
+    def pack(record_type, name=b"", content=b""):
+        return RECORD_HEADER.pack(RECORD_MAGIC, record_type, len(name), len(content)) + name + content
+
+    @staticmethod
+    def pack_page(name, content):
+        data = content.encode()
+        if page_store_compression:
+            return PageStore.pack(RECORD_COMPRESSED_PAGE, name.encode(),
+                                  COMPRESSED_SIZE.pack(len(data)) + compress_bytes(data))
+        return PageStore.pack(RECORD_PAGE, name.encode(), data)
+
+    def write_batch(self, pages=None, deleted=()):
+        """
+        Atomically write and delete pages.
+
+        Args:
+        pages (dict): The content of each page to write, by name.
+        deleted (iterable): The names of the pages to delete.
+        """
+        records = [self.pack_page(name, content) for name, content in (pages or {}).items()]
+        records += [self.pack(RECORD_DELETE, name.encode()) for name in deleted]
+        if not records:
+            return
+        records = [self.pack(RECORD_BEGIN)] + records + [self.pack(RECORD_COMMIT)]
+        with self.lock, self.file_lock:
+            # Picks up a compaction by another process, then appends right after the last committed batch
+            self.refresh()
+            self.truncate_torn_batch()
+            with open(self.data_path, 'ab') as file:
+                file.write(b"".join(records))
+                file.flush()
+                os.fsync(file.fileno())
+            self.refresh()
+
+    def put(self, name, content):
+        self.write_batch({name: content})
+
+    def delete(self, name):
+        if name in self:
+            self.write_batch(deleted=[name])
+
+    def get_view(self, name, start=0, end=None):
+        """
+        Get a view of the UTF-8 content of a page, zero-copy for uncompressed pages.
+
+        Args:
+        name (str): The page name.
+        start (int): The first byte of the slice.
+        end (int): The end of the slice in bytes, None for the end of the page.
+
+        Returns:
+        memoryview: The bytes of the page, or None if the page is not in the store.
+        """
+        with self.lock:
+            self.refresh()
+            location = self.index.get(name)
+            if location is None:
+                return None
+            offset, length, record_type, _ = location
+            if record_type == RECORD_COMPRESSED_PAGE:
+                return memoryview(self.get_decompressed(name, offset, length))[start:end]
+            end = length if end is None else min(end, length)
+            return memoryview(self.mmap)[offset + start:offset + end]
+
+    def get_decompressed(self, name, offset, length):
+        content = self.decompressed.get(name)
+        if content is None:
+            content = decompress_bytes(self.mmap[offset + COMPRESSED_SIZE.size:offset + length])
+            self.decompressed[name] = content
+            if len(self.decompressed) > page_store_decompressed_cache_size:
+                self.decompressed.popitem(last=False)
+        self.decompressed.move_to_end(name)
+        return content
+
+    def content_size(self, name):
+        """
+        Get the size in bytes of the UTF-8 content of a page, or None if the page is not in the store.
+        The size is recorded when the page is written, compressed pages are not decompressed.
+        """
+        with self.lock:
+            self.refresh()
+            location = self.index.get(name)
+            return location[3] if location is not None else None
+
+    def content_version(self, name):
+        """
+        Get a token that changes whenever a page is written again, without reading the page.
+
+        Returns:
+        tuple: The data file and the location of the latest version of the page, or None if it is not in the store.
+        """
+        with self.lock:
+            self.refresh()
+            location = self.index.get(name)
+            return (self.file_id, location[0], location[1]) if location is not None else None
+
+    def read(self, name):
+        """Read the content of a page, or None if the page is not in the store."""
+        view = self.get_view(name)
+        return str(view, 'utf-8') if view is not None else None
+
+    def names(self):
+        with self.lock:
+            self.refresh()
+            return list(self.index)
+
+    def __contains__(self, name):
+        with self.lock:
+            self.refresh()
+            return name in self.index
+
+    def stats(self):
+        """
+        Get the size of the store.
+
+        Returns:
+        dict: The number of pages, the live and total bytes of the data file and the share of garbage.
+        """
+        with self.lock:
+            self.refresh()
+            total_bytes = self.scanned_size
+            return {"pages": len(self.index), "live_bytes": sum(location[1] for location in self.index.values()),
+                    "file_bytes": total_bytes,
+                    "garbage_ratio": self.garbage_bytes / total_bytes if total_bytes else 0.0}
+
+    def dictionary_due(self):
+        """Tell whether the next compaction trains a compression dictionary."""
+        return page_store_compression and needs_dictionary() and len(self.index) >= compression_dictionary_min_pages
+
+    def train_dictionary(self):
+        """Train the compression dictionary on a sample of the pages, returns whether one was trained."""
+        names = list(self.index)
+        step = max(len(names) // compression_dictionary_sample_count, 1)
+        samples = [str(self.get_view(name), 'utf-8') for name in names[::step][:compression_dictionary_sample_count]]
+        return train_dictionary(samples) is not None
+
+    def compact(self):
+        """
+        Rewrite the data file with the latest version of the live pages only.
+        Writers of every process wait for the rewrite and append to the new file.
+        When the store is large enough and zstandard is installed, a compression dictionary is trained first
+        and every page is compressed again with it.
+        """
+        with self.lock, self.file_lock:
+            self.refresh()
+            recompress = self.dictionary_due() and self.train_dictionary()
+            temporary_path = self.data_path + ".compact"
+            with open(temporary_path, 'wb') as file:
+                file.write(self.pack(RECORD_BEGIN))
+                for name, (offset, length, record_type, _) in self.index.items():
+                    if recompress:
+                        file.write(self.pack_page(name, str(self.get_view(name), 'utf-8')))
+                        continue
+                    file.write(RECORD_HEADER.pack(RECORD_MAGIC, record_type, len(name.encode()), length))
+                    file.write(name.encode())
+                    file.write(self.mmap[offset:offset + length])
+                file.write(self.pack(RECORD_COMMIT))
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary_path, self.data_path)
+            before_bytes = self.scanned_size
+            self.open()
+            logging.info(f"Compacted the page store from {before_bytes} to {self.scanned_size} bytes")
+
+    def compact_if_needed(self, min_garbage_ratio=0.5):
+        if self.stats()["garbage_ratio"] >= min_garbage_ratio or self.dictionary_due():
+            self.compact()
+
+
+page_store = None
+page_store_lock = threading.Lock()
+
+
+def get_page_store():
+    """Get the page store shared by this process."""
+    global page_store
+    with page_store_lock:
+        if page_store is None:
+            page_store = PageStore()
+        return page_store
+
+
+def import_page_files(directory=file_system_path, batch_size=500):
+    """
+    Move the page files of a directory into the page store, in batches.
+
+    Args:
+    directory (str): The directory holding the {page_id}.txt files.
+    batch_size (int): The number of pages written per batch.
+
+    Returns:
+    int: The number of imported pages.
+    """
+    store = get_page_store()
+    file_names = [file_name for file_name in os.listdir(directory) if file_name.endswith(".txt")]
+    for batch_start in range(0, len(file_names), batch_size):
+        batch = {}
+        for file_name in file_names[batch_start:batch_start + batch_size]:
+            with open(os.path.join(directory, file_name), 'r') as file:
+                batch[file_name] = file.read()
+        store.write_batch(batch)
+        for file_name in batch:
+            os.remove(os.path.join(directory, file_name))
+    store.compact_if_needed()
+    logging.info(f"Imported {len(file_names)} page files into the page store")
+    return len(file_names)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    import_page_files()
@@ -0,0 +1,97 @@
+# ./gpt_4t/chat_answer_engine.py
+import logging
+import threading
+from configuration import model_id, conversation_max_turns, chat_max_tokens
+from context.prepare_context import format_related_interactions_as_context
+from context.prompt_builder import build_chat_messages, format_pages_for_prompt, record_prompt_usage
+from database.nur_database import ScopedSession, ConversationManager
+from network.service_registry import get_openai_client
+from telemetry.latency import span
+
+
+class ChatAnswerEngine:
+    """
+    Answers questions with a single chat completion call.
+
+    The conversation of a Slack thread is kept in our database under the thread ts and its latest turns
+    are replayed before each new question, so follow-ups keep their context without an Assistants thread,
+    run, polling loop or message listing.
+    """
+
+    def __init__(self, client=None, max_turns=conversation_max_turns):
+        """
+        Initializes the engine.
+
+        Args:
+        client (OpenAI): The OpenAI client, the shared one is used when None.
+        max_turns (int): The maximum number of previous turns replayed with a question.
+        """
+        self.client = client or get_openai_client()
+        self.max_turns = max_turns
+
+    def answer(self, question, page_ids, conversation_id, related_interactions=None):
+        """
+        Answer a question in a conversation.
+
+        Args:
+        question (str): The question.
+        page_ids (list): The IDs of the retrieved pages, most relevant first.
+        conversation_id (str): The Slack thread ts of the conversation.
+        related_interactions (list, optional): Previously answered questions to include in the context.
+
+        Returns:
+        tuple: The answer, or "No response received." if the model returned none, and the conversation ID.
+        """
+        conversation_manager = ConversationManager(ScopedSession)
+        try:
+            previous_turns = conversation_manager.get_turns(conversation_id, self.max_turns) if conversation_id else []
+            messages = build_chat_messages(question, format_pages_for_prompt(page_ids),
+                                           format_related_interactions_as_context(related_interactions))
+            # Instructions, then the previous turns, then the new question with its pages
+            messages = messages[:1] + previous_turns + messages[1:]
+            with span("llm_completion", engine="chat"):
+                response = self.client.chat.completions.create(model=model_id, messages=messages, temperature=0,
+                                                               max_tokens=chat_max_tokens)
+            record_prompt_usage(response.usage, "Chat")
+            answer = response.choices[0].message.content if response.choices else None
+            if not answer:
+                return "No response received.", conversation_id
+            if conversation_id:
+                # Only the question is stored, the pages are retrieved again for every follow-up
+                conversation_manager.add_exchange(conversation_id, question, answer)
+            return answer, conversation_id
+        finally:
+            ScopedSession.remove()
+
+
+chat_answer_engine = None
+chat_answer_engine_lock = threading.Lock()
+
+
+def get_chat_answer_engine():
+    """Get the engine shared by the event consumers of this process."""
+    global chat_answer_engine
+    with chat_answer_engine_lock:
+        if chat_answer_engine is None:
+            chat_answer_engine = ChatAnswerEngine()
+        return chat_answer_engine
+
+
+def query_chat_with_context(question, page_ids, thread_id=None, related_interactions=None):
+    """
+    Queries the model with a question and its context, a drop-in replacement of the assistant query.
+
+    Args:
+    question (str): The question to be asked.
+    page_ids (list): A list of page IDs to include in the context.
+    thread_id (str, optional): The Slack thread ts of the conversation, None for a one-off question.
+    related_interactions (list, optional): Previously answered questions to include in the context.
+
+    Returns:
+    tuple: The answer and the thread ID.
+    """
+    if not isinstance(page_ids, list):
+        page_ids = [page_ids]
+    answer, thread_id = get_chat_answer_engine().answer(question, page_ids, thread_id, related_interactions)
+    logging.info(f"Chat answer generated for thread {thread_id}")
+    return answer, thread_id
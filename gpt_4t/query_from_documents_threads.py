@@ -1,10 +1,8 @@
 # ./gpt_4t/query_from_documents_threads.py
-from openai import OpenAI
-from credentials import oai_api_key
-from configuration import file_system_path
+import logging
 from configuration import model_id
-
-client = OpenAI(api_key=oai_api_key)
+from context.prompt_builder import build_chat_messages, format_pages_for_prompt, record_prompt_usage
+from network.service_registry import get_openai_client
 
 
 def get_response_from_gpt_4t(question, context):
@@ -19,23 +17,10 @@ def get_response_from_gpt_4t(question, context):
     str: The response from the GPT-4T model.
     """
     try:
-        response = client.chat.completions.create(
+        response = get_openai_client().chat.completions.create(
             model=model_id,
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are the Q&A based on knowledge base assistant.\n"
-                               "You will always review and refer to the pages included as context. \n"
-                               "You will always answer from the pages.\n"
-                               "You will never improvise or create content from outside the files.\n"
-                               "If you do not have the answer based on the files you will clearly state that and abstain from answering.\n"
-                               "If you use your knowledge to explain some information from outside the file, you will clearly state that.\n"
-                },
-                {
-                    "role": "user",
-                    "content": f"You will answer the following question with a summary, then provide a comprehensive answer, then provide the references aliasing them as Technical trace:  \nquestion: {question}\npages:{context}"
-                }
-            ],
+            # Instructions and pages come before the question so repeated questions share a cached prefix
+            messages=build_chat_messages(question, context),
             temperature=0,
             max_tokens=4095,
             top_p=1,
@@ -43,9 +28,10 @@ def get_response_from_gpt_4t(question, context):
             presence_penalty=0
         )
     except Exception as e:
-        print(f"Error querying GPT-4T: {e}")
+        logging.error(f"Error querying GPT-4T: {e}")
         return None
     if response:
+        record_prompt_usage(response.usage, "GPT-4T")
         answer = response.choices[0].message.content
         return answer
     else:
@@ -55,7 +41,7 @@ def get_response_from_gpt_4t(question, context):
 def format_pages_as_context(file_ids):
     """
     Adds specified files to the question's context for referencing in responses,
-    including the document title and space key.
+    including the document title and space key, in page ID order so the prompt prefix can be cached.
 
     Args:
     file_ids (list of str): List of file IDs to be added to the assistant.
@@ -63,25 +49,7 @@ def format_pages_as_context(file_ids):
     Returns:
     str: The formatted context.
     """
-    context = None
-    for file_id in file_ids:
-        if not context:
-            context = ""
-        chosen_file_path = file_system_path + f"/{file_id}.txt"
-        # Open file and extract title and space key
-        try:
-            with open(chosen_file_path, 'r') as file:
-                file_content = file.read()
-                title = file_content.split('title: ')[1].split('\n')[0].strip()
-                space_key = file_content.split('spaceKey: ')[1].split('\n')[0].strip()
-
-                context += f"\nDocument Title: {title}\nSpace Key: {space_key}\n\n"
-                context += file_content
-
-            print(f"File {file_id} (Title: {title}, Space Key: {space_key}) appended to context successfully")
-
-        except Exception as e:
-            print(f"Error appending file {file_id} to context: {e}")
+    context = format_pages_for_prompt(file_ids, max_length=None)
     if context:
         return context
     else:
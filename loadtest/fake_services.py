@@ -0,0 +1,436 @@
+# ./loadtest/fake_services.py
+import base64
+import itertools
+import json
+import logging
+import random
+import re
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from configuration import loadtest_openai_latency_seconds, loadtest_confluence_latency_seconds
+from configuration import loadtest_slack_latency_seconds, loadtest_error_rate, loadtest_rate_limit_rate
+from configuration import loadtest_retry_after_seconds, benchmark_embedding_dimension
+from benchmark.corpus import generate_raw_page, fake_embedding, FIRST_PAGE_ID
+
+# Local stand-ins for OpenAI, Confluence and Slack.
+# They answer the requests our clients send with responses of the same shape, after a configurable latency,
+# and fail a configurable share of them with server errors or rate limit responses, so the whole question
+# pipeline can be load tested without any external service.
+
+
+class ServiceBehaviour:
+    """Latency and failures injected by a fake service"""
+
+    def __init__(self, latency_seconds=0.0, jitter=0.2, error_rate=loadtest_error_rate,
+                 rate_limit_rate=loadtest_rate_limit_rate, retry_after_seconds=loadtest_retry_after_seconds):
+        """
+        Args:
+        latency_seconds (float or dict): The mean latency, or the mean latency by route name with a "default".
+        jitter (float): The share of the latency drawn at random around the mean.
+        error_rate (float): The share of requests answered with a 500.
+        rate_limit_rate (float): The share of requests answered with a 429 and a Retry-After header.
+        retry_after_seconds (int): The Retry-After of the rate limit responses.
+        """
+        self.latency_seconds = latency_seconds
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after_seconds = retry_after_seconds
+
+    def latency(self, route_name, generator):
+        latency = self.latency_seconds
+        if isinstance(latency, dict):
+            latency = latency.get(route_name, latency.get("default", 0.0))
+        return max(latency * (1 + generator.uniform(-self.jitter, self.jitter)), 0.0)
+
+
+class FakeServiceRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.service.handle(self, "GET")
+
+    def do_POST(self):
+        self.server.service.handle(self, "POST")
+
+    def do_PUT(self):
+        self.server.service.handle(self, "PUT")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeService:
+    """
+    A fake HTTP service answering JSON requests by route.
+
+    Subclasses register their routes with route(); a route handler receives the path match, the query and the
+    JSON body and returns the status and JSON payload of the response.
+    """
+
+    name = "service"
+
+    def __init__(self, behaviour=None, seed=0):
+        self.behaviour = behaviour or ServiceBehaviour()
+        self.routes = []  # (method, compiled path pattern, route name, handler)
+        self.generator = random.Random(seed)
+        self.generator_lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "rate_limited": 0, "unknown": 0}
+        self.server = None
+
+    def route(self, method, pattern, name, handler):
+        self.routes.append((method, re.compile(pattern + "$"), name, handler))
+
+    def count(self, key):
+        with self.stats_lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def draw(self, route_name):
+        with self.generator_lock:
+            latency = self.behaviour.latency(route_name, self.generator)
+            failure_draw = self.generator.random()
+        if failure_draw < self.behaviour.rate_limit_rate:
+            return latency, "rate_limited"
+        if failure_draw < self.behaviour.rate_limit_rate + self.behaviour.error_rate:
+            return latency, "error"
+        return latency, None
+
+    def handle(self, request, method):
+        url = urlparse(request.path)
+        length = int(request.headers.get("Content-Length") or 0)
+        raw_body = request.rfile.read(length) if length else b""
+        try:
+            body = json.loads(raw_body) if raw_body else {}
+        except ValueError:
+            body = {key: values[0] for key, values in parse_qs(raw_body.decode()).items()}
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        self.count("requests")
+        for route_method, pattern, name, handler in self.routes:
+            match = pattern.match(url.path)
+            if route_method == method and match:
+                break
+        else:
+            self.count("unknown")
+            return self.respond(request, 404, {"error": f"No fake route for {method} {url.path}"})
+        latency, failure = self.draw(name)
+        time.sleep(latency)
+        if failure == "rate_limited":
+            self.count("rate_limited")
+            return self.respond(request, 429, self.rate_limit_payload(),
+                                {"Retry-After": str(self.behaviour.retry_after_seconds)})
+        if failure == "error":
+            self.count("errors")
+            return self.respond(request, 500, {"error": "Injected server error"})
+        self.count(name)
+        status, payload = handler(match, query, body)
+        self.respond(request, status, payload)
+
+    def rate_limit_payload(self):
+        return {"error": "rate limited"}
+
+    @staticmethod
+    def respond(request, status, payload, headers=None):
+        data = json.dumps(payload).encode()
+        request.send_response(status)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            request.send_header(name, value)
+        request.end_headers()
+        request.wfile.write(data)
+
+    def start(self, host="127.0.0.1", port=0):
+        """
+        Serve the fake service from a background thread.
+
+        Returns:
+        str: The base URL of the service.
+        """
+        self.server = ThreadingHTTPServer((host, port), FakeServiceRequestHandler)
+        self.server.daemon_threads = True
+        self.server.service = self
+        threading.Thread(target=self.server.serve_forever, name=f"fake-{self.name}", daemon=True).start()
+        logging.info(f"Fake {self.name} listening on {self.base_url}")
+        return self.base_url
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+class FakeOpenAI(FakeService):
+    """Embeddings, chat completions and the assistant threads, messages and runs"""
+
+    name = "openai"
+
+    def __init__(self, behaviour=None, seed=0, dimension=benchmark_embedding_dimension):
+        super().__init__(behaviour or ServiceBehaviour(loadtest_openai_latency_seconds), seed)
+        self.dimension = dimension
+        self.ids = itertools.count(1)
+        self.runs = {}  # run ID -> (thread ID, created_at, run duration)
+        self.messages = {}  # thread ID -> messages, newest first
+        self.lock = threading.Lock()
+        self.route("POST", r"/(v1/)?embeddings", "embeddings", self.embeddings)
+        self.route("POST", r"/(v1/)?chat/completions", "chat", self.chat_completion)
+        self.route("POST", r"/(v1/)?threads", "threads", self.create_thread)
+        self.route("POST", r"/(v1/)?threads/(?P<thread_id>[^/]+)/messages", "messages", self.create_message)
+        self.route("GET", r"/(v1/)?threads/(?P<thread_id>[^/]+)/messages", "messages", self.list_messages)
+        self.route("POST", r"/(v1/)?threads/(?P<thread_id>[^/]+)/runs", "runs", self.create_run)
+        self.route("GET", r"/(v1/)?threads/(?P<thread_id>[^/]+)/runs/(?P<run_id>[^/]+)", "runs", self.get_run)
+
+    def rate_limit_payload(self):
+        return {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}
+
+    def new_id(self, prefix):
+        return f"{prefix}_{next(self.ids)}"
+
+    def embeddings(self, match, query, body):
+        texts = body.get("input", [])
+        texts = [texts] if isinstance(texts, str) else texts
+        dimension = body.get("dimensions") or self.dimension
+        data = []
+        for index, text in enumerate(texts):
+            embedding = fake_embedding(str(text), dimension)
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(struct.pack(f"<{len(embedding)}f", *embedding)).decode()
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+        tokens = sum(len(str(text)) // 4 for text in texts)
+        return 200, {"object": "list", "data": data, "model": body.get("model"),
+                     "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+    @staticmethod
+    def answer_text(question):
+        return (f"Summary: this is a load test answer.\n\nAnswer: the pages describe how to handle "
+                f"\"{question[:200]}\".\n\nTechnical trace: load test pages.")
+
+    def chat_completion(self, match, query, body):
+        messages = body.get("messages", [])
+        prompt_tokens = sum(len(str(message.get("content", ""))) for message in messages) // 4
+        answer = self.answer_text(str(messages[-1].get("content", "")) if messages else "")
+        return 200, {"id": self.new_id("chatcmpl"), "object": "chat.completion", "created": int(time.time()),
+                     "model": body.get("model"),
+                     "choices": [{"index": 0, "message": {"role": "assistant", "content": answer},
+                                  "finish_reason": "stop"}],
+                     "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(answer) // 4,
+                               "total_tokens": prompt_tokens + len(answer) // 4,
+                               "prompt_tokens_details": {"cached_tokens": 0}}}
+
+    def create_thread(self, match, query, body):
+        thread_id = self.new_id("thread")
+        with self.lock:
+            self.messages[thread_id] = []
+        return 200, {"id": thread_id, "object": "thread", "created_at": int(time.time()), "metadata": {}}
+
+    def message(self, thread_id, role, text):
+        return {"id": self.new_id("msg"), "object": "thread.message", "created_at": int(time.time()),
+                "thread_id": thread_id, "role": role, "file_ids": [], "metadata": {},
+                "content": [{"type": "text", "text": {"value": text, "annotations": []}}]}
+
+    def create_message(self, match, query, body):
+        thread_id = match.group("thread_id")
+        content = body.get("content", "")
+        message = self.message(thread_id, "user", content if isinstance(content, str) else json.dumps(content))
+        with self.lock:
+            self.messages.setdefault(thread_id, []).insert(0, message)
+        return 200, message
+
+    def list_messages(self, match, query, body):
+        with self.lock:
+            messages = list(self.messages.get(match.group("thread_id"), []))
+        return 200, {"object": "list", "data": messages, "has_more": False,
+                     "first_id": messages[0]["id"] if messages else None,
+                     "last_id": messages[-1]["id"] if messages else None}
+
+    def run(self, run_id, thread_id, assistant_id, created_at, duration):
+        elapsed = time.time() - created_at
+        run = {"id": run_id, "object": "thread.run", "thread_id": thread_id, "assistant_id": assistant_id,
+               "created_at": int(created_at), "status": "queued", "model": "fake", "instructions": "",
+               "tools": [], "file_ids": [], "metadata": {}}
+        started_at = created_at + duration * 0.1
+        if elapsed >= duration:
+            run.update(status="completed", started_at=int(started_at), completed_at=int(created_at + duration),
+                       usage={"prompt_tokens": 1000, "completion_tokens": 100, "total_tokens": 1100})
+        elif elapsed >= duration * 0.1:
+            run.update(status="in_progress", started_at=int(started_at))
+        return run
+
+    def create_run(self, match, query, body):
+        thread_id = match.group("thread_id")
+        run_id = self.new_id("run")
+        with self.generator_lock:
+            duration = self.behaviour.latency("run", self.generator)
+        created_at = time.time()
+        with self.lock:
+            self.runs[run_id] = (thread_id, body.get("assistant_id"), created_at, duration)
+            question = next((message["content"][0]["text"]["value"] for message in self.messages.get(thread_id, [])
+                             if message["role"] == "user"), "")
+        # The clients only list the messages once the run has completed, so the answer can be added right away
+        with self.lock:
+            self.messages.setdefault(thread_id, []).insert(0, self.message(thread_id, "assistant",
+                                                                           self.answer_text(question)))
+        return 200, self.run(run_id, thread_id, body.get("assistant_id"), created_at, duration)
+
+    def get_run(self, match, query, body):
+        with self.lock:
+            run = self.runs.get(match.group("run_id"))
+        if run is None:
+            return 404, {"error": {"message": "No such run"}}
+        return 200, self.run(match.group("run_id"), *run)
+
+
+class FakeConfluence(FakeService):
+    """Spaces, pages, comments and page history of a synthetic space"""
+
+    name = "confluence"
+
+    def __init__(self, behaviour=None, seed=0, page_count=1000, space_key="BENCH"):
+        super().__init__(behaviour or ServiceBehaviour(loadtest_confluence_latency_seconds), seed)
+        self.page_count = page_count
+        self.space_key = space_key
+        self.corpus_seed = seed
+        self.route("GET", r"/rest/api/space", "spaces", self.list_spaces)
+        self.route("GET", r"/rest/api/content", "pages", self.list_pages)
+        self.route("GET", r"/rest/api/content/(?P<content_id>[^/]+)", "content", self.get_content)
+        self.route("GET", r"/rest/api/content/(?P<content_id>[^/]+)/child/(?P<content_type>[^/]+)", "children",
+                   self.get_children)
+        self.route("GET", r"/rest/api/content/(?P<content_id>[^/]+)/history", "history", self.get_history)
+
+    def raw_page(self, page_id):
+        index = int(page_id) - FIRST_PAGE_ID
+        if not 0 <= index < self.page_count:
+            return None
+        return generate_raw_page(index, self.corpus_seed, self.space_key)
+
+    @staticmethod
+    def paginate(items, query):
+        start, limit = int(query.get("start", 0)), int(query.get("limit", 25))
+        return {"results": items[start:start + limit], "start": start, "limit": limit,
+                "size": len(items[start:start + limit]), "_links": {}}
+
+    def list_spaces(self, match, query, body):
+        return 200, self.paginate([{"key": self.space_key, "name": "Load test space", "type": "global"}], query)
+
+    def list_pages(self, match, query, body):
+        pages = [{"id": str(FIRST_PAGE_ID + index), "type": "page", "title": f"Page {index}"}
+                 for index in range(self.page_count)]
+        return 200, self.paginate(pages, query)
+
+    def get_content(self, match, query, body):
+        content_id = match.group("content_id")
+        if "c" in content_id:
+            # Comments are numbered after their page: {page_id}c{comment index}
+            page_id, comment_index = content_id.split("c", 1)
+            raw_page = self.raw_page(page_id)
+            if raw_page is None or int(comment_index) >= len(raw_page['comment_bodies']):
+                return 404, {"message": "No such comment"}
+            return 200, {"id": content_id, "type": "comment", "title": "Comment",
+                         "body": {"storage": {"value": raw_page['comment_bodies'][int(comment_index)],
+                                              "representation": "storage"}}}
+        raw_page = self.raw_page(content_id)
+        if raw_page is None:
+            return 404, {"message": "No such page"}
+        return 200, {"id": content_id, "type": "page", "title": raw_page['title'],
+                     "space": {"key": self.space_key},
+                     "body": {"storage": {"value": raw_page['body'], "representation": "storage"}},
+                     "history": {"createdBy": {"displayName": raw_page['author']},
+                                 "createdDate": raw_page['created_date']},
+                     "version": {"when": raw_page['last_updated'], "number": 1}}
+
+    def get_children(self, match, query, body):
+        content_id = match.group("content_id")
+        raw_page = self.raw_page(content_id) if "c" not in content_id else None
+        if raw_page is None or match.group("content_type") != "comment":
+            return 200, self.paginate([], query)
+        comments = [{"id": f"{content_id}c{index}", "type": "comment", "title": "Comment"}
+                    for index in range(len(raw_page['comment_bodies']))]
+        return 200, self.paginate(comments, query)
+
+    def get_history(self, match, query, body):
+        raw_page = self.raw_page(match.group("content_id"))
+        if raw_page is None:
+            return 404, {"message": "No such page"}
+        return 200, {"createdBy": {"displayName": raw_page['author']}, "createdDate": raw_page['created_date'],
+                     "lastUpdated": {"when": raw_page['last_updated']}}
+
+
+class FakeSlack(FakeService):
+    """The Web API methods the bot calls, recording when every thread receives a reply"""
+
+    name = "slack"
+
+    def __init__(self, behaviour=None, seed=0):
+        super().__init__(behaviour or ServiceBehaviour(loadtest_slack_latency_seconds), seed)
+        self.deliveries = {}  # thread ts -> time.time() of the first reply posted in the thread
+        self.deliveries_lock = threading.Lock()
+        self.route("POST", r"/(api/)?auth\.test", "auth.test", self.auth_test)
+        self.route("POST", r"/(api/)?chat\.postMessage", "chat.postMessage", self.post_message)
+        self.route("POST", r"/(api/)?chat\.update", "chat.update", self.update_message)
+        self.route("POST", r"/(api/)?chat\.getPermalink", "chat.getPermalink", self.get_permalink)
+        self.route("GET", r"/(api/)?chat\.getPermalink", "chat.getPermalink", self.get_permalink)
+
+    def rate_limit_payload(self):
+        return {"ok": False, "error": "ratelimited"}
+
+    def auth_test(self, match, query, body):
+        return 200, {"ok": True, "user_id": "ULOADTEST", "bot_id": "BLOADTEST", "team": "load test"}
+
+    def post_message(self, match, query, body):
+        thread_ts = body.get("thread_ts")
+        if thread_ts:
+            with self.deliveries_lock:
+                self.deliveries.setdefault(thread_ts, time.time())
+        return 200, {"ok": True, "channel": body.get("channel"), "ts": f"{time.time():.6f}",
+                     "message": {"text": body.get("text"), "thread_ts": thread_ts}}
+
+    def update_message(self, match, query, body):
+        return 200, {"ok": True, "channel": body.get("channel"), "ts": body.get("ts"), "text": body.get("text")}
+
+    def get_permalink(self, match, query, body):
+        parameters = {**query, **body}
+        return 200, {"ok": True, "channel": parameters.get("channel"),
+                     "permalink": f"https://loadtest.slack.invalid/archives/{parameters.get('channel')}"
+                                  f"/p{str(parameters.get('message_ts', '')).replace('.', '')}"}
+
+    def delivery_time(self, thread_ts):
+        with self.deliveries_lock:
+            return self.deliveries.get(thread_ts)
+
+
+def start_fake_services(page_count=1000, seed=0):
+    """
+    Start the three fake services.
+
+    Returns:
+    dict: The fake services by name.
+    """
+    services = {"openai": FakeOpenAI(seed=seed), "confluence": FakeConfluence(seed=seed, page_count=page_count),
+                "slack": FakeSlack(seed=seed)}
+    for service in services.values():
+        service.start()
+    return services
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    running_services = start_fake_services()
+    print("Export these variables in the processes under test:")
+    print(f"NUR_OPENAI_BASE_URL={running_services['openai'].base_url}/v1")
+    print(f"NUR_CONFLUENCE_BASE_URL={running_services['confluence'].base_url}")
+    print(f"NUR_SLACK_API_BASE_URL={running_services['slack'].base_url}/api/")
+    try:
+        while True:
+            time.sleep(60)
+            print({name: service.stats for name, service in running_services.items()})
+    except KeyboardInterrupt:
+        for running_service in running_services.values():
+            running_service.stop()
@@ -0,0 +1,116 @@
+# ./loadtest/load_generator.py
+import logging
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from benchmark.corpus import generate_questions
+
+# Open-loop load: questions arrive as a Poisson process at the target rate whatever the response times are,
+# so a saturated pipeline shows up as growing latencies instead of a slower arrival rate.
+# A question is answered when the fake Slack receives a reply in its thread.
+
+
+def percentile(values, share):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(share * len(ordered)), len(ordered) - 1)]
+
+
+class LoadGenerator:
+    """
+    Posts questions to the API at a target rate and measures when their answers reach Slack.
+    """
+
+    def __init__(self, api_url, slack, rate_per_second, duration_seconds, channel="CLOADTEST", seed=0):
+        """
+        Args:
+        api_url (str): The base URL of the API under test.
+        slack (FakeSlack): The fake Slack the answers are posted to.
+        rate_per_second (float): The mean number of questions posted per second.
+        duration_seconds (float): How long questions are posted for.
+        channel (str): The channel of the questions.
+        seed (int): The seed of the arrival times and questions.
+        """
+        self.api_url = api_url.rstrip("/")
+        self.slack = slack
+        self.rate_per_second = rate_per_second
+        self.duration_seconds = duration_seconds
+        self.channel = channel
+        self.generator = random.Random(seed)
+        self.questions = generate_questions(max(int(rate_per_second * duration_seconds * 2), 1), seed)
+        self.sent = {}  # question ts -> time.time() the question was posted
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def post_question(self, index, question):
+        ts = f"{time.time():.6f}"
+        event = {"text": question, "ts": ts, "thread_ts": ts, "channel": self.channel, "user": f"U{index % 100}"}
+        try:
+            response = requests.post(f"{self.api_url}/api/v1/questions", json=event, timeout=30)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            logging.warning(f"Question {index} was rejected by the API: {e}")
+            with self.lock:
+                self.rejected += 1
+            return
+        with self.lock:
+            self.sent[ts] = float(ts)
+
+    def run(self, drain_timeout_seconds=120):
+        """
+        Post the questions, then wait for their answers.
+
+        Args:
+        drain_timeout_seconds (float): How long to wait for the answers once the last question is posted.
+
+        Returns:
+        dict: The load test report.
+        """
+        started_at = time.time()
+        posted = 0
+        with ThreadPoolExecutor(max_workers=32) as posters:
+            next_arrival = started_at
+            while True:
+                next_arrival += self.generator.expovariate(self.rate_per_second)
+                if next_arrival - started_at >= self.duration_seconds:
+                    break
+                time.sleep(max(next_arrival - time.time(), 0))
+                posters.submit(self.post_question, posted, self.questions[posted % len(self.questions)])
+                posted += 1
+        deadline = time.time() + drain_timeout_seconds
+        while time.time() < deadline and len(self.answered()) < len(self.sent):
+            time.sleep(0.5)
+        return self.report(posted, time.time() - started_at)
+
+    def answered(self):
+        with self.lock:
+            sent = dict(self.sent)
+        latencies = {}
+        for ts, sent_at in sent.items():
+            delivered_at = self.slack.delivery_time(ts)
+            if delivered_at is not None:
+                latencies[ts] = delivered_at - sent_at
+        return latencies
+
+    def report(self, posted, elapsed_seconds):
+        latencies = list(self.answered().values())
+        return {
+            "target_rate_per_second": self.rate_per_second,
+            "duration_seconds": self.duration_seconds,
+            "posted": posted,
+            "rejected": self.rejected,
+            "answered": len(latencies),
+            "unanswered": len(self.sent) - len(latencies),
+            "throughput_per_second": len(latencies) / elapsed_seconds if elapsed_seconds else 0.0,
+            "end_to_end_seconds": {
+                "mean": statistics.fmean(latencies) if latencies else None,
+                "p50": percentile(latencies, 0.50),
+                "p95": percentile(latencies, 0.95),
+                "p99": percentile(latencies, 0.99),
+                "max": max(latencies) if latencies else None
+            }
+        }
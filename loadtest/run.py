@@ -0,0 +1,115 @@
+# ./loadtest/run.py
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import requests
+
+# Load test of the whole question path: the API and its consumers run in their own process against a scratch
+# data directory, OpenAI, Confluence and Slack are replaced by the local fake services.
+# Questions are posted to /api/v1/questions as the Slack listener would, so Socket Mode is not part of the test.
+#
+# Usage: python -m loadtest.run --rate 2 --duration 60 --pages 1000
+
+PROCESS_READY_TIMEOUT_SECONDS = 60
+
+
+def seed_content(directory, page_count, seed):
+    """Fill the database, page store and vector store of the scratch data directory with a synthetic corpus."""
+    from benchmark.corpus import CORPUS_SIZES
+    from benchmark.suite import BenchmarkEnvironment
+    from file_system.page_store import get_page_store
+    CORPUS_SIZES["loadtest"] = page_count
+    environment = BenchmarkEnvironment("loadtest", directory, seed)
+    get_page_store()
+    environment.ensure_database(with_embeddings=True)
+    environment.ensure_page_store()
+    environment.ensure_vector_store()
+    logging.info(f"Seeded {page_count} pages in {directory}")
+
+
+def wait_until_ready(api_url, process):
+    deadline = time.time() + PROCESS_READY_TIMEOUT_SECONDS
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The API exited with code {process.returncode} before it was ready")
+        try:
+            requests.get(f"{api_url}/api/v1/metrics/latency", timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.5)
+    raise RuntimeError(f"The API was not ready after {PROCESS_READY_TIMEOUT_SECONDS} seconds")
+
+
+def run_load_test(rate_per_second, duration_seconds, page_count=1000, api_port=8765, seed=0, content_path=None):
+    """
+    Run a load test against a fresh API process.
+
+    Args:
+    rate_per_second (float): The mean number of questions posted per second.
+    duration_seconds (float): How long questions are posted for.
+    page_count (int): The number of pages of the synthetic corpus.
+    api_port (int): The port of the API process.
+    seed (int): The seed of the corpus, questions and injected failures.
+    content_path (str): The scratch data directory, a temporary one by default.
+
+    Returns:
+    dict: The load test report, with the stage latencies measured by the API and the fake service counters.
+    """
+    content_path = content_path or tempfile.mkdtemp(prefix="nur-loadtest-")
+    for sub_directory in ("database", "file_system", "transactional", "telemetry"):
+        os.makedirs(os.path.join(content_path, sub_directory), exist_ok=True)
+    # The data paths are read from the environment when configuration is first imported
+    os.environ["NUR_CONTENT_PATH"] = content_path
+    from loadtest.fake_services import start_fake_services
+    from loadtest.load_generator import LoadGenerator
+    seed_content(content_path, page_count, seed)
+    services = start_fake_services(page_count, seed)
+    environment = dict(os.environ,
+                       NUR_OPENAI_BASE_URL=f"{services['openai'].base_url}/v1",
+                       NUR_CONFLUENCE_BASE_URL=services['confluence'].base_url,
+                       NUR_SLACK_API_BASE_URL=f"{services['slack'].base_url}/api/",
+                       # Used when credentials.py has no OpenAI key, the fake service accepts any
+                       OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "loadtest"))
+    api_url = f"http://127.0.0.1:{api_port}"
+    api_process = subprocess.Popen([sys.executable, "-m", "uvicorn", "api.endpoint:processor",
+                                    "--host", "127.0.0.1", "--port", str(api_port), "--log-level", "warning"],
+                                   env=environment)
+    try:
+        wait_until_ready(api_url, api_process)
+        report = LoadGenerator(api_url, services['slack'], rate_per_second, duration_seconds, seed=seed).run()
+        report["stage_latencies"] = requests.get(f"{api_url}/api/v1/metrics/latency", timeout=10).json()
+        report["fake_services"] = {name: dict(service.stats) for name, service in services.items()}
+        report["content_path"] = content_path
+        return report
+    finally:
+        api_process.terminate()
+        try:
+            api_process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            api_process.kill()
+        for service in services.values():
+            service.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the question pipeline against fake external services")
+    parser.add_argument("--rate", type=float, default=1.0, help="Questions posted per second")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds questions are posted for")
+    parser.add_argument("--pages", type=int, default=1000, help="Pages of the synthetic corpus")
+    parser.add_argument("--port", type=int, default=8765, help="Port of the API process")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--content-path", help="Scratch data directory, a temporary one by default")
+    arguments = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    report = run_load_test(arguments.rate, arguments.duration, arguments.pages, arguments.port, arguments.seed,
+                           arguments.content_path)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,10 @@ from slack.channel_interaction import load_slack_bot
 from datetime import datetime
 from database.space_manager import SpaceManager
 from vector.create_vector_db import add_embeds_to_vector_db
+from vector.qa_interaction_index import QAInteractionIndex
+from file_system.page_store import import_page_files
+from configuration import slack_event_transport
+from telemetry.structured_logging import configure_logging
 
 
 def load_new_documentation_space():
@@ -47,8 +51,10 @@ def main_menu():
         print("3. Ask a question to GPT-4T")
         print("4. Sync up QA articles to Confluence")
         print("5. Start Slack Bot")
+        print("6. Index QA interactions for related questions")
+        print("7. Move page files into the page store")
         print("0. Cancel/Quit")
-        choice = input("Enter your choice (0-6): ")
+        choice = input("Enter your choice (0-7): ")
 
         if choice == "1":
             print("Loading new documentation space...")
@@ -72,17 +78,28 @@ def main_menu():
 
         elif choice == "5":
             print("Starting Slack Bot Using Assistants and fast API...")
-            # Run the FastAPI server
-            input("Started the FastAPI server located at './api/endpoint' and Press Enter to continue.")
+            # Run the FastAPI server, not needed when the events are consumed in the bot process
+            if slack_event_transport == "http":
+                input("Started the FastAPI server located at './api/endpoint' and Press Enter to continue.")
             # Start the Slack bot in the main thread
             load_slack_bot()
             print("Slack Bot is running in parallel processing mode.")
 
+        elif choice == "6":
+            print("Indexing QA interactions...")
+            indexed_count = QAInteractionIndex().sync()
+            print(f"Indexed {indexed_count} new QA interactions.")
+
+        elif choice == "7":
+            print("Moving page files into the page store...")
+            imported_count = import_page_files()
+            print(f"Moved {imported_count} page files into the page store.")
+
         elif choice == "0":
             print("Exiting program.")
             break
         else:
-            print("Invalid choice. Please enter 0, 1, 2, 3, 4, 5 or 6.")
+            print("Invalid choice. Please enter 0, 1, 2, 3, 4, 5, 6 or 7.")
 
 
 def ask_question():
@@ -99,4 +116,5 @@ def ask_question():
 
 
 if __name__ == "__main__":
+    configure_logging()
     main_menu()
\ No newline at end of file
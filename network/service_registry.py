@@ -0,0 +1,101 @@
+# ./network/service_registry.py
+import logging
+import threading
+
+# Clients of the external services, created on first use and shared by the whole process.
+# Importing a module must never contact a service: modules get their clients from here when they need them,
+# so starting the API, the bot or a script only connects to the services it actually uses.
+
+
+class ServiceRegistry:
+    """Creates each registered client on first use and caches it"""
+
+    def __init__(self):
+        self.factories = {}
+        self.instances = {}
+        self.lock = threading.Lock()
+
+    def register(self, name, factory):
+        """
+        Register the factory of a client, replacing any client already created under that name.
+
+        Args:
+        name (str): The name of the service.
+        factory (callable): Creates the client, called without arguments.
+        """
+        with self.lock:
+            self.factories[name] = factory
+            self.instances.pop(name, None)
+
+    def get(self, name):
+        """
+        Get the client of a service, creating it on first use.
+
+        Args:
+        name (str): The name of the service.
+
+        Returns:
+        The client.
+        """
+        instance = self.instances.get(name)
+        if instance is not None:
+            return instance
+        with self.lock:
+            instance = self.instances.get(name)
+            if instance is None:
+                if name not in self.factories:
+                    raise KeyError(f"No service registered under the name {name}")
+                instance = self.factories[name]()
+                self.instances[name] = instance
+                logging.info(f"Created the {name} client")
+            return instance
+
+    def reset(self, name=None):
+        """Drop a cached client, or all of them, so the next use creates a new one."""
+        with self.lock:
+            if name is None:
+                self.instances.clear()
+            else:
+                self.instances.pop(name, None)
+
+
+def create_openai_client():
+    from openai import OpenAI
+    from credentials import oai_api_key
+    from configuration import openai_base_url
+    return OpenAI(api_key=oai_api_key or None, base_url=openai_base_url)
+
+
+def create_confluence_client():
+    from atlassian import Confluence
+    from credentials import confluence_credentials
+    from configuration import confluence_base_url
+    return Confluence(
+        url=confluence_base_url or confluence_credentials['base_url'],
+        username=confluence_credentials['username'],
+        password=confluence_credentials['api_token']
+    )
+
+
+def create_chroma_client():
+    import chromadb
+    from configuration import vector_folder_path
+    return chromadb.PersistentClient(path=vector_folder_path)
+
+
+service_registry = ServiceRegistry()
+service_registry.register("openai", create_openai_client)
+service_registry.register("confluence", create_confluence_client)
+service_registry.register("chroma", create_chroma_client)
+
+
+def get_openai_client():
+    return service_registry.get("openai")
+
+
+def get_confluence():
+    return service_registry.get("confluence")
+
+
+def get_chroma_client():
+    return service_registry.get("chroma")
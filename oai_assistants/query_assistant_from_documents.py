@@ -4,6 +4,9 @@ from oai_assistants.file_manager import FileManager
 from oai_assistants.thread_manager import ThreadManager
 from oai_assistants.assistant_manager import AssistantManager
 from configuration import assistant_id, file_system_path
+from context.prepare_context import format_related_interactions_as_context
+from context.prompt_builder import format_pages_for_prompt, build_user_message, record_prompt_usage
+from telemetry.structured_logging import log_event, log_payload
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -35,40 +38,19 @@ def format_pages_as_context(file_ids, max_length=30000):
     """
     Formats specified files as a context string for referencing in responses,
     ensuring the total context length does not exceed the specified maximum length.
+    The most relevant files are kept and then ordered by ID so the prompt prefix can be cached.
 
     Args:
-        file_ids (list of str): List of file IDs to be formatted as context.
+        file_ids (list of str): List of file IDs to be formatted as context, most relevant first.
         max_length (int): The maximum length allowed for the context.
 
     Returns:
         str: The formatted context within the maximum length.
     """
-    context = ""
-    for file_id in file_ids:
-        if len(context) >= max_length:
-            # If we've already reached or exceeded the maximum length, stop adding more content.
-            break
-        chosen_file_path = file_system_path + f"/{file_id}.txt"
-        with open(chosen_file_path, 'r') as file:
-            file_content = file.read()
-            # Check if adding the next file's content will exceed the max length
-            title = file_content.split('title: ')[1].split('\n')[0].strip()
-            space_key = file_content.split('spaceKey: ')[1].split('\n')[0].strip()
-            additional_context = f"\nDocument Title: {title}\nSpace Key: {space_key}\n\n{file_content}"
-
-            if len(context) + len(additional_context) <= max_length:
-                context += additional_context
-            else:
-                # If adding the whole document would exceed the limit,
-                # only add as much as possible, then break
-                available_space = max_length - len(context) - len(" [Content truncated due to size limit.]")
-                context += additional_context[:available_space] + " [Content truncated due to size limit.]"
-                break  # Stop adding more content to ensure we respect the maximum length
-
-    return context
-
-
-def query_assistant_with_context(question, page_ids, thread_id=None):
+    return format_pages_for_prompt(file_ids, max_length)
+
+
+def query_assistant_with_context(question, page_ids, thread_id=None, related_interactions=None):
     """
     Queries the assistant with a specific question, after setting up the necessary context by adding relevant files.
 
@@ -76,6 +58,7 @@ def query_assistant_with_context(question, page_ids, thread_id=None):
     question (str): The question to be asked.
     page_ids (list): A list of page IDs representing the files to be added to the assistant's context.
     thread_id (str, optional): The ID of an existing thread to continue the conversation. Default is None.
+    related_interactions (list, optional): Previously answered questions to include in the context. Default is None.
 
     Returns:
     list: A list of messages, including the assistant's response to the question.
@@ -83,49 +66,45 @@ def query_assistant_with_context(question, page_ids, thread_id=None):
 
     # Initiate the client
     client = initiate_client()
-    print(f"Client initiated: {client}\n")
     assistant_manager = AssistantManager(client)
-    print(f"Assistant manager initiated: {assistant_manager}\n")
 
     # Retrieve the assistant instance
     assistant = assistant_manager.load_assistant(assistant_id=assistant_id)
-    print(f"Assistant loaded: {assistant}\n")
+    log_event(logging.DEBUG, "Assistant loaded", assistant_id=assistant.id)
 
     # Ensure page_ids is a list
     if not isinstance(page_ids, list):
         page_ids = [page_ids]
-    print(f"IDs of pages to load in context : {page_ids}\n")
+    log_event(logging.DEBUG, "IDs of pages to load in context", page_ids=page_ids)
 
     # Format the context
     context = format_pages_as_context(page_ids)
-    print(f"\n\nContext formatted: {context}\n")
+    related_context = format_related_interactions_as_context(related_interactions)
+    log_payload("Context formatted", sample_key=thread_id, context=context)
 
     # Initialize ThreadManager with or without an existing thread_id
     thread_manager = ThreadManager(client, assistant.id, thread_id)
-    print(f"Thread manager initiated: {thread_manager}\n")
 
     # If no thread_id was provided, create a new thread
     if thread_id is None:
         thread_manager.create_thread()
-        print(f"Thread created: {thread_manager.thread_id}\n")
+        log_event(logging.DEBUG, "Thread created", thread_id=thread_manager.thread_id)
     else:
-        print(f"Thread loaded with the following ID: {thread_id}\n")
+        log_event(logging.DEBUG, "Thread loaded", thread_id=thread_id)
 
-    # Format the question with context and query the assistant
-    formatted_question = (f"Here is the question and the context\n\n"
-                          f"{question}\n\n"
-                          f"Context:\n{context}")
-    print(f"Formatted question: {formatted_question}\n")
+    # Pages first and the question last, so questions over the same pages share a cached prompt prefix
+    formatted_question = build_user_message(question, context, related_context)
+    log_payload("Formatted question", sample_key=thread_manager.thread_id, question=formatted_question)
 
     # Query the assistant
     messages, thread_id = thread_manager.add_message_and_wait_for_reply(formatted_question, [])
-    print(f"The thread_id is: {thread_id}\n Messages received: {messages}\n")
+    record_prompt_usage(thread_manager.last_run_usage, "Assistant")
     if messages and messages.data:
         assistant_response = messages.data[0].content[0].text.value
-        print(f"Assistant full response: {assistant_response}\n")
+        log_payload("Assistant full response", sample_key=thread_id, response=assistant_response)
     else:
         assistant_response = "No response received."
-        print(f"No response received.\n")
+        log_event(logging.WARNING, "No response received from the assistant", thread_id=thread_id)
 
     return assistant_response, thread_id
 
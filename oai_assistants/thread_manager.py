@@ -1,7 +1,114 @@
 # ./oai_assistants/thread_manager.py
 import time
 import json
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
 from context.prepare_context import get_context
+from configuration import tool_call_worker_count, tool_call_timeout_seconds
+from configuration import tool_result_cache_size, tool_result_cache_ttl_seconds
+from telemetry.latency import observe
+from telemetry.structured_logging import log_event, log_payload
+
+# Functions the assistant can call, by name
+TOOL_FUNCTIONS = {"get_context": get_context}
+
+
+class ToolCallPool:
+    """
+    Thread pool shared by the tool calls of all runs, so the number of concurrent calls in the process stays bounded.
+
+    A call that timed out cannot be stopped and keeps its thread until it returns. Once half of the threads are
+    held by such calls, new calls go to a fresh pool and the old one is left to finish its calls, so a few stuck
+    calls cannot starve the runs that come after them.
+    """
+
+    def __init__(self, worker_count=tool_call_worker_count):
+        self.worker_count = worker_count
+        self.max_stuck_count = max(worker_count // 2, 1)
+        self.lock = threading.Lock()
+        self.executor = self.create_executor()
+        self.stuck_count = 0  # Timed out calls still running on the current executor
+
+    def create_executor(self):
+        return ThreadPoolExecutor(max_workers=self.worker_count, thread_name_prefix="tool-call")
+
+    def submit(self, function, **arguments):
+        with self.lock:
+            executor = self.executor
+            future = executor.submit(function, **arguments)
+        future.executor = executor
+        return future
+
+    def abandon(self, future):
+        """Give up on a call that timed out, a running call holds its thread until it returns."""
+        if future.cancel():
+            return
+        with self.lock:
+            if future.executor is not self.executor or future.done():
+                return
+            self.stuck_count += 1
+            if self.stuck_count >= self.max_stuck_count:
+                logging.warning(f"{self.stuck_count} timed out tool calls are still running, "
+                                f"starting a new pool of {self.worker_count} threads")
+                self.executor.shutdown(wait=False)
+                self.executor = self.create_executor()
+                self.stuck_count = 0
+                return
+        future.add_done_callback(self.release)
+
+    def release(self, future):
+        with self.lock:
+            if future.executor is self.executor:
+                self.stuck_count -= 1
+
+
+tool_call_pool = ToolCallPool()
+
+
+class ToolResultCache:
+    """Bounded LRU of tool outputs keyed by the function name and its arguments, entries expire after a TTL"""
+
+    def __init__(self, max_size=tool_result_cache_size, ttl_seconds=tool_result_cache_ttl_seconds):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()  # key -> (stored_at, output)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def make_key(function_name, arguments):
+        return function_name, json.dumps(arguments, sort_keys=True)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] > self.ttl_seconds:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, output):
+        with self.lock:
+            self.entries[key] = (time.monotonic(), output)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+
+tool_result_cache = ToolResultCache()
+
+
+def observe_run_timings(run):
+    """Record how long a completed run waited in the OpenAI queue and how long it ran, from its timestamps."""
+    created_at, started_at, completed_at = (getattr(run, name, None) for name in ("created_at", "started_at", "completed_at"))
+    if created_at and started_at:
+        observe("assistant_run_queued", started_at - created_at)
+    if started_at and completed_at:
+        observe("assistant_run_in_progress", completed_at - started_at)
 
 
 class ThreadManager:
@@ -27,6 +134,7 @@ class ThreadManager:
         self.client = client
         self.assistant_id = assistant_id
         self.thread_id = thread_id
+        self.last_run_usage = None  # Token usage of the last completed run
 
     def create_thread(self):
         """
@@ -38,9 +146,9 @@ class ThreadManager:
         if self.thread_id is None:
             thread = self.client.beta.threads.create()
             self.thread_id = thread.id
-            print("\nThread created with ID:", self.thread_id)
+            log_event(logging.DEBUG, "Thread created", thread_id=self.thread_id)
         else:
-            print("\nThread already initialized with ID:", self.thread_id)
+            log_event(logging.DEBUG, "Thread already initialized", thread_id=self.thread_id)
 
     def add_message_and_wait_for_reply(self, user_message, message_files=[]):
         # Add the user's message to the thread
@@ -50,29 +158,30 @@ class ThreadManager:
             content=user_message,
             file_ids=message_files
         )
-        print("\nUser message added to thread:", user_message)
+        log_payload("User message added to thread", sample_key=self.thread_id, message=user_message)
 
         # Request the assistant to process the message
         run = self.client.beta.threads.runs.create(
             thread_id=self.thread_id,
             assistant_id=self.assistant_id,
         )
-        print("\nAssistant thread run started.")
+        log_event(logging.DEBUG, "Assistant thread run started", thread_id=self.thread_id, run_id=run.id)
 
         # Continuously check the run status
         while True:
             run_status = self.check_run_status(run.id)
-            print(f"Run status: {run_status.status}")
+            log_event(logging.DEBUG, "Run status", run_id=run.id, status=run_status.status)
 
             if run_status.status == "completed":
+                self.last_run_usage = getattr(run_status, "usage", None)
+                observe_run_timings(run_status)
                 # Retrieve and display the messages after the run completes
                 messages = self.retrieve_messages()
                 # If the run was successful, display messages as usual
                 self.display_messages(messages)
-                print("\nAssistant run completed.")
+                log_event(logging.DEBUG, "Assistant run completed", run_id=run.id)
                 break
             elif run_status.status == "failed":
-                print("\nAssistant run failed.")
                 # If there's a last_error, use it to inform the user
                 if run_status.last_error:
                     error_message = f"Run failed with error: {run_status.last_error.message}"
@@ -84,15 +193,12 @@ class ThreadManager:
                     "role": "assistant",
                     "content": [{"text": {"value": error_message}}]
                 }
-                # Here you can decide to log the error, inform the user, or take other actions
-                print(error_message)
+                log_event(logging.ERROR, "Assistant run failed", run_id=run.id, error=error_message)
                 return [failure_message], self.thread_id
             elif run_status.status == "requires_action":
-                print("\nRun requires action. Handling function calls.")
+                log_event(logging.DEBUG, "Run requires action, handling function calls", run_id=run.id)
                 self.handle_function_calls(run.id)
-                print("\nFunction call handled. Continuing to wait for run completion.")
             else:
-                print("Waiting for run to complete...")
                 time.sleep(5)  # Adjust sleep time as needed
 
         return messages, self.thread_id
@@ -138,37 +244,71 @@ class ThreadManager:
         """
         for message in messages.data:
             if message.role == "assistant":
-                print(f"Assistant: {message.content[0].text.value}")
-
-        print("\nMessages displayed.{message.content[0].text.value}")
+                log_payload("Assistant message", sample_key=self.thread_id, text=message.content[0].text.value)
 
     def handle_function_calls(self, run_id):
+        """
+        Run the tool calls a run is waiting for concurrently and submit all their outputs at once.
+
+        Calls with the same function and arguments as a recent call are answered from the cache, and calls
+        still running after tool_call_timeout_seconds are reported to the assistant as timed out. Calls whose
+        arguments cannot be parsed are reported as failed, the other calls of the step still run.
+
+        Parameters:
+        run_id (str): The ID of the run requiring action.
+        """
         run = self.check_run_status(run_id)
         if run.status == "requires_action" and run.required_action:
-            # Directly access submit_tool_outputs.tool_calls based on the provided module structure
             tool_calls = run.required_action.submit_tool_outputs.tool_calls
-
+            outputs = {}
+            futures = {}
             for tool_call in tool_calls:
                 function_name = tool_call.function.name
-                arguments = json.loads(tool_call.function.arguments)
-                output = None
+                function = TOOL_FUNCTIONS.get(function_name)
+                if function is None:
+                    outputs[tool_call.id] = {"error": f"Unknown function {function_name}"}
+                    continue
+                try:
+                    arguments = json.loads(tool_call.function.arguments)
+                    if not isinstance(arguments, dict):
+                        raise ValueError("the arguments are not a JSON object")
+                except ValueError as e:
+                    logging.error(f"Tool call {tool_call.id} has invalid arguments: {e}")
+                    outputs[tool_call.id] = {"error": f"Invalid arguments: {e}"}
+                    continue
+                cache_key = ToolResultCache.make_key(function_name, arguments)
+                cached_output = tool_result_cache.get(cache_key)
+                if cached_output is not None:
+                    outputs[tool_call.id] = cached_output
+                    continue
+                futures[tool_call.id] = (cache_key, tool_call_pool.submit(function, **arguments))
 
-                # Here, you should match the function_name to your actual function handling logic
-                # For example, if you have a local function to handle 'get_context'
-                if function_name == "get_context":
-                    # Assuming you have a method defined to handle this
-                    # Make sure to define get_context or any required function to match this call
-                    output = get_context(**arguments)
+            wait([future for _, future in futures.values()], timeout=tool_call_timeout_seconds)
+            for tool_call_id, (cache_key, future) in futures.items():
+                if not future.done():
+                    tool_call_pool.abandon(future)
+                    logging.warning(f"Tool call {tool_call_id} timed out after {tool_call_timeout_seconds}s")
+                    outputs[tool_call_id] = {"error": "The tool call timed out"}
+                elif future.exception() is not None:
+                    logging.error(f"Tool call {tool_call_id} failed: {future.exception()}")
+                    outputs[tool_call_id] = {"error": str(future.exception())}
+                else:
+                    outputs[tool_call_id] = future.result()
+                    tool_result_cache.put(cache_key, outputs[tool_call_id])
+            self.submit_function_outputs(run.thread_id, run.id, outputs)
 
-                    # Submit the output back to the assistant
-                self.submit_function_output(run.thread_id, run.id, tool_call.id, output)
+    def submit_function_outputs(self, thread_id, run_id, outputs):
+        """
+        Submit the outputs of all the tool calls of a run in one request.
 
-    def submit_function_output(self, thread_id, run_id, tool_call_id, output):
+        Parameters:
+        outputs (dict): The output of each tool call by tool call ID.
+        """
         self.client.beta.threads.runs.submit_tool_outputs(
             thread_id=thread_id,
             run_id=run_id,
             tool_outputs=[{
                 "tool_call_id": tool_call_id,
                 "output": json.dumps(output),
-            }]
+            } for tool_call_id, output in outputs.items()]
         )
@@ -1,20 +1,18 @@
 # ./oai_assistants/utility.py
-from openai import OpenAI
-from credentials import oai_api_key
 import os
+from network.service_registry import get_openai_client
 from configuration import model_id
 
 
 
 def initiate_client():
     """
-    Initializes and returns an OpenAI client using the provided API key.
+    Returns the OpenAI client shared by the process, created on first use.
 
     Returns:
     OpenAI: An instance of the OpenAI client configured with the specified API key.
     """
-    client = OpenAI(api_key=oai_api_key)
-    return client
+    return get_openai_client()
 
 
 def get_all_files_in_path(file_path):
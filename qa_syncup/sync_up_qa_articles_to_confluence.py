@@ -1,6 +1,14 @@
 from confluence_integration.confluence_client import ConfluenceClient
-from database.nur_database import QAInteractionManager, Session
+from database.nur_database import QAInteractionManager, Session, get_qa_sync_states, store_qa_sync_states
+from threads.task_scheduler import get_task_scheduler, PRIORITY_BULK
+from configuration import qa_sync_space_name, qa_sync_min_interval_seconds, qa_sync_max_in_flight
+from configuration import qa_sync_state_batch_size
+from concurrent.futures import wait, FIRST_COMPLETED
+import hashlib
 import json
+import logging
+import threading
+import time
 
 
 def format_comment(raw_comment):
@@ -26,10 +34,10 @@ def format_comment(raw_comment):
 
 def get_qna_interactions_from_database():
     """
-    Fetch all Q&A interactions from the database.
+    Stream all Q&A interactions from the database.
 
     Returns:
-    list: A list of QAInteraction objects.
+    generator: A generator of QAInteraction objects, read from the database one page at a time.
     """
     # Create a session instance
     session = Session()
@@ -37,9 +45,8 @@ def get_qna_interactions_from_database():
     # Initialize QAInteractionManager with the session
     qa_manager = QAInteractionManager(session)
 
-    # Fetch all Q&A interactions from the database
-    all_interactions = qa_manager.get_qa_interactions()
-    return all_interactions
+    # Stream Q&A interactions from the database
+    return qa_manager.iter_interactions()
 
 
 def create_page_title_and_content(interaction):
@@ -67,48 +74,152 @@ def create_page_title_and_content(interaction):
     return title, content
 
 
-def create_page_on_confluence(confluence_client, interaction, space_key, title, content):
+def content_hash(title, content):
     """
-    Create a page on Confluence.
+    Hash the page of an interaction, the sync state compares it to find interactions that changed.
 
-    Args:
-    space_key (str): The key of the Confluence space.
-    title (str): The title of the page.
-    clean_content (str): The content of the page.
+    Returns:
+    str: The SHA-256 of the title and content.
     """
-    clean_content = confluence_client.validate_and_coerce_xhtml(content)  # Validate and clean the content
-    clean_title = confluence_client.validate_and_coerce_xhtml(title)
-    # Check if a page with the same title already exists under the same space key
-    if confluence_client.page_exists(space_key, clean_title):
-        page_id = confluence_client.get_page_id_by_title(space_key, clean_title)
-        if page_id:
-            # Update the existing page if it's under the same space key
-            confluence_client.update_page(page_id, clean_title, clean_content)
-            return f"Page updated for interaction ID: {interaction.interaction_id}"
-        else:
-            # Skip if it's under a different space key
-            return f"Skipping update for interaction ID: {interaction.interaction_id} - Page found under a different space key"
-    else:
-        # Create the page if it doesn't exist
-        confluence_client.create_page(space_key, clean_title, clean_content)
-        return f"Page created for interaction ID: {interaction.interaction_id}"
+    return hashlib.sha256(f"{title}\n{content}".encode()).hexdigest()
 
 
-def sync_up_interactions_to_confluence():
+class RequestPacer:
+    """
+    Spaces requests shared by several threads by a minimum interval.
+    """
+
+    def __init__(self, min_interval_seconds):
+        self.min_interval_seconds = min_interval_seconds
+        self.next_request_at = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """Block until the caller may send its request."""
+        with self.lock:
+            now = time.monotonic()
+            request_at = max(now, self.next_request_at)
+            self.next_request_at = request_at + self.min_interval_seconds
+        if request_at > now:
+            time.sleep(request_at - now)
+
+
+class QASyncEngine:
     """
-    Sync up all Q&A interactions to Confluence.
+    Pushes Q&A interactions to Confluence incrementally.
+
+    The hash of the page pushed for every interaction and the ID of its Confluence page are kept in the database,
+    so a sync only uploads the interactions that are new or changed since the last one. Uploads run in parallel
+    on the task scheduler, limited by its "confluence" concurrency limit and spaced by a minimum interval.
     """
-    # Create a Confluence client instance
-    confluence_client = ConfluenceClient()
 
-    space_key = confluence_client.create_space_if_not_found("Nur documentation QnA")
-    print(f"Space key: {space_key}")
-    all_interactions = get_qna_interactions_from_database()
+    def __init__(self, confluence_client=None, space_name=qa_sync_space_name,
+                 min_interval_seconds=qa_sync_min_interval_seconds, max_in_flight=qa_sync_max_in_flight):
+        """
+        Initializes the sync engine.
+
+        Args:
+        confluence_client (ConfluenceClient): The client used to upload the pages, a new one is created when None.
+        space_name (str): The name of the space the pages are pushed to, created if missing.
+        min_interval_seconds (float): The minimum time between two Confluence requests.
+        max_in_flight (int): The maximum number of uploads submitted and not finished yet.
+        """
+        self.confluence_client = confluence_client or ConfluenceClient()
+        self.space_name = space_name
+        self.pacer = RequestPacer(min_interval_seconds)
+        self.max_in_flight = max_in_flight
+
+    def push(self, space_key, title, content, page_id=None):
+        """
+        Create or update the page of an interaction.
+
+        Args:
+        space_key (str): The key of the Confluence space.
+        title (str): The page title.
+        content (str): The page content.
+        page_id (str): The ID of the page pushed by the last sync, None for a new interaction.
+
+        Returns:
+        tuple: "created" or "updated" and the ID of the page.
+        """
+        # Validated once, the client is told not to validate again
+        clean_title = self.confluence_client.validate_and_coerce_xhtml(title)
+        clean_content = self.confluence_client.validate_and_coerce_xhtml(content)
+        if page_id:
+            try:
+                self.pacer.wait()
+                self.confluence_client.update_page(page_id, clean_title, clean_content, validated=True)
+                return "updated", page_id
+            except Exception as e:
+                # The page may have been deleted or moved since the last sync, find it again by title
+                logging.warning(f"Could not update page {page_id}, looking it up by title: {e}")
+        self.pacer.wait()
+        page_id = self.confluence_client.get_page_id_by_title(space_key, clean_title)
+        if page_id:
+            self.pacer.wait()
+            self.confluence_client.update_page(page_id, clean_title, clean_content, validated=True)
+            return "updated", str(page_id)
+        self.pacer.wait()
+        page = self.confluence_client.create_page(space_key, clean_title, clean_content, validated=True)
+        return "created", str(page["id"])
+
+    def sync(self):
+        """
+        Push the new and changed interactions.
+
+        Returns:
+        dict: The number of interactions created, updated, unchanged and failed.
+        """
+        space_key = self.confluence_client.create_space_if_not_found(self.space_name)
+        logging.info(f"Syncing Q&A interactions to space {space_key}")
+        states = get_qa_sync_states()
+        counts = {"created": 0, "updated": 0, "unchanged": 0, "failed": 0}
+        scheduler = get_task_scheduler()
+        in_flight = {}
+        synced = []
+        for interaction in get_qna_interactions_from_database():
+            title, content = create_page_title_and_content(interaction)
+            page_hash = content_hash(title, content)
+            previous_hash, page_id = states.get(interaction.interaction_id, (None, None))
+            if page_hash == previous_hash:
+                counts["unchanged"] += 1
+                continue
+            future = scheduler.submit(self.push, space_key, title, content, page_id,
+                                      priority=PRIORITY_BULK, api="confluence")
+            in_flight[future] = (interaction.interaction_id, page_hash)
+            while len(in_flight) >= self.max_in_flight:
+                self.collect(in_flight, synced, counts)
+        while in_flight:
+            self.collect(in_flight, synced, counts)
+        store_qa_sync_states(synced)
+        logging.info(f"Q&A sync complete: {counts}")
+        return counts
+
+    def collect(self, in_flight, synced, counts):
+        """Wait for at least one upload and record the finished ones, the states are stored in batches."""
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            interaction_id, page_hash = in_flight.pop(future)
+            try:
+                action, page_id = future.result()
+            except Exception as e:
+                logging.error(f"Error pushing interaction {interaction_id} to Confluence: {e}")
+                counts["failed"] += 1
+                continue
+            counts[action] += 1
+            synced.append((interaction_id, page_hash, page_id))
+        if len(synced) >= qa_sync_state_batch_size:
+            store_qa_sync_states(synced)
+            synced.clear()
+
 
-    # Iterate through each interaction
-    for interaction in all_interactions:
-        title, content = create_page_title_and_content(interaction)
-        print(create_page_on_confluence(confluence_client, interaction, space_key, title, content))
+def sync_up_interactions_to_confluence():
+    """
+    Sync up the new and changed Q&A interactions to Confluence.
+    """
+    counts = QASyncEngine().sync()
+    print(f"Q&A interactions created: {counts['created']}, updated: {counts['updated']}, "
+          f"unchanged: {counts['unchanged']}, failed: {counts['failed']}")
 
 
 if __name__ == "__main__":
@@ -1,8 +1,7 @@
 # ./slack/channel_interaction_assistants.py
 import logging
 import time
-import requests
-from functools import partial
+from functools import partial, lru_cache
 from abc import ABC, abstractmethod
 from slack_sdk.socket_mode import SocketModeClient
 from slack_sdk.socket_mode.response import SocketModeResponse
@@ -11,14 +10,21 @@ from typing import List
 from credentials import slack_bot_user_oauth_token, slack_app_level_token
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
-from database.nur_database import Session, QAInteractionManager
+from database.slack_message_store import SlackMessageStore
+from slack.event_dispatcher import SlackEventDispatcher
+from slack.message_scheduler import create_web_client
+from slack.event_transport import create_event_transport
+from configuration import slack_event_worker_count, slack_metrics_log_interval_seconds, slack_event_transport
+from telemetry.latency import observe, span, configure_tracing
+from telemetry.structured_logging import configure_logging, log_event, log_payload
 
 
-# get slack bot user id
+# get slack bot user id, the auth test is only called once per token
+@lru_cache(maxsize=None)
 def get_bot_user_id(bot_oauth_token):
     """Get the bot user id from the slack api"""
     # Initialize WebClient with your bot's token
-    slack_client = WebClient(token=bot_oauth_token)
+    slack_client = create_web_client(bot_oauth_token)
     bot_id = "unassigned"
     try:
         # Call the auth.test method using the Slack client
@@ -40,48 +46,27 @@ class ChannelMessageHandler(SlackEventHandler):
     """Handles incoming messages from the channel and publishes questions and feedback to the persist queue"""
 
     def __init__(self):
-        self.db_session = Session()
-        self.interaction_manager = QAInteractionManager(self.db_session)
-        self.processed_messages = set()
-        self.questions = {}
-        self.load_processed_data()
-
-    def load_processed_data(self):
-        """ Load processed messages and questions from the database """
-        try:
-            interactions = self.interaction_manager.get_all_interactions()
-        except Exception as e:
-            logging.error(f"Error loading processed messages and questions: {e}")
-            interactions = []
-        for interaction in interactions:
-            # Add to processed messages
-            try:
-                self.processed_messages.add(interaction.thread_id)
-            except Exception as e:
-                logging.error(f"Error adding processed message to interaction: {e}")
-            # If it's a question, add to questions
-            if interaction.question_text:
-                try:
-                    self.questions[interaction.thread_id] = interaction.question_text
-                except Exception as e:
-                    logging.error(f"Error adding question to interaction: {e}")
+        self.message_store = SlackMessageStore()
+        self.event_transport = create_event_transport()
 
     def handle(self, client: SocketModeClient, req: SocketModeRequest, web_client: WebClient, bot_user_id: str):
         """Handle incoming messages from the channel and publish questions and feedback to the persist queue"""
         # Acknowledge the event immediately
         client.send_socket_mode_response(SocketModeResponse(envelope_id=req.envelope_id))
+        self.process_event(req.payload.get("event", {}), bot_user_id)
 
-        event = req.payload.get("event", {})
+    def process_event(self, event, bot_user_id: str):
+        """Publish a message event as a question or feedback, or skip it"""
         ts = event.get("ts", "")  # Unique 'ts' for each message
         text = event.get("text", "")
         user_id = event.get("user", "")
         thread_ts = event.get("thread_ts")  # 'thread_ts' if part of a thread
         channel = event.get("channel", "")  # ID of the channel where the message was sent
 
-        logging.debug(f"Event received: {event}")
+        log_payload("Event received", sample_key=ts, event=event)
 
         # Skip processing if the message has already been processed
-        if ts in self.processed_messages:
+        if self.message_store.is_processed(ts):
             logging.info(f"Message {ts} already processed. Skipping.\n")
             return
 
@@ -97,8 +82,11 @@ class ChannelMessageHandler(SlackEventHandler):
 
         # Identify and handle questions
         if "?" in text and (not thread_ts):  # It's a question if not part of another thread
-            logging.debug(f"Question identified: {text}")
-            self.questions[ts] = text
+            log_payload("Question identified", sample_key=ts, text=text)
+            # Claim the message so no other bot process publishes it again
+            if not self.message_store.claim(channel, ts, question_text=text):
+                logging.info(f"Message {ts} already processed. Skipping.\n")
+                return
             question_event = {
                 "text": text,  # Message content
                 "ts": ts,  # Message timestamp acting as unique ID in slack
@@ -106,20 +94,23 @@ class ChannelMessageHandler(SlackEventHandler):
                 "channel": channel,
                 "user": user_id
             }
-            # publish question event to the persist queue
+            # Time from the message being posted to it being handled here
+            observe("slack_receipt", time.time() - float(ts), kind="question")
+            # publish question event to the consumers
             try:
-                # Make an API call to publish the question
-                response = requests.post("http://localhost:8000/api/v1/questions/", json=question_event)
-                response.raise_for_status()
-                logging.info(f"Question event published: {question_event}")
+                with span("event_publish", kind="question"):
+                    self.event_transport.publish_question(question_event)
+                log_event(logging.INFO, "Question event published", ts=ts, channel=channel)
 
             except Exception as e:
                 logging.error(f"Error publishing question event: {e}")
 
         # Identify and handle feedback
-        elif thread_ts in self.questions:  # Message is a reply to a question
-            parent_question = self.questions[thread_ts]
-            logging.debug(f"Feedback identified for question '{parent_question}': {text}")
+        elif parent_question := self.message_store.get_question(thread_ts):  # Message is a reply to a question
+            log_payload("Feedback identified", sample_key=thread_ts, question=parent_question, text=text)
+            if not self.message_store.claim(channel, ts, thread_ts=thread_ts):
+                logging.info(f"Message {ts} already processed. Skipping.\n")
+                return
             feedback_event = {
                 "text": text,  # Message content
                 "ts": ts,  # Message timestamp acting as unique ID in slack
@@ -128,12 +119,12 @@ class ChannelMessageHandler(SlackEventHandler):
                 "user": user_id,
                 "parent_question": parent_question
             }
-            # publish feedback event to the persist queue
+            observe("slack_receipt", time.time() - float(ts), kind="feedback")
+            # publish feedback event to the consumers
             try:
-                # Make an API call to publish the feedback
-                response = requests.post("http://localhost:8000/api/v1/feedback/", json=feedback_event)
-                response.raise_for_status()
-                logging.info(f"Feedback published: {feedback_event}")
+                with span("event_publish", kind="feedback"):
+                    self.event_transport.publish_feedback(feedback_event)
+                log_event(logging.INFO, "Feedback published", ts=ts, thread_ts=thread_ts, channel=channel)
             except Exception as e:
                 logging.error(f"Error publishing feedback event: {e}")
 
@@ -141,15 +132,6 @@ class ChannelMessageHandler(SlackEventHandler):
         else:
             logging.info(f"Skipping message with ID {ts} from user {user_id}. Reason: {skip_reason}")
 
-        # Update the processed_messages set with the 'ts'
-        try:
-            self.processed_messages.add(ts)
-        except Exception as e:
-            logging.error(f"Error adding message to processed messages: {e}")
-
-        logging.debug(f"Current Questions: {self.questions}")
-        logging.debug(f"Processed Messages: {self.processed_messages}")
-
     def is_valid_message(self, event):
         """ Check if the event is a valid user message """
         return "subtype" not in event and (event.get("type") == "message" or event.get("type") == "app_mention")
@@ -167,17 +149,39 @@ class ChannelMessageHandler(SlackEventHandler):
         return "Unknown reason"
 
 
+class DispatchingEventHandler(SlackEventHandler):
+    """Acknowledges events immediately and hands them to the worker processes of a dispatcher"""
+
+    def __init__(self, dispatcher: SlackEventDispatcher):
+        self.dispatcher = dispatcher
+
+    def handle(self, client: SocketModeClient, req: SocketModeRequest, web_client: WebClient, bot_user_id: str):
+        """Acknowledge the event and queue it for its worker"""
+        client.send_socket_mode_response(SocketModeResponse(envelope_id=req.envelope_id))
+        event = req.payload.get("event", {})
+        try:
+            self.dispatcher.dispatch(event)
+        except Exception as e:
+            logging.error(f"Error dispatching event {event.get('ts')}: {e}")
+
+
 class SlackBot:
     """A bot that listens to events from slack and processes them using event handlers"""
-    def __init__(self, token: str, app_token: str, bot_user_id: str, event_handlers: List[SlackEventHandler]):
-        """ Initialize the bot with the necessary tokens and event handlers"""
-        self.web_client = WebClient(token=token)
+    def __init__(self, token: str, app_token: str, bot_user_id: str, event_handlers: List[SlackEventHandler],
+                 dispatcher: SlackEventDispatcher = None):
+        """ Initialize the bot with the necessary tokens and event handlers, and the dispatcher they hand events to"""
+        self.web_client = create_web_client(token)
         self.socket_mode_client = SocketModeClient(app_token=app_token, web_client=self.web_client)
         self.bot_user_id = bot_user_id
         self.event_handlers = event_handlers
+        self.dispatcher = dispatcher
 
     def start(self):
         """Start the bot and listen to events"""
+        # Start the worker processes before events start flowing in
+        if self.dispatcher:
+            self.dispatcher.start()
+
         # Add event handlers to the socket mode client
         for event_handler in self.event_handlers:
             event_handler_func = partial(event_handler.handle, web_client=self.web_client, bot_user_id=self.bot_user_id)
@@ -192,27 +196,47 @@ class SlackBot:
         try:
             while True:
                 logging.debug("Bot is running...")
-                time.sleep(1000)
+                time.sleep(slack_metrics_log_interval_seconds)
+                if self.dispatcher:
+                    self.dispatcher.log_metrics()
         # Stop the bot if the user interrupts
         except KeyboardInterrupt:
             logging.info("Bot stopped by the user")
         # Stop the bot if an exception occurs
         except Exception as e:
             logging.critical("Bot stopped due to an exception", exc_info=True)
+        finally:
+            self.socket_mode_client.close()
+            if self.dispatcher:
+                self.dispatcher.stop()
+            # Handlers consuming events in this process finish them and send their replies
+            for event_handler in self.event_handlers:
+                event_transport = getattr(event_handler, "event_transport", None)
+                if event_transport:
+                    event_transport.stop()
 
 
 def load_slack_bot():
     """Load the slack bot"""
-    logging.basicConfig(level=logging.INFO)
+    configure_logging()
+    configure_tracing("nur-slack-bot")
+    bot_user_id = get_bot_user_id(slack_bot_user_oauth_token)
+    if slack_event_transport == "in_process" and slack_event_worker_count > 0:
+        # Each worker would answer with its own consumers, API limits and Slack pacing
+        raise ValueError("The in_process slack event transport requires slack_event_worker_count = 0, "
+                         "use the http transport to answer events with worker processes")
     # Initialize the bot with the necessary tokens and event handlers
-    event_handlers = [ChannelMessageHandler()]
-    bot = SlackBot(slack_bot_user_oauth_token, slack_app_level_token, bot_user_id, event_handlers)
+    if slack_event_worker_count > 0:
+        # Handle events in worker processes, the listener only acknowledges and dispatches them
+        dispatcher = SlackEventDispatcher(ChannelMessageHandler, bot_user_id)
+        event_handlers = [DispatchingEventHandler(dispatcher)]
+    else:
+        dispatcher = None
+        event_handlers = [ChannelMessageHandler()]
+    bot = SlackBot(slack_bot_user_oauth_token, slack_app_level_token, bot_user_id, event_handlers, dispatcher)
     bot.start()
 
 
-bot_user_id = get_bot_user_id(slack_bot_user_oauth_token)
-
-
 if __name__ == "__main__":
     try:
         load_slack_bot()
@@ -0,0 +1,79 @@
+# ./slack/consumer_pool.py
+import logging
+import queue
+import threading
+import time
+import zlib
+from configuration import event_consumer_count, event_consumer_queue_size
+from database.slack_message_store import SlackMessageStore
+from slack.event_consumer import EventConsumer, QuestionEvent, FeedbackEvent
+from slack.message_scheduler import get_message_scheduler
+from threads.dynamic_executor_assistants import DynamicExecutor
+from threads.task_scheduler import get_task_scheduler
+from telemetry.latency import observe, span
+
+
+class EventConsumerPool:
+    """
+    A fixed pool of long-lived event consumers.
+
+    Each consumer thread builds one EventConsumer when the pool starts and reuses it, with its clients,
+    chroma collections and caches, for every event it handles. The executor and the message store are
+    shared by all consumers. Events are routed by thread so a question and its feedback are consumed in
+    order by the same consumer.
+    """
+
+    def __init__(self, consumer_count=event_consumer_count, queue_size=event_consumer_queue_size):
+        """
+        Initializes the pool and starts the consumer threads.
+
+        Args:
+        consumer_count (int): The number of consumer threads.
+        queue_size (int): The maximum number of pending events per consumer, submitting blocks when it is reached.
+        """
+        self.executor = DynamicExecutor()
+        self.message_store = SlackMessageStore()
+        self.queues = [queue.Queue(queue_size) for _ in range(consumer_count)]
+        self.consumer_threads = [threading.Thread(target=self.run_consumer, args=(event_queue,), daemon=True,
+                                                  name=f"event-consumer-{index}")
+                                 for index, event_queue in enumerate(self.queues)]
+        for consumer_thread in self.consumer_threads:
+            consumer_thread.start()
+        logging.info(f"Started {consumer_count} event consumers")
+
+    def run_consumer(self, event_queue):
+        consumer = EventConsumer(executor=self.executor, message_store=self.message_store)
+        while (item := event_queue.get()) is not None:
+            kind, event, submitted_at = item
+            observe("consumer_queue_wait", time.monotonic() - submitted_at, kind=kind)
+            try:
+                with span("event_total", kind=kind):
+                    if kind == "question":
+                        consumer.process_question(event)
+                    else:
+                        consumer.process_feedback(event)
+            except Exception as e:
+                logging.error(f"Error consuming {kind} event {event.ts}: {e}")
+            finally:
+                consumer.close_event_session()
+
+    def submit(self, kind, event):
+        thread_key = event.thread_ts or event.ts
+        self.queues[zlib.crc32(thread_key.encode()) % len(self.queues)].put((kind, event, time.monotonic()))
+
+    def submit_question(self, question_event: QuestionEvent):
+        self.submit("question", question_event)
+
+    def submit_feedback(self, feedback_event: FeedbackEvent):
+        self.submit("feedback", feedback_event)
+
+    def shutdown(self, timeout=60):
+        """Let the consumers finish their pending events, stop them and flush the queued slack messages."""
+        for event_queue in self.queues:
+            event_queue.put(None)
+        for consumer_thread in self.consumer_threads:
+            consumer_thread.join(timeout)
+        self.executor.shutdown(wait=False)
+        get_task_scheduler().shutdown()
+        get_message_scheduler().stop()
+        logging.info("Event consumers stopped")
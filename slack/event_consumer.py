@@ -1,12 +1,18 @@
 import logging
+import time
 from datetime import datetime
 from pydantic import BaseModel
-from slack_sdk import WebClient
-from credentials import slack_bot_user_oauth_token
-from vector.chroma_threads import retrieve_relevant_documents
-from database.nur_database import QAInteractionManager, Session, SlackMessageDeduplication
+from slack_sdk.errors import SlackApiError
+from configuration import embedding_model_id, answer_cache_enabled, answer_engine, slack_channel_space_keys
+from vector.chroma_threads import retrieve_relevant_documents, embed_text
+from vector.answer_cache import AnswerCache
+from vector.qa_interaction_index import QAInteractionIndex
+from database.nur_database import QAInteractionManager, ConversationManager, ScopedSession
+from database.slack_message_store import SlackMessageStore
+from slack.message_scheduler import get_message_scheduler
 from threads.dynamic_executor_assistants import DynamicExecutor
-from oai_assistants.query_assistant_from_documents import query_assistant_with_context
+from telemetry.latency import observe, span
+from telemetry.structured_logging import log_event, log_payload
 
 
 class QuestionEvent(BaseModel):
@@ -25,44 +31,125 @@ class FeedbackEvent(BaseModel):
     user: str
 
 
+def observe_end_to_end(kind, message_ts):
+    """Record the time from a Slack message being posted to its answer being delivered, once it is."""
+    def record(future):
+        if not future.cancelled() and future.exception() is None:
+            observe("end_to_end", time.time() - float(message_ts), kind=kind)
+    return record
+
+
 class EventConsumer:
-    def __init__(self):
-        self.web_client = WebClient(token=slack_bot_user_oauth_token)
-        self.db_session = Session()
+    """
+    Answers question and feedback events. A consumer is long-lived and handles one event at a time,
+    its database session is thread-local and released after every event by close_event_session().
+    """
+
+    def __init__(self, executor: DynamicExecutor = None, message_store: SlackMessageStore = None):
+        self.message_scheduler = get_message_scheduler()
+        self.web_client = self.message_scheduler.web_client
+        self.db_session = ScopedSession
         self.interaction_manager = QAInteractionManager(self.db_session)
-        self.executor = DynamicExecutor()
+        self.message_store = message_store or SlackMessageStore()
+        self.executor = executor or DynamicExecutor()
+        self.answer_cache = AnswerCache() if answer_cache_enabled else None
+        self.interaction_index = QAInteractionIndex()
         logging.log(logging.DEBUG, f"Slack Event Consumer initiated successfully")
 
+    def close_event_session(self):
+        """Release the database session used for the current event."""
+        self.db_session.remove()
+
     def is_message_processed_in_db(self, channel_id, message_ts):
-        return self.db_session.query(SlackMessageDeduplication).filter_by(channel_id=channel_id, message_ts=message_ts).first() is not None
+        return self.message_store.is_answered(message_ts)
 
     def record_message_as_processed_in_db(self, channel_id, message_ts):
-        dedup_record = SlackMessageDeduplication(channel_id=channel_id, message_ts=message_ts)
-        self.db_session.add(dedup_record)
-        self.db_session.commit()
+        self.message_store.mark_answered(channel_id, message_ts)
 
     def add_question_and_response_to_database(self, question_event, response_text, assistant_thread_id):
-        self.interaction_manager.add_question_and_answer(question=question_event.text, answer=response_text, thread_id=question_event.ts, assistant_thread_id=assistant_thread_id, channel_id=question_event.channel, question_ts=datetime.fromtimestamp(float(question_event.ts)), answer_ts=datetime.now())
-        print(f"\n\nQuestion and answer stored in the database: question: {question_event.dict()},\nAnswer: {response_text},\nAssistant_id {assistant_thread_id}\n\n")
+        interaction = self.interaction_manager.add_question_and_answer(question=question_event.text, answer=response_text, thread_id=question_event.ts, assistant_thread_id=assistant_thread_id, channel_id=question_event.channel, question_ts=datetime.fromtimestamp(float(question_event.ts)), answer_ts=datetime.now())
+        log_event(logging.INFO, "Question and answer stored in the database", ts=question_event.ts,
+                  assistant_thread_id=assistant_thread_id)
+        return interaction
+
+    def get_thread_permalink(self, channel_id, message_ts):
+        try:
+            return self.web_client.chat_getPermalink(channel=channel_id, message_ts=message_ts)["permalink"]
+        except SlackApiError as e:
+            logging.warning(f"Error fetching permalink for message {message_ts}: {e.response['error']}")
+            return None
+
+    def answer_from_cache(self, question_event: QuestionEvent, cache_entry):
+        """Reply to a question with a previously produced answer and link to the thread where it was given."""
+        permalink = self.get_thread_permalink(cache_entry.channel_id, cache_entry.thread_id)
+        reference = f"<{permalink}|original thread>" if permalink else "a previous thread"
+        response_text = f"{cache_entry.answer_text}\n\n_This question was answered before in {reference}._"
+        try:
+            self.record_message_as_processed_in_db(question_event.channel, question_event.ts)
+            if answer_engine == "chat":
+                # Seed the conversation so follow-ups in this thread see the cached answer
+                ConversationManager(self.db_session).add_exchange(question_event.ts, question_event.text, cache_entry.answer_text)
+                self.add_question_and_response_to_database(question_event, response_text, question_event.ts)
+            else:
+                self.add_question_and_response_to_database(question_event, response_text, None)
+            self.message_scheduler.post_message(question_event.channel, response_text, thread_ts=question_event.ts
+                                                ).add_done_callback(observe_end_to_end("cached_question", question_event.ts))
+            log_event(logging.INFO, "Cached response queued for Slack thread", ts=question_event.ts)
+        except Exception as e:
+            logging.error(f"Error registering message as processed, adding to db and responding from cache on slack: {e}")
+
+    def find_related_interactions(self, question_embedding):
+        try:
+            return self.interaction_index.find_related(question_embedding)
+        except Exception as e:
+            logging.error(f"Error looking up related interactions: {e}")
+            return []
 
     def process_question(self, question_event: QuestionEvent):
         channel_id = question_event.channel
         message_ts = question_event.ts
+        context_page_ids = []
+        question_embedding = None
         try:
-            context_page_ids = retrieve_relevant_documents(question_event.text)
-            response_text, assistant_thread_id = query_assistant_with_context(question_event.text, context_page_ids, None)
+            with span("embedding"):
+                question_embedding = embed_text(question_event.text, embedding_model_id)
+            if self.answer_cache:
+                with span("answer_cache_lookup"):
+                    cache_entry, _ = self.answer_cache.lookup(question_embedding)
+                if cache_entry:
+                    self.answer_from_cache(question_event, cache_entry)
+                    return
+            with span("vector_query"):
+                context_page_ids = retrieve_relevant_documents(question_event.text, query_embedding=question_embedding,
+                                                               space_keys=slack_channel_space_keys.get(channel_id))
+            with span("related_interactions"):
+                related_interactions = self.find_related_interactions(question_embedding)
+            # The chat engine keeps the conversation under the Slack thread, the assistant creates a new thread
+            conversation_id = message_ts if answer_engine == "chat" else None
+            with span("answer", engine=answer_engine):
+                future = self.executor.add_task(question_event.text, context_page_ids, conversation_id, related_interactions)
+                response_text, assistant_thread_id = self.executor.get_result(future)
         except Exception as e:
-            print(f"Error processing question: {e}")
+            log_event(logging.ERROR, "Error processing question", ts=message_ts, error=e)
             response_text = None
         if response_text:
-            print(f"Response from assistant: {response_text}\n")
+            log_payload("Response from assistant", sample_key=message_ts, question=question_event.text, answer=response_text)
             try:
-                self.record_message_as_processed_in_db(channel_id, message_ts)
-                self.add_question_and_response_to_database(question_event, response_text, assistant_thread_id)
-                self.web_client.chat_postMessage(channel=channel_id, text=response_text, thread_ts=message_ts)
-                print(f"\nResponse posted to Slack thread: {message_ts}\n")
+                with span("store_interaction"):
+                    self.record_message_as_processed_in_db(channel_id, message_ts)
+                    interaction = self.add_question_and_response_to_database(question_event, response_text, assistant_thread_id)
+                self.message_scheduler.post_message(channel_id, response_text, thread_ts=message_ts).add_done_callback(
+                    observe_end_to_end("question", message_ts))
+                log_event(logging.INFO, "Response queued for Slack thread", ts=message_ts)
+                self.interaction_index.add_interaction(interaction)
             except Exception as e:
-                print(f"Error registering message as processed, adding to db and responding to the question on slack: {e}")
+                logging.error(f"Error registering message as processed, adding to db and responding to the question on slack: {e}")
+            if self.answer_cache and response_text != "No response received.":
+                try:
+                    self.answer_cache.store(message_ts, channel_id, question_event.text, response_text,
+                                            question_embedding, context_page_ids)
+                except Exception as e:
+                    logging.error(f"Error adding answer for message {message_ts} to the answer cache: {e}")
 
     def generate_extended_context_query(self, existing_interaction, feedback_text):
         extended_context_query = ""
@@ -79,41 +166,36 @@ class EventConsumer:
         try:
             existing_interaction = self.interaction_manager.get_interaction_by_thread_id(thread_ts)
             assistant_thread_id = existing_interaction.assistant_thread_id if existing_interaction else None
-            print(f"\n\nExisting interaction found: {existing_interaction}\n\n")
+            log_event(logging.DEBUG, "Existing interaction found", thread_ts=thread_ts, found=existing_interaction is not None)
         except Exception as e:
-            print(f"Error getting existing interaction from the database: {e}")
+            logging.error(f"Error getting existing interaction from the database: {e}")
             existing_interaction = None
             assistant_thread_id = None
         if existing_interaction:
             extended_context_query = self.generate_extended_context_query(existing_interaction, feedback_event.text)
-            print(f"\n\nExtended context: {extended_context_query}\n\n")
-            page_ids = retrieve_relevant_documents(extended_context_query)
+            log_payload("Extended context", sample_key=thread_ts, query=extended_context_query)
+            with span("vector_query"):
+                page_ids = retrieve_relevant_documents(extended_context_query,
+                                                       space_keys=slack_channel_space_keys.get(channel_id))
             try:
-                response_text, assistant_thread_id = query_assistant_with_context(feedback_event.text, page_ids, assistant_thread_id)
+                conversation_id = thread_ts if answer_engine == "chat" else assistant_thread_id
+                with span("answer", engine=answer_engine):
+                    future = self.executor.add_task(feedback_event.text, page_ids, conversation_id)
+                    response_text, assistant_thread_id = self.executor.get_result(future)
             except Exception as e:
-                print(f"Error processing feedback: {e}")
+                log_event(logging.ERROR, "Error processing feedback", ts=message_ts, error=e)
                 response_text = None
 
         if response_text:
-            print(f"Response from assistant: {response_text}\n")
+            log_payload("Response from assistant", sample_key=thread_ts, feedback=feedback_event.text, answer=response_text)
             self.record_message_as_processed_in_db(channel_id, message_ts)
             timestamp_str = datetime.now().isoformat()
             comment = {"text": feedback_event.text, "user": feedback_event.user, "timestamp": timestamp_str, "assistant response": response_text}
             self.interaction_manager.add_comment_to_interaction(thread_id=thread_ts, comment=comment)
-            print(f"Feedback appended to the interaction in the database: {feedback_event.dict()}\n")
-            self.web_client.chat_postMessage(channel=channel_id, text=response_text, thread_ts=thread_ts)
-            print(f"Feedback response posted to Slack thread: {message_ts}\n")
+            log_event(logging.INFO, "Feedback appended to the interaction in the database", ts=message_ts, thread_ts=thread_ts)
+            self.message_scheduler.post_message(channel_id, response_text, thread_ts=thread_ts).add_done_callback(
+                observe_end_to_end("feedback", message_ts))
+            log_event(logging.INFO, "Feedback response queued for Slack thread", ts=message_ts, thread_ts=thread_ts)
         else:
-            print(f"No response generated for feedback: {feedback_event.dict()}\n")
-
-
-def process_question(question_event: QuestionEvent):
-    """Directly processes a question event without using the queue."""
-    consumer = EventConsumer()
-    consumer.process_question(question_event)
-
+            log_event(logging.WARNING, "No response generated for feedback", ts=message_ts, thread_ts=thread_ts)
 
-def process_feedback(feedback_event: FeedbackEvent):
-    """Directly processes a feedback event without using the queue."""
-    consumer = EventConsumer()
-    consumer.process_feedback(feedback_event)
@@ -0,0 +1,139 @@
+# ./slack/event_dispatcher.py
+import logging
+import multiprocessing
+import threading
+import time
+import zlib
+from configuration import slack_event_worker_count, slack_event_queue_size
+from telemetry.structured_logging import configure_logging, stop_logging
+
+
+def run_event_worker(worker_index, event_queue, handler_factory, bot_user_id, processed_counts, latency_totals):
+    """
+    Worker process loop: handle events from the queue until a None sentinel is received.
+
+    Args:
+    worker_index (int): The index of this worker, used to update its metrics.
+    event_queue (multiprocessing.Queue): The queue of (event, received_at) tuples for this worker.
+    handler_factory (callable): Creates the handler, called once inside the worker process, its event transport
+        is stopped when the worker stops.
+    bot_user_id (str): The slack bot user id, messages from the bot are skipped.
+    processed_counts (multiprocessing.Array): Shared count of handled events per worker.
+    latency_totals (multiprocessing.Array): Shared sum of seconds from receipt to handled per worker.
+    """
+    configure_logging()
+    handler = handler_factory()
+    logging.info(f"Slack event worker {worker_index} started")
+    while True:
+        item = event_queue.get()
+        if item is None:
+            break
+        event, received_at = item
+        try:
+            handler.process_event(event, bot_user_id)
+        except Exception as e:
+            logging.error(f"Slack event worker {worker_index} failed to handle event {event.get('ts')}: {e}")
+        with processed_counts.get_lock():
+            processed_counts[worker_index] += 1
+        with latency_totals.get_lock():
+            latency_totals[worker_index] += time.time() - received_at
+    # Answer the events still queued in the worker's transport and send their replies before exiting
+    handler.event_transport.stop()
+    logging.info(f"Slack event worker {worker_index} stopped")
+    # Worker processes exit without running atexit handlers
+    stop_logging()
+
+
+class SlackEventDispatcher:
+    """
+    Fans Slack events out to a pool of worker processes.
+
+    Every event is routed by its thread: a message and all replies in its thread go to the same worker,
+    so they are handled in the order they were received, while different threads are handled in parallel.
+    """
+
+    def __init__(self, handler_factory, bot_user_id, worker_count=slack_event_worker_count,
+                 queue_size=slack_event_queue_size):
+        """
+        Initializes the dispatcher, the workers are started with start().
+
+        Args:
+        handler_factory (callable): A picklable callable creating an object with a process_event(event, bot_user_id) method.
+        bot_user_id (str): The slack bot user id.
+        worker_count (int): The number of worker processes.
+        queue_size (int): The maximum number of pending events per worker, dispatch blocks when it is reached.
+        """
+        # Spawn so workers never inherit the listener's sockets, threads or database connections
+        context = multiprocessing.get_context("spawn")
+        self.worker_count = worker_count
+        self.handler_factory = handler_factory
+        self.bot_user_id = bot_user_id
+        self.queues = [context.Queue(queue_size) for _ in range(worker_count)]
+        self.dispatched_counts = [0] * worker_count
+        self.dispatch_lock = threading.Lock()
+        self.processed_counts = context.Array('q', worker_count)
+        self.latency_totals = context.Array('d', worker_count)
+        self.workers = [
+            context.Process(target=run_event_worker, name=f"slack-event-worker-{index}", daemon=True,
+                            args=(index, self.queues[index], handler_factory, bot_user_id,
+                                  self.processed_counts, self.latency_totals))
+            for index in range(worker_count)
+        ]
+
+    def start(self):
+        """Start the worker processes."""
+        for worker in self.workers:
+            worker.start()
+        logging.info(f"Started {self.worker_count} slack event workers")
+
+    def worker_index_for(self, event):
+        """Pick the worker for an event, stable for all messages of a thread."""
+        thread_key = event.get("thread_ts") or event.get("ts") or ""
+        return zlib.crc32(thread_key.encode()) % self.worker_count
+
+    def dispatch(self, event):
+        """
+        Hand an event to its worker, blocking while that worker's queue is full.
+
+        Args:
+        event (dict): The slack event payload.
+        """
+        worker_index = self.worker_index_for(event)
+        self.queues[worker_index].put((event, time.time()))
+        with self.dispatch_lock:
+            self.dispatched_counts[worker_index] += 1
+
+    def metrics(self):
+        """
+        Get the load of every worker.
+
+        Returns:
+        list: A dict per worker with the pending, processed and average latency of its events.
+        """
+        worker_metrics = []
+        for index in range(self.worker_count):
+            processed = self.processed_counts[index]
+            worker_metrics.append({
+                "worker": index,
+                "alive": self.workers[index].is_alive(),
+                "pending": self.dispatched_counts[index] - processed,
+                "processed": processed,
+                "average_latency_seconds": self.latency_totals[index] / processed if processed else 0.0
+            })
+        return worker_metrics
+
+    def log_metrics(self):
+        for worker_metrics in self.metrics():
+            logging.info(f"Slack event worker {worker_metrics['worker']}: alive={worker_metrics['alive']}, "
+                         f"pending={worker_metrics['pending']}, processed={worker_metrics['processed']}, "
+                         f"average latency={worker_metrics['average_latency_seconds']:.3f}s")
+
+    def stop(self, timeout=90):
+        """Let the workers finish their pending events, and those queued in their transports, and stop them."""
+        for event_queue in self.queues:
+            event_queue.put(None)
+        for worker in self.workers:
+            worker.join(timeout)
+            if worker.is_alive():
+                worker.terminate()
+        logging.info("Slack event workers stopped")
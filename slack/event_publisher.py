@@ -1,8 +1,10 @@
 # ./slack/event_publisher.py
 import os
 import fcntl
+import logging
 from persistqueue import Queue
 from configuration import persist_question_queue_path, persist_feedback_queue_path, persist_message_queue_path
+from telemetry.structured_logging import log_event
 
 
 class EventPublisher:
@@ -24,18 +26,18 @@ class EventPublisher:
             fcntl.flock(f, fcntl.LOCK_EX)
             self.message_queue.put(message_event)
             fcntl.flock(f, fcntl.LOCK_UN)
-        print(f"New message event enqueued: {message_event}")
+        log_event(logging.DEBUG, "New message event enqueued", ts=message_event.get("ts"))
 
     def publish_new_question(self, question_event):
         with open(self.question_queue_lock_path, 'r+') as f:
             fcntl.flock(f, fcntl.LOCK_EX)
             self.question_queue.put(question_event)
             fcntl.flock(f, fcntl.LOCK_UN)
-        print(f"New question event enqueued: {question_event}")
+        log_event(logging.DEBUG, "New question event enqueued", ts=question_event.get("ts"))
 
     def publish_new_feedback(self, feedback_event):
         with open(self.feedback_queue_lock_path, 'r+') as f:
             fcntl.flock(f, fcntl.LOCK_EX)
             self.feedback_queue.put(feedback_event)
             fcntl.flock(f, fcntl.LOCK_UN)
-        print(f"New feedback event enqueued: {feedback_event}")
+        log_event(logging.DEBUG, "New feedback event enqueued", ts=feedback_event.get("ts"))
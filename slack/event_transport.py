@@ -0,0 +1,84 @@
+# ./slack/event_transport.py
+from abc import ABC, abstractmethod
+import requests
+from configuration import slack_event_transport, slack_event_api_url
+from configuration import event_consumer_count, event_consumer_queue_size
+from slack.consumer_pool import EventConsumerPool
+from slack.event_consumer import QuestionEvent, FeedbackEvent
+
+
+class EventTransport(ABC):
+    """Carries question and feedback events from the slack bot to the event consumers"""
+
+    @abstractmethod
+    def publish_question(self, question_event: dict):
+        pass
+
+    @abstractmethod
+    def publish_feedback(self, feedback_event: dict):
+        pass
+
+    def stop(self):
+        pass
+
+
+class HttpEventTransport(EventTransport):
+    """Posts events to the API, which runs the consumers in another process or host"""
+
+    def __init__(self, api_url=slack_event_api_url):
+        self.api_url = api_url
+        # Reuse connections to the API across events
+        self.http_session = requests.Session()
+
+    def post(self, path, event):
+        response = self.http_session.post(f"{self.api_url}/{path}/", json=event)
+        response.raise_for_status()
+
+    def publish_question(self, question_event: dict):
+        self.post("questions", question_event)
+
+    def publish_feedback(self, feedback_event: dict):
+        self.post("feedback", feedback_event)
+
+
+class InProcessEventTransport(EventTransport):
+    """
+    Hands events to a pool of long-lived consumers running in the bot process through bounded in-memory queues.
+    """
+
+    def __init__(self, consumer_count=event_consumer_count, queue_size=event_consumer_queue_size):
+        """
+        Initializes the transport and starts the consumer pool.
+
+        Args:
+        consumer_count (int): The number of consumer threads.
+        queue_size (int): The maximum number of pending events per consumer, publishing blocks when it is reached.
+        """
+        self.consumer_pool = EventConsumerPool(consumer_count, queue_size)
+
+    def publish_question(self, question_event: dict):
+        self.consumer_pool.submit_question(QuestionEvent(**question_event))
+
+    def publish_feedback(self, feedback_event: dict):
+        self.consumer_pool.submit_feedback(FeedbackEvent(**feedback_event))
+
+    def stop(self, timeout=60):
+        """Let the consumers finish their pending events and stop them."""
+        self.consumer_pool.shutdown(timeout)
+
+
+def create_event_transport(transport=slack_event_transport):
+    """
+    Create the transport selected in the configuration.
+
+    Args:
+    transport (str): "http" to post events to the API or "in_process" to consume them in this process.
+
+    Returns:
+    EventTransport: The transport.
+    """
+    if transport == "in_process":
+        return InProcessEventTransport()
+    if transport == "http":
+        return HttpEventTransport()
+    raise ValueError(f"Unknown slack event transport: {transport}")
@@ -0,0 +1,240 @@
+# ./slack/message_scheduler.py
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError
+from slack_sdk.http_retry.builtin_handlers import ConnectionErrorRetryHandler
+from credentials import slack_bot_user_oauth_token
+from configuration import slack_channel_min_interval_seconds, slack_sender_thread_count, slack_send_max_attempts
+from configuration import slack_api_base_url
+from telemetry.latency import observe
+
+
+def create_web_client(token):
+    """
+    Create a slack WebClient that retries on connection errors.
+    Rate limited calls are not retried by the client, the message scheduler pauses the rate limited channel
+    for the Retry-After slack returns instead of holding a sender thread.
+
+    Args:
+    token (str): The slack bot user oauth token.
+
+    Returns:
+    WebClient: The configured client.
+    """
+    web_client = WebClient(token=token, base_url=slack_api_base_url) if slack_api_base_url else WebClient(token=token)
+    web_client.retry_handlers.append(ConnectionErrorRetryHandler(max_retry_count=2))
+    return web_client
+
+
+def get_retry_after_seconds(response, default=1.0):
+    """Read the Retry-After header of a rate limited slack response."""
+    for name, value in response.headers.items():
+        if name.lower() == "retry-after":
+            return float(value[0] if isinstance(value, list) else value)
+    return default
+
+
+class OutboundMessage:
+    """A message waiting to be sent, resolved through its future once Slack accepted or rejected it"""
+
+    def __init__(self, method, channel, text, thread_ts=None, ts=None):
+        self.method = method  # "post" or "update"
+        self.channel = channel
+        self.text = text
+        self.thread_ts = thread_ts
+        self.ts = ts  # Timestamp of the message to update
+        self.attempts = 0
+        self.enqueued_at = time.monotonic()
+        self.future = Future()
+
+
+class SlackMessageScheduler:
+    """
+    Delivers outbound slack messages at the highest rate slack allows.
+
+    Messages are queued per channel and each channel is sent to at most once per
+    slack_channel_min_interval_seconds, in order. A rate limited channel is paused for the Retry-After
+    returned by slack and its message is retried, pending updates of the same message are coalesced
+    into the latest one, and the queue depth and delivery latency are exposed through metrics().
+    """
+
+    def __init__(self, web_client, min_interval_seconds=slack_channel_min_interval_seconds,
+                 sender_count=slack_sender_thread_count, max_attempts=slack_send_max_attempts):
+        """
+        Initializes the scheduler and starts its sender threads.
+
+        Args:
+        web_client (WebClient): The client used to send the messages.
+        min_interval_seconds (float): The minimum time between two messages sent to the same channel.
+        sender_count (int): The number of threads sending messages, each channel is only sent to by one at a time.
+        max_attempts (int): The number of times a message is tried before it is given up.
+        """
+        self.web_client = web_client
+        self.min_interval_seconds = min_interval_seconds
+        self.max_attempts = max_attempts
+        self.channel_queues = {}  # channel -> deque of OutboundMessage, for the channels with messages waiting
+        self.channel_ready_at = {}  # channel -> monotonic time the channel can be sent to again
+        self.busy_channels = set()
+        self.condition = threading.Condition()
+        self.sent_count = 0
+        self.failed_count = 0
+        self.rate_limited_count = 0
+        self.latencies = deque(maxlen=1000)
+        self.running = True
+        self.senders = [threading.Thread(target=self.run_sender, name=f"slack-sender-{index}", daemon=True)
+                        for index in range(sender_count)]
+        for sender in self.senders:
+            sender.start()
+
+    def post_message(self, channel, text, thread_ts=None):
+        """
+        Queue a new message.
+
+        Returns:
+        Future: Resolves to the slack response once the message is posted.
+        """
+        return self.enqueue(OutboundMessage("post", channel, text, thread_ts=thread_ts))
+
+    def update_message(self, channel, ts, text):
+        """
+        Queue an update of an existing message, replacing any update of it that was not sent yet.
+
+        Returns:
+        Future: Resolves to the slack response once the latest text is applied.
+        """
+        with self.condition:
+            for message in self.channel_queues.get(channel, ()):
+                if message.method == "update" and message.ts == ts:
+                    message.text = text
+                    return message.future
+        return self.enqueue(OutboundMessage("update", channel, text, ts=ts))
+
+    def enqueue(self, message):
+        with self.condition:
+            self.channel_queues.setdefault(message.channel, deque()).append(message)
+            self.condition.notify()
+        return message.future
+
+    def next_message(self):
+        """Wait for a channel that can be sent to and take its next message."""
+        with self.condition:
+            while self.running:
+                now = time.monotonic()
+                wait_time = None
+                # A pause that is over no longer holds its channel back, so idle channels are forgotten
+                for channel in [channel for channel, ready_at in self.channel_ready_at.items() if ready_at <= now]:
+                    del self.channel_ready_at[channel]
+                for channel, channel_queue in self.channel_queues.items():
+                    if not channel_queue or channel in self.busy_channels:
+                        continue
+                    ready_at = self.channel_ready_at.get(channel, 0)
+                    if ready_at <= now:
+                        self.busy_channels.add(channel)
+                        message = channel_queue.popleft()
+                        if not channel_queue:
+                            # Channels are only kept while they have messages waiting
+                            del self.channel_queues[channel]
+                        return message
+                    wait_time = ready_at - now if wait_time is None else min(wait_time, ready_at - now)
+                self.condition.wait(wait_time)
+            return None
+
+    def run_sender(self):
+        while (message := self.next_message()) is not None:
+            self.send(message)
+
+    def send(self, message):
+        message.attempts += 1
+        pause_seconds = self.min_interval_seconds
+        requeue = False
+        try:
+            if message.method == "update":
+                response = self.web_client.chat_update(channel=message.channel, ts=message.ts, text=message.text)
+            else:
+                response = self.web_client.chat_postMessage(channel=message.channel, text=message.text,
+                                                            thread_ts=message.thread_ts)
+            message.future.set_result(response)
+            self.record_delivery(message)
+        except SlackApiError as e:
+            if e.response.status_code == 429 and message.attempts < self.max_attempts:
+                # Pause the channel for as long as slack asks and retry the same message first
+                pause_seconds = get_retry_after_seconds(e.response)
+                requeue = True
+                self.rate_limited_count += 1
+                logging.warning(f"Slack rate limited channel {message.channel}, retrying in {pause_seconds}s")
+            else:
+                self.record_failure(message, e)
+        except Exception as e:
+            if message.attempts < self.max_attempts:
+                requeue = True
+                logging.warning(f"Error sending slack message to channel {message.channel}, retrying: {e}")
+            else:
+                self.record_failure(message, e)
+        with self.condition:
+            if requeue:
+                self.channel_queues.setdefault(message.channel, deque()).appendleft(message)
+            self.channel_ready_at[message.channel] = time.monotonic() + pause_seconds
+            self.busy_channels.discard(message.channel)
+            self.condition.notify_all()
+
+    def record_delivery(self, message):
+        with self.condition:
+            self.sent_count += 1
+            self.latencies.append(time.monotonic() - message.enqueued_at)
+        observe("slack_post", time.monotonic() - message.enqueued_at, method=message.method)
+
+    def record_failure(self, message, error):
+        with self.condition:
+            self.failed_count += 1
+        logging.error(f"Giving up sending slack message to channel {message.channel} after {message.attempts} attempts: {error}")
+        message.future.set_exception(error)
+
+    def metrics(self):
+        """
+        Get the queue depth and delivery statistics.
+
+        Returns:
+        dict: The pending messages in total and per channel, sent, failed and rate limited counts,
+              and the median and 95th percentile of the seconds from queueing to delivery.
+        """
+        with self.condition:
+            channel_depths = {channel: len(channel_queue) for channel, channel_queue in self.channel_queues.items()
+                              if channel_queue}
+            latencies = sorted(self.latencies)
+            return {
+                "queue_depth": sum(channel_depths.values()),
+                "channel_queue_depths": channel_depths,
+                "sent": self.sent_count,
+                "failed": self.failed_count,
+                "rate_limited": self.rate_limited_count,
+                "latency_p50_seconds": latencies[len(latencies) // 2] if latencies else 0.0,
+                "latency_p95_seconds": latencies[int(len(latencies) * 0.95)] if latencies else 0.0
+            }
+
+    def stop(self, timeout=10):
+        """Send the queued messages for up to timeout seconds, then stop the sender threads."""
+        deadline = time.monotonic() + timeout
+        while self.metrics()["queue_depth"] and time.monotonic() < deadline:
+            time.sleep(0.1)
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        for sender in self.senders:
+            sender.join(max(deadline - time.monotonic(), 0))
+
+
+message_scheduler = None
+message_scheduler_lock = threading.Lock()
+
+
+def get_message_scheduler():
+    """Get the scheduler shared by everything sending slack messages in this process."""
+    global message_scheduler
+    with message_scheduler_lock:
+        if message_scheduler is None:
+            message_scheduler = SlackMessageScheduler(create_web_client(slack_bot_user_oauth_token))
+        return message_scheduler
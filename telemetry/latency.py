@@ -0,0 +1,183 @@
+# ./telemetry/latency.py
+import functools
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from configuration import telemetry_latency_buckets, telemetry_percentile_window, telemetry_trace_export_path
+
+# Latency of the stages of the question path.
+# Every stage is timed by a span and recorded in a histogram per stage, rendered in the Prometheus text format
+# by the API. When the opentelemetry sdk is installed the spans are also traced and written to a local file.
+
+try:
+    from opentelemetry import trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+except ImportError:
+    trace = None
+
+METRIC_NAME = "nur_stage_latency_seconds"
+
+
+class LatencyHistogram:
+    """Cumulative bucket counts of a stage, with a window of recent observations for percentiles"""
+
+    def __init__(self, buckets, window):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, seconds):
+        index = bisect_left(self.buckets, seconds)
+        if index < len(self.buckets):
+            self.bucket_counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+        self.recent.append(seconds)
+
+    def percentile(self, fraction):
+        if not self.recent:
+            return None
+        ordered = sorted(self.recent)
+        return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+class LatencyRecorder:
+    """
+    Histograms of stage latencies, keyed by stage and labels.
+    """
+
+    def __init__(self, buckets=telemetry_latency_buckets, window=telemetry_percentile_window):
+        self.buckets = tuple(sorted(buckets))
+        self.window = window
+        self.histograms = {}  # (stage, sorted label items) -> LatencyHistogram
+        self.lock = threading.Lock()
+
+    def observe(self, stage, seconds, **labels):
+        key = (stage, tuple(sorted((name, str(value)) for name, value in labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = LatencyHistogram(self.buckets, self.window)
+            histogram.observe(max(seconds, 0.0))
+
+    def summary(self):
+        """
+        Get the latency of every stage.
+
+        Returns:
+        list: The stage, labels, count, mean and recent p50, p95, p99 and maximum of every histogram, in seconds.
+        """
+        with self.lock:
+            return [{"stage": stage, "labels": dict(labels), "count": histogram.count,
+                     "mean": histogram.sum / histogram.count if histogram.count else None,
+                     "p50": histogram.percentile(0.5), "p95": histogram.percentile(0.95),
+                     "p99": histogram.percentile(0.99), "max": max(histogram.recent, default=None)}
+                    for (stage, labels), histogram in sorted(self.histograms.items())]
+
+    def render_prometheus(self):
+        """
+        Render the histograms in the Prometheus text exposition format.
+
+        Returns:
+        str: The metrics text.
+        """
+        lines = [f"# HELP {METRIC_NAME} Latency of the stages of the question path.",
+                 f"# TYPE {METRIC_NAME} histogram"]
+        with self.lock:
+            for (stage, labels), histogram in sorted(self.histograms.items()):
+                label_text = ",".join(f'{name}="{escape_label(value)}"' for name, value in (("stage", stage),) + labels)
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, histogram.bucket_counts):
+                    cumulative += bucket_count
+                    lines.append(f'{METRIC_NAME}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+                lines.append(f'{METRIC_NAME}_bucket{{{label_text},le="+Inf"}} {histogram.count}')
+                lines.append(f"{METRIC_NAME}_sum{{{label_text}}} {histogram.sum}")
+                lines.append(f"{METRIC_NAME}_count{{{label_text}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def escape_label(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+latency_recorder = LatencyRecorder()
+tracer = None
+
+
+def configure_tracing(service_name):
+    """
+    Trace the spans of this process with OpenTelemetry when its sdk is installed,
+    exporting them as JSON lines to telemetry_trace_export_path.
+
+    Args:
+    service_name (str): The name of the process in the traces, e.g. "nur-api".
+    """
+    global tracer
+    if trace is None or not telemetry_trace_export_path:
+        logging.info("OpenTelemetry is not installed or no trace export path is set, spans are not traced")
+        return
+    os.makedirs(os.path.dirname(telemetry_trace_export_path), exist_ok=True)
+    export_file = open(telemetry_trace_export_path, "a")
+    provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+    provider.add_span_processor(BatchSpanProcessor(
+        ConsoleSpanExporter(out=export_file, formatter=lambda exported_span: exported_span.to_json(indent=None) + "\n")))
+    trace.set_tracer_provider(provider)
+    tracer = trace.get_tracer("nur")
+
+
+def observe(stage, seconds, **labels):
+    """Record the latency of a stage measured by the caller."""
+    latency_recorder.observe(stage, seconds, **labels)
+
+
+@contextmanager
+def span(stage, **labels):
+    """
+    Time a stage of the question path, and trace it when tracing is configured.
+
+    Args:
+    stage (str): The name of the stage.
+    labels: Labels of the latency histogram, keep their values few.
+    """
+    trace_span = tracer.start_as_current_span(stage, attributes={name: str(value) for name, value in labels.items()}) \
+        if tracer is not None else None
+    started_at = time.perf_counter()
+    outcome = "ok"
+    try:
+        if trace_span is not None:
+            with trace_span:
+                yield
+        else:
+            yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        latency_recorder.observe(stage, time.perf_counter() - started_at, outcome=outcome, **labels)
+
+
+def timed(stage, **labels):
+    """Decorator timing every call of a function as a stage."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(stage, **labels):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def get_latency_summary():
+    return latency_recorder.summary()
+
+
+def render_prometheus_metrics():
+    return latency_recorder.render_prometheus()
@@ -0,0 +1,156 @@
+# ./telemetry/structured_logging.py
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+import threading
+import zlib
+from logging.handlers import QueueHandler, QueueListener
+from configuration import log_level, log_queue_size, log_field_max_chars, log_payload_sample_rate
+
+# Logging that stays cheap on the hot paths.
+# Records are put on a bounded queue and formatted and written by a background thread, so a slow stderr never
+# blocks a consumer, and records are dropped rather than queued without limit when the writer falls behind.
+# Fields are logged as key=value pairs, each capped at log_field_max_chars. Payloads such as questions, answers
+# and contexts are only logged at debug level and for a sample of the events.
+
+
+def truncate(value, max_chars=log_field_max_chars):
+    """
+    Cap the text of a logged value.
+
+    Args:
+    value: The value, logged as its str().
+    max_chars (int): The maximum number of characters kept.
+
+    Returns:
+    str: The text, with the number of characters cut when it was too long.
+    """
+    text = value if isinstance(value, str) else str(value)
+    if len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}...[{len(text) - max_chars} more chars]"
+
+
+class StructuredFormatter(logging.Formatter):
+    """Formats a record as its message followed by its fields as key=value pairs"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(processName)s %(name)s: %(message)s")
+
+    def format(self, record):
+        text = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            text += " " + " ".join(f"{name}={json.dumps(value, ensure_ascii=False)}" for name, value in fields.items())
+        return text
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Hands records to the log writer thread, dropping them when its queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # The message is merged here so the arguments are not shared with the writer thread,
+        # the formatting of the whole line is left to the writer
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+log_listener = None
+log_handler = None
+log_lock = threading.Lock()
+
+
+def configure_logging(level=log_level):
+    """
+    Send the records of this process through the asynchronous structured handler, once per process.
+
+    Args:
+    level (str): The level of the root logger, e.g. "INFO".
+    """
+    global log_listener, log_handler
+    with log_lock:
+        root = logging.getLogger()
+        root.setLevel(level)
+        if log_listener is not None:
+            return
+        stream_handler = logging.StreamHandler(sys.stderr)
+        stream_handler.setFormatter(StructuredFormatter())
+        log_handler = DroppingQueueHandler(queue.Queue(maxsize=log_queue_size))
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(log_handler)
+        log_listener = QueueListener(log_handler.queue, stream_handler, respect_handler_level=True)
+        log_listener.start()
+        atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Write the queued records and stop the writer thread."""
+    global log_listener
+    with log_lock:
+        if log_listener is not None:
+            log_listener.stop()
+            log_listener = None
+            if log_handler.dropped:
+                sys.stderr.write(f"{log_handler.dropped} log records were dropped, the log queue was full\n")
+
+
+def log_event(level, message, logger=None, **fields):
+    """
+    Log a message with fields, each capped in size.
+
+    Args:
+    level (int): The logging level.
+    message (str): The message, without the variable parts.
+    logger (logging.Logger): The logger, the root logger by default.
+    fields: The variable parts of the event.
+    """
+    logger = logger or logging.getLogger()
+    if logger.isEnabledFor(level):
+        logger.log(level, message, extra={"fields": {name: truncate(value) for name, value in fields.items()}})
+
+
+def is_sampled(sample_key=None, sample_rate=log_payload_sample_rate):
+    """
+    Decide whether the payloads of an event are logged.
+    Events with the same key are always sampled alike, so all the payloads of a sampled question are logged.
+    """
+    if sample_rate >= 1:
+        return True
+    if sample_rate <= 0:
+        return False
+    if sample_key is None:
+        return random.random() < sample_rate
+    return zlib.crc32(str(sample_key).encode()) % 10000 < sample_rate * 10000
+
+
+def log_payload(message, sample_key=None, logger=None, **fields):
+    """
+    Log large values such as questions, answers or contexts at debug level, for a sample of the events only.
+
+    Args:
+    message (str): The message.
+    sample_key: The key of the event, e.g. the Slack message ts, None to sample every call independently.
+    logger (logging.Logger): The logger, the root logger by default.
+    fields: The payloads, each capped in size.
+    """
+    logger = logger or logging.getLogger()
+    if logger.isEnabledFor(logging.DEBUG) and is_sampled(sample_key):
+        log_event(logging.DEBUG, message, logger, **fields)
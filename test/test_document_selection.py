@@ -0,0 +1,43 @@
+# ./test/test_document_selection.py
+import unittest
+from vector.document_selection import select_documents
+
+
+def select(scored_documents, page_tokens=100, **thresholds):
+    settings = {"min_count": 2, "max_count": 10, "similarity_cutoff": 0.25, "score_gap": 0.08, "token_budget": 7500}
+    settings.update(thresholds)
+    return select_documents(scored_documents, page_tokens=lambda page_id: page_tokens, **settings)
+
+
+class SelectDocumentsTest(unittest.TestCase):
+
+    def test_stops_below_similarity_cutoff(self):
+        scored_documents = [("a", 0.6), ("b", 0.55), ("c", 0.5), ("d", 0.2), ("e", 0.19)]
+        self.assertEqual(select(scored_documents), ["a", "b", "c"])
+
+    def test_stops_at_score_gap(self):
+        scored_documents = [("a", 0.8), ("b", 0.78), ("c", 0.76), ("d", 0.6), ("e", 0.59)]
+        self.assertEqual(select(scored_documents), ["a", "b", "c"])
+
+    def test_keeps_min_count_whatever_the_scores(self):
+        scored_documents = [("a", 0.9), ("b", 0.1), ("c", 0.09)]
+        self.assertEqual(select(scored_documents), ["a", "b"])
+
+    def test_stops_at_max_count(self):
+        scored_documents = [(str(index), 0.9 - index * 0.01) for index in range(20)]
+        self.assertEqual(select(scored_documents, max_count=4), ["0", "1", "2", "3"])
+
+    def test_stops_at_token_budget_even_within_min_count(self):
+        scored_documents = [("a", 0.9), ("b", 0.89), ("c", 0.88)]
+        self.assertEqual(select(scored_documents, page_tokens=3000), ["a", "b"])
+        self.assertEqual(select(scored_documents, page_tokens=5000), ["a"])
+
+    def test_keeps_first_page_over_token_budget(self):
+        self.assertEqual(select([("a", 0.9), ("b", 0.89)], page_tokens=10000), ["a"])
+
+    def test_no_candidates(self):
+        self.assertEqual(select([]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
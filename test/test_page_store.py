@@ -0,0 +1,84 @@
+# ./test/test_page_store.py
+import os
+import tempfile
+import unittest
+from unittest import mock
+from file_system.page_store import PageStore, RECORD_BEGIN, RECORD_PAGE
+
+
+class PageStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = PageStore(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def tear_batch(self):
+        """Append the beginning of a batch as a writer crashing in the middle of its write would."""
+        record = PageStore.pack(RECORD_PAGE, b"torn.txt", b"x" * 1000)
+        with open(self.store.data_path, 'ab') as file:
+            file.write(PageStore.pack(RECORD_BEGIN) + record[:len(record) // 2])
+
+    def test_batch_written_after_torn_batch_is_visible(self):
+        self.store.put("1.txt", "first page")
+        self.tear_batch()
+        self.store.put("2.txt", "second page")
+        self.assertEqual(self.store.read("2.txt"), "second page")
+        self.assertNotIn("torn.txt", self.store)
+        reopened = PageStore(self.directory.name)
+        self.assertEqual(sorted(reopened.names()), ["1.txt", "2.txt"])
+        self.assertEqual(reopened.read("2.txt"), "second page")
+
+    def test_open_cuts_off_torn_batch(self):
+        self.store.put("1.txt", "first page")
+        committed_size = os.path.getsize(self.store.data_path)
+        self.tear_batch()
+        reopened = PageStore(self.directory.name)
+        self.assertEqual(os.path.getsize(reopened.data_path), committed_size)
+        reopened.put("2.txt", "second page")
+        self.assertEqual(sorted(PageStore(self.directory.name).names()), ["1.txt", "2.txt"])
+
+    def test_batch_is_atomic_across_stores(self):
+        other = PageStore(self.directory.name)
+        self.store.write_batch({"1.txt": "one", "2.txt": "two"}, deleted=["3.txt"])
+        self.assertEqual(sorted(other.names()), ["1.txt", "2.txt"])
+        other.write_batch({"3.txt": "three"}, deleted=["1.txt"])
+        self.assertEqual(sorted(self.store.names()), ["2.txt", "3.txt"])
+
+    def test_compact_keeps_live_pages_only(self):
+        self.store.put("1.txt", "old version " * 100)
+        self.store.put("1.txt", "new version")
+        self.store.put("2.txt", "deleted page " * 100)
+        self.store.delete("2.txt")
+        before = self.store.stats()
+        self.assertGreater(before["garbage_ratio"], 0)
+        self.store.compact()
+        self.assertEqual(self.store.names(), ["1.txt"])
+        self.assertEqual(self.store.read("1.txt"), "new version")
+        self.assertEqual(self.store.stats()["garbage_ratio"], 0.0)
+        self.assertLess(self.store.stats()["file_bytes"], before["file_bytes"])
+
+    def test_writes_of_other_stores_after_compaction_are_kept(self):
+        other = PageStore(self.directory.name)
+        self.store.put("1.txt", "one")
+        self.store.put("1.txt", "one again")
+        self.store.compact()
+        other.put("2.txt", "two")
+        self.assertEqual(sorted(self.store.names()), ["1.txt", "2.txt"])
+        self.assertEqual(sorted(PageStore(self.directory.name).names()), ["1.txt", "2.txt"])
+        self.assertEqual(other.read("1.txt"), "one again")
+
+    def test_size_of_compressed_page_is_read_without_decompressing(self):
+        content = "d\u00e9j\u00e0 vu " * 500
+        with mock.patch("file_system.page_store.page_store_compression", True):
+            self.store.put("1.txt", content)
+        reopened = PageStore(self.directory.name)
+        with mock.patch("file_system.page_store.decompress_bytes", side_effect=AssertionError("decompressed")):
+            self.assertEqual(reopened.content_size("1.txt"), len(content.encode()))
+        self.assertEqual(reopened.read("1.txt"), content)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+# ./test/test_task_scheduler.py
+import threading
+import time
+import unittest
+from threads.task_scheduler import TaskScheduler, TaskDeadlineExceeded, PRIORITY_INTERACTIVE, PRIORITY_BULK
+
+
+class ConcurrencyProbe:
+    """A task recording how many of its calls run at once"""
+
+    def __init__(self, seconds=0.02):
+        self.seconds = seconds
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def __call__(self):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(self.seconds)
+        with self.lock:
+            self.running -= 1
+
+
+class TaskSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.schedulers = []
+        self.gate = threading.Event()
+
+    def tearDown(self):
+        self.gate.set()
+        for scheduler in self.schedulers:
+            scheduler.shutdown(timeout=5)
+
+    def create_scheduler(self, worker_count=1, bulk_worker_limit=1, api_limits=None):
+        scheduler = TaskScheduler(worker_count, bulk_worker_limit, api_limits or {})
+        self.schedulers.append(scheduler)
+        return scheduler
+
+    def test_interactive_tasks_start_before_bulk_tasks(self):
+        scheduler = self.create_scheduler()
+        started = []
+        blocker = scheduler.submit(self.gate.wait)
+        futures = [scheduler.submit(started.append, "bulk", priority=PRIORITY_BULK),
+                   scheduler.submit(started.append, "interactive 1", priority=PRIORITY_INTERACTIVE),
+                   scheduler.submit(started.append, "interactive 2", priority=PRIORITY_INTERACTIVE)]
+        self.gate.set()
+        for future in [blocker] + futures:
+            future.result(5)
+        self.assertEqual(started, ["interactive 1", "interactive 2", "bulk"])
+
+    def test_api_limit_is_respected(self):
+        scheduler = self.create_scheduler(worker_count=4, api_limits={"openai": 2})
+        probe = ConcurrencyProbe()
+        futures = [scheduler.submit(probe, api="openai") for _ in range(10)]
+        for future in futures:
+            future.result(5)
+        self.assertEqual(probe.max_running, 2)
+
+    def test_bulk_limit_leaves_threads_to_interactive_tasks(self):
+        scheduler = self.create_scheduler(worker_count=2, bulk_worker_limit=1)
+        bulk_probe = ConcurrencyProbe()
+        bulk_futures = [scheduler.submit(bulk_probe, priority=PRIORITY_BULK) for _ in range(5)]
+        interactive = scheduler.submit(lambda: "answered")
+        self.assertEqual(interactive.result(1), "answered")
+        for future in bulk_futures:
+            future.result(5)
+        self.assertEqual(bulk_probe.max_running, 1)
+
+    def test_task_waiting_for_an_api_slot_runs_once_it_frees(self):
+        scheduler = self.create_scheduler(worker_count=2, api_limits={"openai": 1})
+        blocker = scheduler.submit(self.gate.wait, api="openai")
+        waiting = scheduler.submit(lambda: "done", api="openai")
+        other_api = scheduler.submit(lambda: "other", api="confluence")
+        self.assertEqual(other_api.result(1), "other")
+        self.assertFalse(waiting.done())
+        self.gate.set()
+        blocker.result(5)
+        self.assertEqual(waiting.result(5), "done")
+
+    def test_queued_task_fails_at_its_deadline(self):
+        scheduler = self.create_scheduler()
+        blocker = scheduler.submit(self.gate.wait)
+        ran = []
+        expiring = scheduler.submit(ran.append, "late", timeout=0.05)
+        time.sleep(0.1)
+        self.gate.set()
+        blocker.result(5)
+        with self.assertRaises(TaskDeadlineExceeded):
+            expiring.result(1)
+        self.assertEqual(ran, [])
+
+    def test_task_waiting_for_an_api_slot_fails_at_its_deadline(self):
+        scheduler = self.create_scheduler(worker_count=2, api_limits={"openai": 1})
+        blocker = scheduler.submit(self.gate.wait, api="openai")
+        expiring = scheduler.submit(lambda: "late", api="openai", timeout=0.05)
+        with self.assertRaises(TaskDeadlineExceeded):
+            expiring.result(1)
+        self.gate.set()
+        blocker.result(5)
+
+    def test_cancelled_task_is_not_run(self):
+        scheduler = self.create_scheduler()
+        ran = []
+        blocker = scheduler.submit(self.gate.wait)
+        cancelled = scheduler.submit(ran.append, "cancelled")
+        after = scheduler.submit(ran.append, "after")
+        self.assertTrue(cancelled.cancel())
+        self.gate.set()
+        blocker.result(5)
+        after.result(5)
+        self.assertEqual(ran, ["after"])
+        self.assertEqual(scheduler.metrics()["pending"], {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,22 +1,29 @@
 # ./threads/dynamic_executor.py
-from concurrent.futures import ThreadPoolExecutor
-import queue
 from gpt_4t.query_from_documents_threads import get_response_from_gpt_4t
+from threads.task_scheduler import get_task_scheduler, PRIORITY_INTERACTIVE
 
 
 class DynamicExecutor:
-    def __init__(self):
-        self.executor = ThreadPoolExecutor()
-        self.futures = queue.Queue()
+    """Submits gpt-4 queries to the shared task scheduler and hands back their results as they complete"""
 
-    def add_task(self, question, context):
-        """Submit a new task to the thread pool and store the future."""
-        future = self.executor.submit(get_response_from_gpt_4t, question, context)
-        self.futures.put(future)
+    def __init__(self, scheduler=None):
+        self.scheduler = scheduler or get_task_scheduler()
+        self.futures = set()
+
+    def add_task(self, question, context, priority=PRIORITY_INTERACTIVE, timeout=None):
+        """Submit a new task to the scheduler and return its future."""
+        future = self.scheduler.submit(get_response_from_gpt_4t, question, context, priority=priority, api="openai",
+                                       timeout=timeout)
+        self.futures.add(future)
+        return future
 
     def get_next_result(self):
-        """Get the result from the next completed future."""
-        if self.futures.empty():
+        """Get the result from the first completed future."""
+        if not self.futures:
             return None  # No tasks are pending
-        future = self.futures.get()
-        return future.result()  # This will block until the future is complete
+        future = next(self.scheduler.as_completed(list(self.futures)), None)
+        if future is None:
+            self.futures.clear()  # Only cancelled tasks were pending
+            return None
+        self.futures.discard(future)
+        return future.result()
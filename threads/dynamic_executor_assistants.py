@@ -1,22 +1,53 @@
 # ./threads/dynamic_executor.py
-from concurrent.futures import ThreadPoolExecutor
-import queue
 from oai_assistants.query_assistant_from_documents import query_assistant_with_context
+from gpt_4t.chat_answer_engine import query_chat_with_context
+from configuration import interactive_task_timeout_seconds, answer_engine
+from threads.task_scheduler import get_task_scheduler, PRIORITY_INTERACTIVE
 
 
 class DynamicExecutor:
-    def __init__(self):
-        self.executor = ThreadPoolExecutor()
-        self.futures = queue.Queue()
+    """Submits questions to the configured answer engine through the shared task scheduler and hands back their results as they complete"""
 
-    def add_task(self, question, page_ids, thread_id):
-        """Submit a new task to the thread pool and store the future."""
-        future = self.executor.submit(query_assistant_with_context, question, page_ids, thread_id)
-        self.futures.put(future)
+    def __init__(self, scheduler=None):
+        self.scheduler = scheduler or get_task_scheduler()
+        self.futures = set()
+
+    def add_task(self, question, page_ids, thread_id, related_interactions=None, priority=PRIORITY_INTERACTIVE,
+                 timeout=interactive_task_timeout_seconds):
+        """
+        Submit a new task to the scheduler and return its future.
+        The thread_id is the Slack thread ts with the "chat" answer engine and the assistant thread ID otherwise.
+        """
+        query = query_chat_with_context if answer_engine == "chat" else query_assistant_with_context
+        future = self.scheduler.submit(query, question, page_ids, thread_id,
+                                       related_interactions, priority=priority, api="openai", timeout=timeout)
+        self.futures.add(future)
+        return future
+
+    def get_result(self, future):
+        """Wait for the result of a task submitted with add_task, at most until its deadline."""
+        try:
+            return self.scheduler.wait(future)
+        finally:
+            self.futures.discard(future)
 
     def get_next_result(self):
-        """Get the result from the next completed future."""
-        if self.futures.empty():
+        """Get the result from the first completed future."""
+        if not self.futures:
             return None  # No tasks are pending
-        future = self.futures.get()
-        return future.result()  # This will block until the future is complete
+        future = next(self.scheduler.as_completed(list(self.futures)), None)
+        if future is None:
+            self.futures.clear()  # Only cancelled tasks were pending
+            return None
+        self.futures.discard(future)
+        return future.result()
+
+    def shutdown(self, wait=True):
+        """Cancel the tasks of this executor that have not started, the shared scheduler keeps running."""
+        for future in list(self.futures):
+            future.cancel()
+        if wait:
+            for future in list(self.futures):
+                if not future.cancelled():
+                    future.exception()
+        self.futures.clear()
@@ -0,0 +1,241 @@
+# ./threads/task_scheduler.py
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import Future, as_completed
+from configuration import task_scheduler_worker_count, task_scheduler_bulk_worker_limit, api_concurrency_limits
+from telemetry.latency import observe
+
+# Priority classes, lower runs first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+
+class TaskDeadlineExceeded(Exception):
+    """Raised through the future of a task whose deadline passed before it could start"""
+
+
+class ScheduledTask:
+    def __init__(self, fn, args, kwargs, priority, api, deadline):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.api = api  # Name of the downstream API the task calls, limited by api_concurrency_limits
+        self.deadline = deadline  # Monotonic time after which the task is no longer worth running
+        self.submitted_at = time.monotonic()
+        self.future = Future()
+        self.future.deadline = deadline
+        self.started = False  # Taken by a worker, its deadline no longer applies
+
+
+class TaskScheduler:
+    """
+    Runs tasks on a fixed pool of threads in priority order.
+
+    Interactive tasks always start before bulk tasks, and bulk tasks never occupy more than
+    bulk_worker_limit threads so interactive work keeps finding a free thread during bulk jobs.
+    Tasks calling the same downstream API run at most api_concurrency_limits[api] at a time, a task
+    whose API is saturated waits without holding a thread. Tasks can be cancelled through their future
+    until they start, and tasks still queued at their deadline fail with TaskDeadlineExceeded.
+
+    Queued tasks are kept in a heap. A task popped while the bulk or its API limit is reached is parked
+    with the other tasks waiting for that limit, and moved back to the heap when a slot of the limit frees,
+    so picking a task never scans the tasks that cannot start. Cancelled and expired tasks are skipped
+    when they are popped.
+    """
+
+    def __init__(self, worker_count=task_scheduler_worker_count, bulk_worker_limit=task_scheduler_bulk_worker_limit,
+                 api_limits=api_concurrency_limits):
+        """
+        Initializes the scheduler and starts its worker threads.
+
+        Args:
+        worker_count (int): The number of worker threads.
+        bulk_worker_limit (int): The maximum number of threads running bulk priority tasks at once.
+        api_limits (dict): The maximum number of concurrent tasks per downstream API name.
+        """
+        self.bulk_worker_limit = bulk_worker_limit
+        self.api_limits = dict(api_limits)
+        self.pending = []  # Heap of (priority, sequence, ScheduledTask)
+        self.deferred = {}  # Limit key -> heap of the (priority, sequence, ScheduledTask) waiting for a slot of it
+        self.deadlines = []  # Heap of (deadline, sequence, ScheduledTask) of the tasks with a deadline
+        self.sequence = itertools.count()  # Keeps tasks of the same priority in submission order
+        self.running_by_api = {}
+        self.running_bulk_count = 0
+        self.condition = threading.Condition()
+        self.running = True
+        self.workers = [threading.Thread(target=self.run_worker, name=f"task-scheduler-{index}", daemon=True)
+                        for index in range(worker_count)]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, fn, *args, priority=PRIORITY_INTERACTIVE, api=None, timeout=None, **kwargs):
+        """
+        Schedule a call of fn(*args, **kwargs).
+
+        Args:
+        priority (int): PRIORITY_INTERACTIVE, PRIORITY_BULK or any other class, lower runs first.
+        api (str): The downstream API the task calls, None for no concurrency limit.
+        timeout (float): Seconds from now after which the task is dropped if it has not started.
+
+        Returns:
+        Future: Resolves to the result of the call, has a deadline attribute with the monotonic deadline or None.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        task = ScheduledTask(fn, args, kwargs, priority, api, deadline)
+        with self.condition:
+            if not self.running:
+                raise RuntimeError("The task scheduler is shut down")
+            sequence = next(self.sequence)
+            heapq.heappush(self.pending, (priority, sequence, task))
+            if deadline is not None:
+                heapq.heappush(self.deadlines, (deadline, sequence, task))
+            self.condition.notify()
+        return task.future
+
+    def blocking_limit(self, task):
+        """Get the key of the limit keeping a task from starting, None if it can start."""
+        if task.priority >= PRIORITY_BULK and self.running_bulk_count >= self.bulk_worker_limit:
+            return "bulk", None
+        limit = self.api_limits.get(task.api)
+        if limit is not None and self.running_by_api.get(task.api, 0) >= limit:
+            return "api", task.api
+        return None
+
+    def release(self, limit_key):
+        """Move the best task waiting for a freed slot of a limit back to the queue."""
+        waiting = self.deferred.get(limit_key)
+        while waiting:
+            entry = heapq.heappop(waiting)
+            if entry[2].future.done():
+                continue  # Cancelled or expired while parked
+            blocking_key = self.blocking_limit(entry[2])
+            if blocking_key is None:
+                heapq.heappush(self.pending, entry)
+                break
+            # Still waiting for another limit, parked there so this slot goes to the next task
+            heapq.heappush(self.deferred.setdefault(blocking_key, []), entry)
+        if not waiting:
+            self.deferred.pop(limit_key, None)
+
+    def expire(self, now):
+        """
+        Fail the queued tasks whose deadline passed and get the seconds until the next deadline.
+
+        Returns:
+        float: The seconds until the next deadline, None when no queued task has one.
+        """
+        while self.deadlines:
+            deadline, _, task = self.deadlines[0]
+            if task.started or task.future.done():
+                heapq.heappop(self.deadlines)
+            elif deadline <= now:
+                heapq.heappop(self.deadlines)
+                task.future.set_exception(TaskDeadlineExceeded(f"{task.fn.__name__} was not started before its deadline"))
+            else:
+                return deadline - now
+        return None
+
+    def next_task(self):
+        """Wait for the highest priority task that can start and take it."""
+        with self.condition:
+            while self.running:
+                wait_seconds = self.expire(time.monotonic())
+                while self.pending:
+                    entry = heapq.heappop(self.pending)
+                    task = entry[2]
+                    if task.future.done():
+                        continue  # Cancelled or expired
+                    blocking_key = self.blocking_limit(task)
+                    if blocking_key is not None:
+                        heapq.heappush(self.deferred.setdefault(blocking_key, []), entry)
+                        continue
+                    task.started = True
+                    self.running_by_api[task.api] = self.running_by_api.get(task.api, 0) + 1
+                    if task.priority >= PRIORITY_BULK:
+                        self.running_bulk_count += 1
+                    return task
+                self.condition.wait(wait_seconds)
+            return None
+
+    def run_worker(self):
+        while (task := self.next_task()) is not None:
+            if task.future.set_running_or_notify_cancel():
+                observe("task_queue_wait", time.monotonic() - task.submitted_at, api=task.api,
+                        priority="bulk" if task.priority >= PRIORITY_BULK else "interactive")
+                try:
+                    task.future.set_result(task.fn(*task.args, **task.kwargs))
+                except Exception as e:
+                    task.future.set_exception(e)
+            with self.condition:
+                self.running_by_api[task.api] -= 1
+                self.release(("api", task.api))
+                if task.priority >= PRIORITY_BULK:
+                    self.running_bulk_count -= 1
+                    self.release(("bulk", None))
+                self.condition.notify_all()
+
+    @staticmethod
+    def wait(future):
+        """
+        Wait for the result of a task, at most until its deadline.
+
+        Raises:
+        TimeoutError: If the task is still running at its deadline.
+        """
+        timeout = max(future.deadline - time.monotonic(), 0) if future.deadline is not None else None
+        return future.result(timeout)
+
+    @staticmethod
+    def as_completed(futures, timeout=None):
+        """Iterate over futures as they complete, cancelled ones are skipped."""
+        for future in as_completed(futures, timeout):
+            if not future.cancelled():
+                yield future
+
+    def metrics(self):
+        """
+        Get the load of the scheduler.
+
+        Returns:
+        dict: The number of pending tasks per priority and of running tasks per API.
+        """
+        with self.condition:
+            pending_by_priority = {}
+            for entries in [self.pending, *self.deferred.values()]:
+                for priority, _, task in entries:
+                    if not task.future.done():
+                        pending_by_priority[priority] = pending_by_priority.get(priority, 0) + 1
+            return {"pending": pending_by_priority,
+                    "running": {str(api): count for api, count in self.running_by_api.items() if count}}
+
+    def shutdown(self, timeout=30):
+        """Cancel the queued tasks and stop the workers once the running tasks are done."""
+        with self.condition:
+            for entries in [self.pending, *self.deferred.values()]:
+                for _, _, task in entries:
+                    task.future.cancel()
+            self.pending = []
+            self.deferred = {}
+            self.deadlines = []
+            self.running = False
+            self.condition.notify_all()
+        for worker in self.workers:
+            worker.join(timeout)
+        logging.info("Task scheduler stopped")
+
+
+task_scheduler = None
+task_scheduler_lock = threading.Lock()
+
+
+def get_task_scheduler():
+    """Get the scheduler shared by all background work in this process."""
+    global task_scheduler
+    with task_scheduler_lock:
+        if task_scheduler is None:
+            task_scheduler = TaskScheduler()
+        return task_scheduler
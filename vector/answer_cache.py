@@ -0,0 +1,120 @@
+# ./vector/answer_cache.py
+import json
+import logging
+from datetime import datetime, timedelta
+from configuration import answer_cache_collection_name
+from configuration import answer_cache_similarity_threshold, answer_cache_ttl_days
+from network.service_registry import get_chroma_client
+from database.nur_database import Session, AnswerCacheEntry, get_last_updated_timestamps
+
+
+class AnswerCache:
+    """
+    Semantic cache of answered Slack questions.
+
+    Question embeddings are indexed in a cosine Chroma collection keyed by the Slack thread ID of the question,
+    while the answer and the versions of the pages it was built from are kept in the database.
+    A cached answer is only served while every source page is unchanged and the entry is younger than the TTL.
+    """
+
+    def __init__(self, similarity_threshold=answer_cache_similarity_threshold, ttl_days=answer_cache_ttl_days):
+        """
+        Initializes the cache.
+        :param similarity_threshold: Minimum cosine similarity for a past question to count as the same question.
+        :param ttl_days: Maximum age of a cached answer in days.
+        """
+        self.similarity_threshold = similarity_threshold
+        self.ttl = timedelta(days=ttl_days)
+        self.collection = get_chroma_client().get_or_create_collection(answer_cache_collection_name,
+                                                                       metadata={"hnsw:space": "cosine"})
+
+    def lookup(self, question_embedding, candidates=3):
+        """
+        Find a valid cached answer for a question.
+        :param question_embedding: The embedding of the incoming question.
+        :param candidates: How many nearest past questions to consider.
+        :return: The matching AnswerCacheEntry and its similarity, or (None, None) if there is no valid match.
+        """
+        if self.collection.count() == 0:
+            return None, None
+        results = self.collection.query(query_embeddings=[question_embedding],
+                                        n_results=min(candidates, self.collection.count()),
+                                        include=["distances"])
+        for thread_id, distance in zip(results['ids'][0], results['distances'][0]):
+            similarity = 1 - distance
+            if similarity < self.similarity_threshold:
+                break  # Results are sorted by distance, the remaining candidates are further away
+            entry = self.get_valid_entry(thread_id)
+            if entry:
+                logging.info(f"Answer cache hit for thread {thread_id} with similarity {similarity:.3f}")
+                return entry, similarity
+        return None, None
+
+    def get_valid_entry(self, thread_id):
+        """
+        Load a cache entry and check it is still valid, invalidating it otherwise.
+        :param thread_id:
+        :return: The AnswerCacheEntry or None if it is missing or stale.
+        """
+        session = Session()
+        entry = session.query(AnswerCacheEntry).filter_by(thread_id=thread_id).first()
+        session.close()
+        if entry is None:
+            self.collection.delete(ids=[thread_id])
+            return None
+        if entry.created_at < datetime.now() - self.ttl:
+            logging.info(f"Cached answer for thread {thread_id} expired")
+            self.invalidate(thread_id)
+            return None
+        page_versions = json.loads(entry.page_versions or "{}")
+        current_versions = get_last_updated_timestamps(list(page_versions.keys()))
+        for page_id, version in page_versions.items():
+            current_version = current_versions[page_id]
+            if (current_version.isoformat() if current_version else None) != version:
+                logging.info(f"Cached answer for thread {thread_id} invalidated, page {page_id} changed")
+                self.invalidate(thread_id)
+                return None
+        return entry
+
+    def store(self, thread_id, channel_id, question, answer, question_embedding, page_ids):
+        """
+        Add a freshly produced answer to the cache.
+        Answers built from no pages are not cached, no page change could ever invalidate them.
+        :param thread_id: Slack ts of the question, used as the cache key.
+        :param channel_id:
+        :param question:
+        :param answer:
+        :param question_embedding: The embedding of the question.
+        :param page_ids: The IDs of the pages the answer was built from.
+        :return: None
+        """
+        if not page_ids:
+            logging.info(f"Answer for thread {thread_id} not cached, it was built from no pages")
+            return
+        page_versions = {page_id: last_updated.isoformat() if last_updated else None
+                         for page_id, last_updated in get_last_updated_timestamps(page_ids).items()}
+        session = Session()
+        entry = session.query(AnswerCacheEntry).filter_by(thread_id=thread_id).first()
+        if entry is None:
+            entry = AnswerCacheEntry(thread_id=thread_id)
+            session.add(entry)
+        entry.channel_id = channel_id
+        entry.question_text = question
+        entry.answer_text = answer
+        entry.page_versions = json.dumps(page_versions)
+        entry.created_at = datetime.now()
+        session.commit()
+        session.close()
+        self.collection.upsert(ids=[thread_id], embeddings=[question_embedding])
+
+    def invalidate(self, thread_id):
+        """
+        Remove an entry from the cache.
+        :param thread_id:
+        :return: None
+        """
+        session = Session()
+        session.query(AnswerCacheEntry).filter_by(thread_id=thread_id).delete()
+        session.commit()
+        session.close()
+        self.collection.delete(ids=[thread_id])
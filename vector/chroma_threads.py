@@ -1,27 +1,37 @@
 # ./vector/chroma_threads.py
-from langchain.embeddings.openai import OpenAIEmbeddings
-from langchain_community.vectorstores import Chroma
 from configuration import vector_folder_path, file_system_path, embedding_model_id
 from database.nur_database import get_page_data_from_db
 from database.nur_database import update_embed_date
-import openai
 from credentials import oai_api_key
 from file_system.file_manager import FileManager
-import chromadb
 import logging
-from typing import List
-from configuration import document_count
-
-
-client = openai.OpenAI(api_key=oai_api_key)
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+from configuration import document_count, rerank_enabled, rerank_candidate_count, rerank_score_cutoff, rerank_score_gap
+from configuration import retrieval_recency_boost, retrieval_recency_half_life_days
+from network.service_registry import get_openai_client, get_chroma_client
+from telemetry.structured_logging import log_payload
+from vector.document_selection import select_documents
+from vector.reranker import rerank
+from telemetry.latency import span
 
 
 def embed_text(text, model):
-    response = client.embeddings.create(input=text, model=model)
+    response = get_openai_client().embeddings.create(input=text, model=model)
     embedding = response.data[0].embedding
     return embedding
 
 
+def embed_texts(texts, model):
+    """
+    Embeds several texts with a single API request.
+    Returns the embeddings in the same order as the texts.
+    """
+    response = get_openai_client().embeddings.create(input=texts, model=model)
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
 def generate_embedding(page_id, model=embedding_model_id):
     """
     Generates an embedding for the given text using the specified OpenAI model.
@@ -37,7 +47,7 @@ def generate_embedding(page_id, model=embedding_model_id):
         return None, f"Error reading page content: {e}"
 
     try:
-        response = client.embeddings.create(input=page_content, model=model)
+        response = get_openai_client().embeddings.create(input=page_content, model=model)
         # Extract the embedding correctly from the response object
         if response.data and len(response.data) > 0:
             embedding = response.data[0].embedding
@@ -58,6 +68,10 @@ def vectorize_documents(all_documents, page_ids):
     :return: page ids of the vectorized documents
     """
 
+    # langchain is only imported by the code paths using it, it is slow to import
+    from langchain.embeddings.openai import OpenAIEmbeddings
+    from langchain_community.vectorstores import Chroma
+
     # Initialize OpenAI embeddings with the API key
     embedding = OpenAIEmbeddings(openai_api_key=oai_api_key, model=embedding_model_id)
 
@@ -89,56 +103,140 @@ def add_to_vector():
 
     # Check if the lists are empty
     if not all_documents or not page_ids:
-        print("No new or updated documents to vectorize.")
+        logging.info("No new or updated documents to vectorize.")
         return []
 
     vectorize_documents(all_documents, page_ids)
-    print(f'Vectorized {len(all_documents)} documents.')
-    print(f'Vectorized page ids: {page_ids}')
+    logging.info(f'Vectorized {len(all_documents)} documents.')
+    log_payload('Vectorized page ids', page_ids=page_ids)
     return page_ids
 
 
-def retrieve_relevant_documents(question: str) -> List[str]:
+def distance_to_similarity(distance, space):
     """
-    Retrieve the most relevant documents for a given question using ChromaDB.
+    Convert a Chroma distance to a cosine similarity.
 
     Args:
-    question (str): The question to retrieve relevant documents for.
+    distance (float): The distance returned by the query.
+    space (str): The distance function of the collection, "l2", "cosine" or "ip".
 
     Returns:
-    List[str]: A list of document IDs of the most relevant documents.
+    float: The cosine similarity, assuming normalized embeddings as returned by OpenAI.
     """
+    if space == "l2":
+        # Chroma returns the squared euclidean distance, which is 2 - 2 * cosine for normalized vectors
+        return 1 - distance / 2
+    return 1 - distance
 
-    # Generate the query embedding using OpenAI
-    query_embedding = embed_text(text=question, model=embedding_model_id)
 
-    # Initialize the ChromaDB client
-    client = chromadb.PersistentClient(path=vector_folder_path)
+def epoch_seconds(moment: datetime) -> int:
+    """Convert a datetime to the epoch seconds pages are indexed with, naive datetimes are in UTC."""
+    return int(moment.replace(tzinfo=moment.tzinfo or timezone.utc).timestamp())
 
-    collections = client.list_collections()
 
-    # Assuming you have a collection named 'documents' in your ChromaDB
-    collection = client.get_collection('TopAssist')
+def build_metadata_filter(space_keys: List[str] = None, updated_after: datetime = None, authors: List[str] = None,
+                          title: str = None) -> Optional[dict]:
+    """
+    Build the Chroma filter restricting a search to pages matching the given metadata.
+
+    Args:
+    space_keys (List[str], optional): The spaces of the pages.
+    updated_after (datetime, optional): The earliest last update of the pages.
+    authors (List[str], optional): The authors of the pages.
+    title (str, optional): The exact title of the page.
 
-    count_result = collection.count()
+    Returns:
+    dict: The where filter, None when nothing is filtered.
+    """
+    conditions = []
+    if space_keys:
+        conditions.append({"space_key": {"$in": list(space_keys)}})
+    if updated_after is not None:
+        conditions.append({"last_updated": {"$gte": epoch_seconds(updated_after)}})
+    if authors:
+        conditions.append({"author": {"$in": list(authors)}})
+    if title:
+        conditions.append({"title": title})
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+def recency_boost(metadata, now, boost=retrieval_recency_boost, half_life_days=retrieval_recency_half_life_days):
+    last_updated = (metadata or {}).get("last_updated")
+    if not boost or last_updated is None:
+        return 0.0
+    return boost * 0.5 ** (max(now - last_updated, 0) / 86400 / half_life_days)
+
+
+def query_similar_documents(query_embedding: List[float], n_results: int = document_count,
+                            where: dict = None) -> List[tuple]:
+    """
+    Find the documents most similar to an embedding.
+    Recently updated pages get a small boost, see retrieval_recency_boost.
 
-    print()
+    Args:
+    query_embedding (List[float]): The embedding of the question.
+    n_results (int): The maximum number of documents.
+    where (dict, optional): A metadata filter from build_metadata_filter, applied by Chroma during the search.
 
-    # Perform a similarity search in the collection
+    Returns:
+    List[tuple]: The (page ID, score) of the documents, best first. The score is the cosine similarity and boost.
+    """
+    collection = get_chroma_client().get_collection('TopAssist')
+    space = (collection.metadata or {}).get("hnsw:space", "l2")
     similar_items = collection.query(
         query_embeddings=[query_embedding],
-        n_results=document_count
+        n_results=n_results,
+        where=where,
+        include=["distances", "metadatas"]
     )
+    if not similar_items.get('ids'):
+        logging.warning("No 'ids' key found in similar_items")
+        return []
+    now = time.time()
+    scored_documents = [(document_id, distance_to_similarity(distance, space) + recency_boost(metadata, now))
+                        for document_id, distance, metadata in zip(similar_items['ids'][0],
+                                                                   similar_items['distances'][0],
+                                                                   similar_items['metadatas'][0])]
+    return sorted(scored_documents, key=lambda document: document[1], reverse=True)
 
-    # Extract and return the document IDs from the metadata of similar items
-    #document_ids = [item['metadata']['page_id'] for item in similar_items['results'] if'metadata' in item and 'page_id' in item['metadata']]
-    if 'ids' in similar_items:
-        document_ids = [id for sublist in similar_items['ids'] for id in sublist]
-    else:
-        print("No 'ids' key found in similar_items")
-        document_ids = []
 
-    return document_ids
+def retrieve_relevant_documents(question: str, query_embedding: List[float] = None, space_keys: List[str] = None,
+                                updated_after: datetime = None, authors: List[str] = None) -> List[str]:
+    """
+    Retrieve the most relevant documents for a given question using ChromaDB.
+    With rerank_enabled, rerank_candidate_count candidates are retrieved and reranked, otherwise document_count.
+    select_documents then keeps at most document_count of them, as many as their scores justify, with the
+    thresholds of blended scores when they were reranked.
+
+    Args:
+    question (str): The question to retrieve relevant documents for.
+    query_embedding (List[float], optional): A precomputed embedding of the question, avoids embedding it again.
+    space_keys (List[str], optional): Only search the pages of these spaces.
+    updated_after (datetime, optional): Only search the pages updated since then.
+    authors (List[str], optional): Only search the pages of these authors.
+
+    Returns:
+    List[str]: A list of document IDs of the most relevant documents.
+    """
+
+    # Generate the query embedding using OpenAI
+    if query_embedding is None:
+        query_embedding = embed_text(text=question, model=embedding_model_id)
+
+    where = build_metadata_filter(space_keys, updated_after, authors)
+    n_results = max(rerank_candidate_count, document_count) if rerank_enabled else document_count
+    candidates = query_similar_documents(query_embedding, n_results, where)
+    if not candidates and where is not None:
+        # Pages indexed before their metadata was cannot match a filter until add_embeds_to_vector_db runs again
+        logging.warning(f"No page matches the filter {where}, searching every page")
+        candidates = query_similar_documents(query_embedding, n_results)
+    if not rerank_enabled:
+        return select_documents(candidates)
+    with span("rerank"):
+        scored_documents = rerank(question, candidates)
+    return select_documents(scored_documents, similarity_cutoff=rerank_score_cutoff, score_gap=rerank_score_gap)
 
 
 def retrieve_relevant_documents_langchain(question):
@@ -147,6 +245,10 @@ def retrieve_relevant_documents_langchain(question):
     :param question:
     :return: document ids
     """
+    # langchain is only imported by the code paths using it, it is slow to import
+    from langchain.embeddings.openai import OpenAIEmbeddings
+    from langchain_community.vectorstores import Chroma
+
     # Initialize OpenAI embeddings with the API key
     embedding = OpenAIEmbeddings(openai_api_key=oai_api_key, model=embedding_model_id)
 
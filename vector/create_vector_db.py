@@ -1,61 +1,91 @@
 # chroma_module.py
-from configuration import vector_folder_path
-import chromadb
-from database.nur_database import get_all_page_data_from_db
 import json
+import logging
+from database.nur_database import iter_page_embeddings
 from confluence_integration.extract_page_content_and_store_processor import embed_pages_missing_embeds
+from network.service_registry import get_chroma_client
+from vector.chroma_threads import epoch_seconds
 
-# Initialize the Chroma PersistentClient for disk persistence
-client = chromadb.PersistentClient(path=vector_folder_path)
 
+def build_page_metadata(page_id, space_key, title, author, last_updated):
+    """
+    Build the metadata a page embedding is indexed with, so searches can be filtered on it.
+    Chroma metadata values cannot be None, missing values are left out.
+
+    Args:
+    page_id (str): The ID of the page.
+    space_key (str): The key of the space of the page.
+    title (str): The title of the page.
+    author (str): The author of the page.
+    last_updated (datetime): The last update of the page, stored as epoch seconds to allow range filters.
+
+    Returns:
+    dict: The metadata.
+    """
+    metadata = {"page_id": page_id, "space_key": space_key, "title": title, "author": author}
+    if last_updated is not None:
+        metadata["last_updated"] = epoch_seconds(last_updated)
+    return {key: value for key, value in metadata.items() if value is not None}
 
-def add_to_vector(collection_name):
+
+def add_to_vector(collection_name, page_ids=None, batch_size=500):
     """
-    Retrieves all page data from the database, uses the stored embeddings, and adds them to the vector store.
+    Retrieves the page embeddings stored in the database and adds them to the vector store with their metadata.
+    Pages already in the collection are updated.
+
+    A new collection is created with the cosine distance. The distance of an existing collection is kept, Chroma
+    fixes it when the index is created, so switching an older l2 collection to cosine means deleting the
+    collection and adding the pages again.
 
     Args:
         collection_name (str): The name of the collection to store embeddings.
+        page_ids (list): Only these pages, every embedded page when None.
+        batch_size (int): The number of pages added per request.
+
+    Returns:
+        int: The number of pages added or updated.
     """
-    # Retrieve all documents, their corresponding IDs, and embeddings
-    page_ids, _, embeddings = get_all_page_data_from_db()
-
-    embeddings_deserialized = []
-    for i, embed in enumerate(embeddings):
-        if embed is None:
-            print(f"Skipping embedding at index {i}: Embed is None")
-            embeddings_deserialized.append(None)
-            continue
-
-        try:
-            # Deserialize the JSON string into a Python list
-            deserialized_embed = json.loads(embed)
-            embeddings_deserialized.append(deserialized_embed)
-        except (json.JSONDecodeError, TypeError) as e:
-            # Handle the exception if JSON deserialization fails
-            print(f"Failed to deserialize embedding at index {i}: {e}")
-            embeddings_deserialized.append(None)
-
-        # Print progress update after every 10 embeddings for example
-        if i % 10 == 0:
-            print(f"Processed {i + 1}/{len(embeddings)} embeddings.")
-
-    # At the end, you could print a final statement indicating completion
-    print("Completed deserializing all embeddings.")
-    # Create a map of page IDs to embeddings
-    page_embed_map = dict(zip(page_ids, embeddings_deserialized))
-
-
-def add_embeds_to_vector_db():
+    # get_or_create_collection would overwrite the metadata of an existing collection with cosine while its
+    # index keeps the distance it was created with, and scores are converted according to that metadata
+    try:
+        collection = get_chroma_client().get_collection(collection_name)
+    except Exception:
+        collection = get_chroma_client().create_collection(collection_name, metadata={"hnsw:space": "cosine"})
+    else:
+        space = (collection.metadata or {}).get("hnsw:space", "l2")
+        if space != "cosine":
+            logging.warning(f"Collection {collection_name} uses the {space} distance, delete it and add the pages "
+                            f"again to switch it to cosine")
+    added_count = 0
+    for records in iter_page_embeddings(page_ids, batch_size):
+        ids, embeddings, metadatas = [], [], []
+        for page_id, space_key, title, author, last_updated, embed in records:
+            try:
+                # Deserialize the JSON string into a Python list
+                embeddings.append(json.loads(embed))
+            except (json.JSONDecodeError, TypeError) as e:
+                logging.warning(f"Failed to deserialize the embedding of page {page_id}: {e}")
+                continue
+            ids.append(page_id)
+            metadatas.append(build_page_metadata(page_id, space_key, title, author, last_updated))
+        if ids:
+            collection.upsert(ids=ids, embeddings=embeddings, metadatas=metadatas)
+            added_count += len(ids)
+            logging.info(f"Added {added_count} page embeddings to {collection_name}")
+    return added_count
+
+
+def add_embeds_to_vector_db(page_ids=None):
     # Specify your collection name here
     collection_name = "TopAssist"
-    add_to_vector(collection_name)
-    print(f"Embeddings added to {collection_name} collection.")
+    added_count = add_to_vector(collection_name, page_ids)
+    print(f"{added_count} embeddings added to {collection_name} collection.")
 
 
 if __name__ == '__main__':
     embed_pages_missing_embeds()
     add_embeds_to_vector_db()
     # initiate the collection and peek at the embeddings
-    collection = client.get_collection("TopAssist")
+    collection = get_chroma_client().get_collection("TopAssist")
     print(collection.peek())
     print(collection.count())
@@ -0,0 +1,68 @@
+# ./vector/document_selection.py
+import logging
+from configuration import document_count, document_count_min, document_similarity_cutoff
+from configuration import document_score_gap, document_token_budget
+from file_system.file_manager import FileManager
+from telemetry.structured_logging import log_event
+
+# Picks how many of the retrieved documents a question is answered from.
+# Documents are taken most similar first and the selection stops at the first one that is not similar enough,
+# that is much less similar than the previous one, or whose page would exceed the token budget of the context.
+# A question matching a few pages well is answered from those only, a vaguer one gets up to document_count pages.
+
+# Rough number of characters per token of English text, used to estimate the tokens of a page from its size
+CHARS_PER_TOKEN = 4
+
+
+def estimate_page_tokens(page_id, file_manager):
+    size = file_manager.size(f"{page_id}.txt")
+    return (size or 0) // CHARS_PER_TOKEN
+
+
+def select_documents(scored_documents, min_count=document_count_min, max_count=document_count,
+                     similarity_cutoff=document_similarity_cutoff, score_gap=document_score_gap,
+                     token_budget=document_token_budget, page_tokens=None):
+    """
+    Select the documents a question is answered from.
+
+    Args:
+    scored_documents (list of tuple): The (page ID, similarity) of the retrieved documents, most similar first.
+    min_count (int): The number of documents kept whatever their scores, within the token budget.
+    max_count (int): The maximum number of documents.
+    similarity_cutoff (float): The minimum similarity of the documents after the first min_count.
+    score_gap (float): The maximum drop in similarity from a document to the next one after the first min_count.
+    token_budget (int): The maximum estimated tokens of the selected pages, the first page is always kept.
+    page_tokens (callable): Estimates the tokens of a page from its ID, from the size of the stored page by default.
+
+    Returns:
+    list: The IDs of the selected documents, most similar first.
+    """
+    if page_tokens is None:
+        file_manager = FileManager()
+        page_tokens = lambda page_id: estimate_page_tokens(page_id, file_manager)
+    selected = []
+    used_tokens = 0
+    previous_score = None
+    reason = "candidates"
+    for page_id, score in scored_documents:
+        if len(selected) >= max_count:
+            reason = "max_count"
+            break
+        if len(selected) >= min_count:
+            if score < similarity_cutoff:
+                reason = "similarity_cutoff"
+                break
+            if previous_score is not None and previous_score - score > score_gap:
+                reason = "score_gap"
+                break
+        tokens = page_tokens(page_id)
+        if selected and used_tokens + tokens > token_budget:
+            reason = "token_budget"
+            break
+        selected.append(page_id)
+        used_tokens += tokens
+        previous_score = score
+    log_event(logging.INFO, "Documents selected", selected=len(selected), candidates=len(scored_documents),
+              reason=reason, tokens=used_tokens,
+              scores=[round(score, 3) for _, score in scored_documents[:len(selected) + 1]])
+    return selected
@@ -0,0 +1,127 @@
+# ./vector/qa_interaction_index.py
+import logging
+from configuration import embedding_model_id, qa_interaction_collection_name
+from configuration import related_interaction_count, related_interaction_min_similarity
+from network.service_registry import get_chroma_client
+from database.nur_database import Session, QAInteractionManager
+from vector.chroma_threads import embed_texts
+
+
+class QAInteractionIndex:
+    """
+    Vector index over the question and answer text of Slack Q&A interactions.
+
+    The index is maintained incrementally: new interactions are added as they are answered and
+    sync() only embeds interactions that are not indexed yet, so it can be re-run at any time.
+    """
+
+    def __init__(self):
+        """
+        Initializes the index on the persistent Chroma collection.
+        """
+        self.collection = get_chroma_client().get_or_create_collection(qa_interaction_collection_name,
+                                                                       metadata={"hnsw:space": "cosine"})
+
+    @staticmethod
+    def format_document(interaction):
+        """
+        Format an interaction as the text that is embedded.
+        :param interaction: A QAInteractions object.
+        :return: The question and answer text, truncated to the embedding input limit.
+        """
+        return f"Question: {interaction.question_text}\nAnswer: {interaction.answer_text}"[:8190]
+
+    def add_interactions(self, interactions):
+        """
+        Embed and index interactions, replacing any previous version of them.
+        :param interactions: A list of QAInteractions objects.
+        :return: The number of indexed interactions.
+        """
+        interactions = [interaction for interaction in interactions if interaction.question_text]
+        if not interactions:
+            return 0
+        embeddings = embed_texts([self.format_document(interaction) for interaction in interactions],
+                                 embedding_model_id)
+        self.collection.upsert(
+            ids=[str(interaction.interaction_id) for interaction in interactions],
+            embeddings=embeddings,
+            metadatas=[{"thread_id": interaction.thread_id or "", "channel_id": interaction.channel_id or ""}
+                       for interaction in interactions]
+        )
+        return len(interactions)
+
+    def add_interaction(self, interaction):
+        """
+        Index a single interaction, used right after a question is answered.
+        :param interaction: A QAInteractions object.
+        :return: None
+        """
+        self.add_interactions([interaction])
+
+    def sync(self, batch_size=100):
+        """
+        Index every interaction in the database that is not in the index yet.
+        :param batch_size: The number of interactions read and embedded per request.
+        :return: The number of newly indexed interactions.
+        """
+        session = Session()
+        interaction_manager = QAInteractionManager(session)
+        indexed_count = 0
+        batch = []
+        for interaction in interaction_manager.iter_interactions(batch_size=batch_size):
+            batch.append(interaction)
+            if len(batch) == batch_size:
+                indexed_count += self.add_missing(batch)
+                batch = []
+        indexed_count += self.add_missing(batch)
+        session.close()
+        logging.info(f"Indexed {indexed_count} new Q&A interactions, {self.collection.count()} in the index")
+        return indexed_count
+
+    def add_missing(self, interactions):
+        """
+        Index the interactions of a batch that are not in the index yet.
+        :param interactions: A list of QAInteractions objects.
+        :return: The number of newly indexed interactions.
+        """
+        if not interactions:
+            return 0
+        existing_ids = set(self.collection.get(ids=[str(interaction.interaction_id) for interaction in interactions],
+                                               include=[])['ids'])
+        return self.add_interactions([interaction for interaction in interactions
+                                      if str(interaction.interaction_id) not in existing_ids])
+
+    def find_related(self, question_embedding, n_results=related_interaction_count,
+                     min_similarity=related_interaction_min_similarity):
+        """
+        Find previously answered interactions related to a question.
+        :param question_embedding: The embedding of the question.
+        :param n_results: The maximum number of interactions to return.
+        :param min_similarity: The minimum cosine similarity of a returned interaction.
+        :return: A list of dictionaries with the question, answer, thread ID and similarity, most similar first.
+        """
+        count = self.collection.count()
+        if count == 0 or n_results <= 0:
+            return []
+        results = self.collection.query(query_embeddings=[question_embedding],
+                                        n_results=min(n_results, count),
+                                        include=["distances"])
+        similarities = {int(interaction_id): 1 - distance
+                        for interaction_id, distance in zip(results['ids'][0], results['distances'][0])
+                        if 1 - distance >= min_similarity}
+        if not similarities:
+            return []
+        session = Session()
+        interactions = QAInteractionManager(session).get_interactions_by_ids(list(similarities.keys()))
+        related = [{
+            "thread_id": interactions[interaction_id].thread_id,
+            "question": interactions[interaction_id].question_text,
+            "answer": interactions[interaction_id].answer_text,
+            "similarity": similarity
+        } for interaction_id, similarity in similarities.items() if interaction_id in interactions]
+        session.close()
+        return sorted(related, key=lambda item: item["similarity"], reverse=True)
+
+
+if __name__ == '__main__':
+    QAInteractionIndex().sync()
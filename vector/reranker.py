@@ -0,0 +1,197 @@
+# ./vector/reranker.py
+import logging
+import math
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from configuration import rerank_weight, rerank_latency_budget_seconds, rerank_cross_encoder_model
+from configuration import rerank_feature_cache_size, rerank_max_chars
+from file_system.file_manager import FileManager
+from telemetry.structured_logging import log_event
+
+# Second stage of retrieval: the candidates over-fetched from the vector store are reordered by how well the
+# pages match the question, before the best few are selected for the context.
+# The default reranker is lexical, BM25 over the title and content terms of the pages, whose term counts are
+# cached per page. A local cross-encoder is used instead when sentence-transformers is installed and
+# rerank_cross_encoder_model is set, on CPU. The rerank score is blended with the vector similarity, the
+# documents are then selected with the thresholds set for blended scores, rerank_score_cutoff and rerank_score_gap.
+
+try:
+    from sentence_transformers import CrossEncoder
+except ImportError:
+    CrossEncoder = None
+
+TERM_PATTERN = re.compile(r"[a-z0-9]+")
+STOP_WORDS = frozenset("a an and are as at be by can do does for from how i in is it of on or our the this to "
+                       "was we what when where which who why will with you".split())
+TITLE_WEIGHT = 2  # A title term counts as this many content terms
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text):
+    return [term for term in TERM_PATTERN.findall(text.lower()) if term not in STOP_WORDS]
+
+
+def split_page(content):
+    """Get the title and the text of a stored page."""
+    title = content.split('title: ')[1].split('\n')[0].strip() if 'title: ' in content else ""
+    return title, content
+
+
+class PageFeatures:
+    """Term counts of a page, as used by the lexical reranker"""
+
+    def __init__(self, version, content):
+        self.version = version  # FileManager.version of the page the features were built from
+        title, text = split_page(content)
+        self.term_counts = Counter(tokenize(text))
+        for term in tokenize(title):
+            self.term_counts[term] += TITLE_WEIGHT
+        self.length = sum(self.term_counts.values())
+        self.text = text[:rerank_max_chars]
+
+
+class PageFeatureCache:
+    """
+    Least recently used cache of page features.
+    An entry is rebuilt when its page was written again, which the file manager tells without reading the page.
+    """
+
+    def __init__(self, capacity=rerank_feature_cache_size):
+        self.capacity = capacity
+        self.entries = OrderedDict()  # page ID -> PageFeatures
+        self.lock = threading.Lock()
+        self.file_manager = FileManager()
+
+    def get(self, page_id):
+        """Get the features of a page, None if the page is not stored."""
+        version = self.file_manager.version(f"{page_id}.txt")
+        if version is None:
+            return None
+        with self.lock:
+            features = self.entries.get(page_id)
+            if features is not None and features.version == version:
+                self.entries.move_to_end(page_id)
+                return features
+        features = PageFeatures(version, self.file_manager.read(f"{page_id}.txt"))
+        with self.lock:
+            self.entries[page_id] = features
+            if len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+        return features
+
+
+class LexicalReranker:
+    """BM25 of the question terms in the candidate pages, the document frequencies are taken over the candidates"""
+
+    name = "lexical"
+
+    def score(self, question, features):
+        """
+        Score the candidate pages.
+
+        Args:
+        question (str): The question.
+        features (list of PageFeatures): The features of the candidates.
+
+        Returns:
+        list of float: The score of every candidate between 0 and 1, relative to the best candidate.
+        """
+        question_terms = set(tokenize(question))
+        if not question_terms or not features:
+            return [0.0] * len(features)
+        average_length = sum(page.length for page in features) / len(features) or 1
+        idf = {}
+        for term in question_terms:
+            document_frequency = sum(1 for page in features if term in page.term_counts)
+            idf[term] = math.log(1 + (len(features) - document_frequency + 0.5) / (document_frequency + 0.5))
+        scores = []
+        for page in features:
+            score = 0.0
+            length_norm = BM25_K1 * (1 - BM25_B + BM25_B * page.length / average_length)
+            for term in question_terms:
+                count = page.term_counts.get(term, 0)
+                if count:
+                    score += idf[term] * count * (BM25_K1 + 1) / (count + length_norm)
+            scores.append(score)
+        best = max(scores)
+        return [score / best if best else 0.0 for score in scores]
+
+
+class CrossEncoderReranker:
+    """A local cross-encoder scoring the question against the beginning of every page, on CPU"""
+
+    name = "cross_encoder"
+
+    def __init__(self, model_name):
+        self.model = CrossEncoder(model_name, device="cpu")
+
+    def score(self, question, features):
+        if not features:
+            return []
+        logits = self.model.predict([(question, page.text) for page in features])
+        return [1 / (1 + math.exp(-float(logit))) for logit in logits]
+
+
+reranker = None
+feature_cache = None
+reranker_lock = threading.Lock()
+
+
+def get_reranker():
+    """Get the reranker and the page feature cache shared by this process."""
+    global reranker, feature_cache
+    with reranker_lock:
+        if reranker is None:
+            if CrossEncoder is not None and rerank_cross_encoder_model:
+                reranker = CrossEncoderReranker(rerank_cross_encoder_model)
+            else:
+                if rerank_cross_encoder_model:
+                    logging.warning("sentence-transformers is not installed, reranking with lexical features")
+                reranker = LexicalReranker()
+            feature_cache = PageFeatureCache()
+        return reranker, feature_cache
+
+
+def rerank(question, scored_documents, weight=rerank_weight, latency_budget_seconds=rerank_latency_budget_seconds):
+    """
+    Reorder retrieved documents by how well they match the question.
+
+    The features of the candidates are gathered most similar first until the latency budget is spent.
+    The candidates left, and those whose page is not stored, are scored as if they matched nothing, so every
+    score is on the same blended scale.
+
+    Args:
+    question (str): The question.
+    scored_documents (list of tuple): The (page ID, similarity) of the candidates, most similar first.
+    weight (float): The weight of the rerank score in the final score, the rest is the vector similarity.
+    latency_budget_seconds (float): The time the feature gathering may take.
+
+    Returns:
+    list of tuple: The (page ID, final score) of the candidates, best first.
+    """
+    started_at = time.perf_counter()
+    deadline = started_at + latency_budget_seconds
+    model, cache = get_reranker()
+    gathered = []  # (page ID, similarity, features)
+    remaining = []
+    for index, (page_id, similarity) in enumerate(scored_documents):
+        if time.perf_counter() > deadline:
+            remaining.extend(scored_documents[index:])
+            break
+        features = cache.get(page_id)
+        if features is None:
+            remaining.append((page_id, similarity))
+        else:
+            gathered.append((page_id, similarity, features))
+    rerank_scores = model.score(question, [features for _, _, features in gathered])
+    scored_documents = [(page_id, (1 - weight) * similarity + weight * rerank_score)
+                        for (page_id, similarity, _), rerank_score in zip(gathered, rerank_scores)]
+    scored_documents += [(page_id, (1 - weight) * similarity) for page_id, similarity in remaining]
+    scored_documents.sort(key=lambda document: document[1], reverse=True)
+    log_event(logging.INFO, "Documents reranked", reranker=model.name, reranked=len(gathered),
+              skipped=len(remaining), seconds=round(time.perf_counter() - started_at, 4),
+              top=[page_id for page_id, _ in scored_documents[:5]])
+    return scored_documents